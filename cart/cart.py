@@ -1,4 +1,8 @@
-from store.models import Product, Profile
+import json
+
+from store.models import Product
+from .persistence import schedule_save
+from .pricing import is_international_product, price_cart
 
 class Cart():
     def __init__(self, request):
@@ -13,12 +17,26 @@ class Cart():
 
         self.cart = cart
 
+    @staticmethod
+    def item_count(session):
+        """Cantidad de productos distintos, leída de la sesión sin construir el carrito"""
+        count = session.get('cart_count')
+        if count is None:
+            count = len(session.get('session_key') or {})
+        return count
+
+    def _touch(self):
+        """Marca la sesión como modificada, actualiza el conteo del navbar y agenda el guardado en el perfil"""
+        self.session['cart_count'] = len(self.cart)
+        self.session.modified = True
+        schedule_save(self.request)
+
     def add(self, product, quantity):
         product_id = str(product.id)
         product_quantity = int(quantity)
         
         # Determinar si es internacional
-        is_international = product.stock <= 0 and product.stock_international > 0
+        is_international = is_international_product(product)
         
         if product_id in self.cart:
             # Si ya existe, actualizar cantidad e info internacional
@@ -38,61 +56,39 @@ class Cart():
                 'is_international': is_international
             }
 
-        self.session.modified = True
-
-        # Log in user
-        if self.request.user.is_authenticated:
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("'", '"')
-            current_user.update(old_cart=carty)
-
-    def db_add(self, product_id, quantity):
-        product_id = str(product_id)
-        product_quantity = int(quantity)
-        
-        # Buscar el producto para determinar si es internacional
-        try:
-            product = Product.objects.get(id=product_id)
-            is_international = product.stock <= 0 and product.stock_international > 0
-        except Product.DoesNotExist:
-            is_international = False
-        
-        if product_id in self.cart:
-            if isinstance(self.cart[product_id], dict):
-                self.cart[product_id]['quantity'] = product_quantity
-                self.cart[product_id]['is_international'] = is_international
-            else:
-                self.cart[product_id] = {
-                    'quantity': product_quantity,
-                    'is_international': is_international
-                }
-        else:
-            self.cart[product_id] = {
-                'quantity': product_quantity,
-                'is_international': is_international
+        self._touch()
+
+    def restore(self, saved_items):
+        """Restaura el carrito guardado en el perfil con una sola consulta de productos"""
+        products = Product.objects.in_bulk([int(product_id) for product_id in saved_items if str(product_id).isdigit()])
+        for product_id, value in saved_items.items():
+            product = products.get(int(product_id)) if str(product_id).isdigit() else None
+            if product is None:
+                continue
+            quantity = value['quantity'] if isinstance(value, dict) else value
+            self.cart[str(product.id)] = {
+                'quantity': int(quantity),
+                'is_international': is_international_product(product),
             }
 
-        self.session.modified = True
-
-        # Log in user
-        if self.request.user.is_authenticated:
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("'", '"')
-            current_user.update(old_cart=str(carty))
+        self._touch()
 
     def __len__(self):
         return len(self.cart)
     
-    def get_products(self):
-        # Get ids from cart
-        product_ids = self.cart.keys()
+    def snapshot(self):
+        """Snapshot con precios del carrito, calculado una vez por request mientras el carrito no cambie"""
+        state = json.dumps(self.cart, sort_keys=True)
+        cached = getattr(self.request, '_cart_snapshot', None)
+        if cached is not None and cached[0] == state:
+            return cached[1]
 
-        # Use ids to look in DB
-        products = Product.objects.filter(id__in=product_ids)
+        snapshot = price_cart(self.cart)
+        self.request._cart_snapshot = (state, snapshot)
+        return snapshot
 
-        return products
+    def get_products(self):
+        return self.snapshot().products
 
     def get_quants(self):
         """Retorna cantidades en formato compatible"""
@@ -107,22 +103,11 @@ class Cart():
     
     def get_international_status(self):
         """Retorna qué productos son internacionales"""
-        international_status = {}
-        for product_id, value in self.cart.items():
-            if isinstance(value, dict):
-                international_status[product_id] = value.get('is_international', False)
-            else:
-                # Formato viejo, verificar en base de datos
-                try:
-                    product = Product.objects.get(id=product_id)
-                    international_status[product_id] = product.stock <= 0 and product.stock_international > 0
-                except Product.DoesNotExist:
-                    international_status[product_id] = False
-        return international_status
+        return self.snapshot().international_status
     
     def has_international_items(self):
         """Verifica si el carrito tiene productos internacionales"""
-        return any(self.get_international_status().values())
+        return self.snapshot().has_international
     
     def update(self, product, quantity):
         product_id = str(product)
@@ -135,14 +120,7 @@ class Cart():
                 # Mantener compatibilidad con formato viejo
                 self.cart[product_id] = product_quantity
 
-        self.session.modified = True
-
-        # Log in user
-        if self.request.user.is_authenticated:
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("'", '"')
-            current_user.update(old_cart=carty)
+        self._touch()
 
     def delete(self, product):
         product_id = str(product)
@@ -150,32 +128,12 @@ class Cart():
         if product_id in self.cart:
             del self.cart[product_id]
 
-        self.session.modified = True
-
-        # Log in user
-        if self.request.user.is_authenticated:
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("'", '"')
-            current_user.update(old_cart=carty)
+        self._touch()
 
     def cart_total(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        quantities = self.get_quants()  # Usar get_quants() para compatibilidad
-        total = 0
-        
-        for key, value in quantities.items():
-            key = int(key)
-            for product in products:
-                if product.id == key:
-                    if product.is_sale:
-                        total = total + (product.sale_price * int(value))
-                    else:
-                        total = total + (product.price * int(value))
-        return total
+        return self.snapshot().total
     
     def clear(self):
         """Vacía todo el carrito"""
         self.cart.clear()
-        self.session.modified = True
\ No newline at end of file
+        self._touch()
\ No newline at end of file
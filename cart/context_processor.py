@@ -1,4 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
 from .cart import Cart
 
 def cart(request):
-    return {'cart': Cart(request)}
\ No newline at end of file
+    # Nada se evalúa hasta que un template use el carrito; el navbar solo lee cart_count
+    return {
+        'cart': SimpleLazyObject(lambda: Cart(request)),
+        'cart_count': SimpleLazyObject(lambda: Cart.item_count(request.session)),
+    }
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cart.persistence import flush_abandoned_sessions
+
+
+class Command(BaseCommand):
+    help = 'Guarda en el perfil los carritos con cambios pendientes de sesiones abandonadas o vencidas'
+
+    def handle(self, *args, **options):
+        flushed = flush_abandoned_sessions()
+        self.stdout.write(self.style.SUCCESS(f'🛒 Carritos pendientes guardados: {flushed}'))
@@ -0,0 +1,18 @@
+from .persistence import flush_pending
+
+
+class CartPersistenceMiddleware:
+    """Escribe en Profile.old_cart los cambios de carrito que quedaron pendientes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        # Solo si el request ya cargó la sesión, para no agregar consultas
+        session = getattr(request, 'session', None)
+        if session is not None and session.accessed and request.user.is_authenticated:
+            flush_pending(request)
+
+        return response
@@ -0,0 +1,117 @@
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from store.models import Profile
+
+
+# Segundos mínimos entre escrituras de Profile.old_cart; los cambios intermedios
+# quedan pendientes en la sesión y se escriben juntos
+CART_SAVE_INTERVAL = getattr(settings, 'CART_SAVE_INTERVAL', 30)
+
+# Segundos sin actividad para considerar abandonada una sesión con cambios pendientes
+# (flush_cart_sessions los escribe; mientras tanto el usuario podría volver)
+CART_ABANDONED_SECONDS = getattr(settings, 'CART_ABANDONED_SECONDS', 30 * 60)
+
+# Claves de sesión del guardado diferido
+SAVED_AT_KEY = 'cart_saved_at'
+DIRTY_KEY = 'cart_dirty'
+
+
+def save_cart(request, user=None):
+    """Escribe el carrito de la sesión en Profile.old_cart como JSON"""
+    user = user or request.user
+    if not user.is_authenticated:
+        return
+    _save_items(user.id, request.session.get('session_key') or {})
+    request.session[SAVED_AT_KEY] = time.time()
+    request.session.pop(DIRTY_KEY, None)
+
+
+def _interval_elapsed(session):
+    return time.time() - session.get(SAVED_AT_KEY, 0) >= CART_SAVE_INTERVAL
+
+
+def schedule_save(request):
+    """
+    Marca el carrito como pendiente de guardar. El primer cambio se escribe al
+    tiro; los siguientes dentro de CART_SAVE_INTERVAL se juntan en una sola escritura.
+    """
+    if not request.user.is_authenticated:
+        return
+    request.session[DIRTY_KEY] = True
+    if _interval_elapsed(request.session):
+        save_cart(request)
+
+
+def flush_pending(request):
+    """Escribe el carrito pendiente si ya pasó el intervalo"""
+    if request.session.get(DIRTY_KEY) and _interval_elapsed(request.session):
+        save_cart(request)
+
+
+def _save_items(user_id, items):
+    Profile.objects.filter(user__id=user_id).update(old_cart=json.dumps(items) if items else '')
+
+
+def flush_abandoned_sessions():
+    """
+    Escribe en Profile.old_cart los carritos pendientes de sesiones inactivas
+    hace más de CART_ABANDONED_SECONDS (incluidas las vencidas, antes de que
+    clearsessions las borre). La marca de pendiente se quita con un UPDATE
+    condicional sobre session_data: si el usuario volvió y la sesión cambió,
+    no se toca y la escribe su propio request. Retorna los carritos escritos.
+    """
+    # expire_date = último guardado de la sesión + SESSION_COOKIE_AGE
+    idle_until = timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE - CART_ABANDONED_SECONDS)
+    store = SessionStore()
+    sessions = SessionStore.get_model_class().objects.filter(expire_date__lte=idle_until)
+
+    flushed = 0
+    for session in sessions.iterator(chunk_size=500):
+        data = store.decode(session.session_data)
+        user_id = data.get(SESSION_KEY)
+        if not data.get(DIRTY_KEY) or not user_id:
+            continue
+        data.pop(DIRTY_KEY)
+        data[SAVED_AT_KEY] = time.time()
+        with transaction.atomic():
+            claimed = type(session).objects.filter(
+                pk=session.pk, session_data=session.session_data
+            ).update(session_data=store.encode(data))
+            if claimed:
+                _save_items(user_id, data.get('session_key') or {})
+                flushed += 1
+    return flushed
+
+
+def load_saved_cart(saved_cart):
+    """
+    Lee Profile.old_cart. Acepta el formato antiguo, que era el str() de un
+    dict de Python con comillas reemplazadas (True/False no son JSON válido).
+    """
+    if not saved_cart:
+        return {}
+    try:
+        items = json.loads(saved_cart)
+    except (json.JSONDecodeError, ValueError, TypeError):
+        try:
+            items = json.loads(saved_cart.replace('True', 'true').replace('False', 'false'))
+        except (json.JSONDecodeError, ValueError, TypeError):
+            return None
+    return items if isinstance(items, dict) else None
+
+
+@receiver(user_logged_out)
+def save_cart_on_logout(sender, request, user, **kwargs):
+    # logout() vacía la sesión después de esta señal: último momento para guardar
+    if request is not None and user is not None and request.session.get(DIRTY_KEY):
+        save_cart(request, user)
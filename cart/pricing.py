@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from store.models import Product
+
+
+@dataclass
+class CartLine:
+    product: Product
+    quantity: int
+    is_international: bool
+
+    @property
+    def unit_price(self):
+        return self.product.sale_price if self.product.is_sale else self.product.price
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+
+@dataclass
+class CartSnapshot:
+    """Foto del carrito con precios: una sola consulta de productos para todo el request"""
+    lines: list = field(default_factory=list)
+
+    @property
+    def products(self):
+        return [line.product for line in self.lines]
+
+    @property
+    def quantities(self):
+        return {str(line.product.id): line.quantity for line in self.lines}
+
+    @property
+    def international_status(self):
+        return {str(line.product.id): line.is_international for line in self.lines}
+
+    @property
+    def has_international(self):
+        return any(line.is_international for line in self.lines)
+
+    @property
+    def total(self):
+        return sum((line.line_total for line in self.lines), Decimal('0'))
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def is_international_product(product):
+    return product.availability == 'internacional'
+
+
+def price_cart(cart_items):
+    """
+    Construye el snapshot desde el dict de sesión del carrito
+    ({product_id: {'quantity', 'is_international'}} o el formato viejo {product_id: quantity}).
+    """
+    products = Product.objects.in_bulk([int(product_id) for product_id in cart_items])
+
+    lines = []
+    for product_id, value in cart_items.items():
+        product = products.get(int(product_id))
+        if product is None:
+            continue
+
+        if isinstance(value, dict):
+            quantity = int(value['quantity'])
+            is_international = value.get('is_international', False)
+        else:
+            # Formato viejo (solo número)
+            quantity = int(value)
+            is_international = is_international_product(product)
+
+        lines.append(CartLine(product=product, quantity=quantity, is_international=is_international))
+    return CartSnapshot(lines=lines)
@@ -1,3 +1,191 @@
-from django.test import TestCase
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from cart import persistence
+from cart.persistence import DIRTY_KEY, flush_abandoned_sessions, flush_pending, load_saved_cart, schedule_save
+from cart.pricing import price_cart
+from store.models import Category, Product
+
+
+def create_product(**kwargs):
+    defaults = {
+        'sku': 'TEST-1', 'part_number': 'TEST-1', 'name': 'Producto de prueba', 'price': 1000, 'stock': 5,
+        'category': Category.objects.get_or_create(name='ENGINE')[0],
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class PriceCartTests(TestCase):
+    def setUp(self):
+        self.product = create_product(price=1000)
+        self.on_sale = create_product(sku='TEST-2', part_number='TEST-2', price=5000, is_sale=True, sale_price=4000)
+        self.international = create_product(
+            sku='TEST-3', part_number='TEST-3', price=300, stock=0, stock_international=2,
+        )
+
+    def test_snapshot_prices_every_line(self):
+        snapshot = price_cart({
+            str(self.product.pk): {'quantity': 2, 'is_international': False},
+            str(self.on_sale.pk): {'quantity': '1', 'is_international': True},
+        })
+
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual([line.line_total for line in snapshot.lines], [2000, 4000])
+        self.assertEqual(snapshot.total, Decimal('6000'))
+        self.assertEqual(snapshot.quantities, {str(self.product.pk): 2, str(self.on_sale.pk): 1})
+        self.assertTrue(snapshot.has_international)
+
+    def test_snapshot_uses_one_query(self):
+        cart = {str(product.pk): 1 for product in (self.product, self.on_sale, self.international)}
+
+        with self.assertNumQueries(1):
+            snapshot = price_cart(cart)
+            snapshot.total
+
+        self.assertEqual(snapshot.products, [self.product, self.on_sale, self.international])
+
+    def test_old_format_takes_availability_from_product(self):
+        snapshot = price_cart({str(self.product.pk): 3, str(self.international.pk): 1})
+
+        self.assertEqual(
+            snapshot.international_status, {str(self.product.pk): False, str(self.international.pk): True},
+        )
+        self.assertEqual(snapshot.total, Decimal('3300'))
+
+    def test_deleted_products_are_skipped(self):
+        snapshot = price_cart({str(self.product.pk): 1, '999999': 4})
+
+        self.assertEqual(snapshot.products, [self.product])
+
+    def test_empty_cart(self):
+        snapshot = price_cart({})
+
+        self.assertEqual((len(snapshot), snapshot.total, snapshot.has_international), (0, Decimal('0'), False))
+
+
+class CartPersistenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente')
+        self.items = {'1': {'quantity': 2, 'is_international': False}}
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session.create()
+        request.session[SESSION_KEY] = str(self.user.pk)
+        request.session['session_key'] = dict(self.items)
+        request.user = self.user
+        return request
+
+    def saved_cart(self):
+        self.user.profile.refresh_from_db()
+        return load_saved_cart(self.user.profile.old_cart)
+
+    def test_first_change_is_saved_and_next_ones_are_deferred(self):
+        request = self.request()
+        schedule_save(request)
+        self.assertEqual(self.saved_cart(), self.items)
+
+        request.session['session_key']['2'] = {'quantity': 1, 'is_international': True}
+        schedule_save(request)
+
+        self.assertEqual(self.saved_cart(), self.items)
+        self.assertTrue(request.session[DIRTY_KEY])
+
+    def test_pending_change_is_saved_after_the_interval(self):
+        request = self.request()
+        schedule_save(request)
+        request.session['session_key'] = {}
+        schedule_save(request)
+
+        flush_pending(request)
+        self.assertEqual(self.saved_cart(), self.items)
+
+        with mock.patch.object(time, 'time', return_value=time.time() + persistence.CART_SAVE_INTERVAL):
+            flush_pending(request)
+        self.assertEqual(self.saved_cart(), {})
+        self.assertNotIn(DIRTY_KEY, request.session)
+
+    def test_anonymous_cart_is_not_saved(self):
+        request = self.request()
+        request.user = mock.Mock(is_authenticated=False)
+
+        schedule_save(request)
+
+        self.assertNotIn(DIRTY_KEY, request.session)
+
+
+class FlushAbandonedSessionsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente')
+        self.items = {'1': {'quantity': 2, 'is_international': False}}
+
+    def create_session(self, idle_seconds, dirty=True, user=True):
+        session = SessionStore()
+        if user:
+            session[SESSION_KEY] = str(self.user.pk)
+        session['session_key'] = self.items
+        if dirty:
+            session[DIRTY_KEY] = True
+        session.create()
+        # expire_date se calcula desde el último guardado de la sesión
+        last_activity = timezone.now() - timedelta(seconds=idle_seconds)
+        SessionStore.get_model_class().objects.filter(session_key=session.session_key).update(
+            expire_date=last_activity + timedelta(seconds=session.get_expiry_age())
+        )
+        return session
+
+    def saved_cart(self):
+        self.user.profile.refresh_from_db()
+        return self.user.profile.old_cart
+
+    def test_abandoned_dirty_session_is_written_once(self):
+        session = self.create_session(persistence.CART_ABANDONED_SECONDS + 60)
+
+        self.assertEqual(flush_abandoned_sessions(), 1)
+        self.assertEqual(json.loads(self.saved_cart()), self.items)
+
+        self.assertNotIn(DIRTY_KEY, SessionStore(session.session_key).load())
+        self.assertEqual(flush_abandoned_sessions(), 0)
+
+    def test_active_session_is_left_to_its_own_request(self):
+        self.create_session(60)
+
+        self.assertEqual(flush_abandoned_sessions(), 0)
+        self.assertEqual(self.saved_cart(), '')
+
+    def test_clean_or_anonymous_sessions_are_skipped(self):
+        self.create_session(persistence.CART_ABANDONED_SECONDS + 60, dirty=False)
+        self.create_session(persistence.CART_ABANDONED_SECONDS + 60, user=False)
+
+        self.assertEqual(flush_abandoned_sessions(), 0)
+        self.assertEqual(self.saved_cart(), '')
+
+    def test_session_changed_meanwhile_is_not_overwritten(self):
+        session = self.create_session(persistence.CART_ABANDONED_SECONDS + 60)
+        model = SessionStore.get_model_class()
+        decode = SessionStore.decode
+
+        def user_comes_back(store, session_data):
+            # El usuario vuelve entre la lectura de la sesión y el UPDATE condicional
+            data = decode(store, session_data)
+            model.objects.filter(session_key=session.session_key).update(
+                session_data=store.encode({**data, 'session_key': {}})
+            )
+            return data
+
+        with mock.patch.object(SessionStore, 'decode', user_comes_back):
+            self.assertEqual(flush_abandoned_sessions(), 0)
+
+        self.assertEqual(self.saved_cart(), '')
+        self.assertTrue(SessionStore(session.session_key).load()[DIRTY_KEY])
@@ -7,10 +7,11 @@ from django.http import JsonResponse
 
 def cart_summary(request):
     cart = Cart(request)
-    cart_products = cart.get_products()
-    quantities = cart.get_quants()
-    international_status = cart.get_international_status()  # Nuevo
-    total = cart.cart_total()
+    snapshot = cart.snapshot()  # Una sola consulta de productos
+    cart_products = snapshot.products
+    quantities = snapshot.quantities
+    international_status = snapshot.international_status
+    total = snapshot.total
 
     # Límite máximo por producto
     MAX_QUANTITY = 10
@@ -39,7 +40,7 @@ def cart_summary(request):
         "cart_products": products_with_stock, 
         "quantities": quantities,
         "international_status": international_status,
-        "has_international": cart.has_international_items(),
+        "has_international": snapshot.has_international,
         "total": total
     })
 
@@ -99,11 +100,8 @@ def cart_clear(request):
         # Obtener el carrito actual
         cart = Cart(request)
         
-        # Limpiar el carrito
-        cart.cart.clear()
-        
-        # Actualizar la sesión
-        request.session.modified = True
+        # Limpiar el carrito (también actualiza el conteo en sesión)
+        cart.clear()
         
         # Respuesta JSON
         response = JsonResponse({'message': 'Carrito vaciado exitosamente'})
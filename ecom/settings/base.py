@@ -38,6 +38,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'cart.middleware.CartPersistenceMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -113,6 +114,23 @@ USE_I18N = True
 
 USE_TZ = True
 
+# El caché por defecto es local a cada proceso (categorías del home, fichas y
+# primeras páginas de listados): sin ida y vuelta a la BD por request.
+# Los sitemaps pre-generados van en un caché aparte compartido entre los workers
+# de gunicorn y los comandos de carga que los generan; la tabla la crea la
+# migración store 0020_cache_table.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sitemaps': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+
 # Email Configuration
 EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = os.environ.get('EMAIL_HOST', '')
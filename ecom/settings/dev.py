@@ -9,6 +9,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Las transacciones toman el lock de escritura al empezar: los checkouts
+        # simultáneos esperan su turno en vez de fallar con "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # BD de prueba en archivo: la de memoria compartida falla con "table is locked"
+        # en vez de esperar, y los tests de concurrencia usan varias conexiones
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
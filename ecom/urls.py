@@ -1,18 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.contrib.sitemaps.views import sitemap
-from store.sitemaps import ProductSitemap, StaticSitemap
+from store.views import sitemap_xml
 from .settings import base
 from django.conf.urls.static import static
 
-sitemaps = {
-    'products': ProductSitemap,
-    'static': StaticSitemap,
-}
-
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', sitemap_xml, name='sitemap'),
+    path('sitemap-<slug:section>.xml', sitemap_xml, name='sitemap_section'),
     path('', include('store.urls')),
     path('cart/', include('cart.urls')),
     path('payment/', include('payment.urls')),
@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", os.environ.get("DJANGO_ENV", "ecom.settings.dev"))
 
 application = get_wsgi_application()
+
+
+# Cargar el índice de autocompletado al iniciar cada worker
+try:
+    from store.autocomplete import get_prefix_index
+    get_prefix_index()
+except Exception:
+    logging.getLogger(__name__).exception("No se pudo precargar el índice de autocompletado")
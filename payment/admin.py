@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ShippingAddress, Order, OrderItem, Coupon, CouponUsage
+from .models import ShippingAddress, Order, OrderItem, Coupon, CouponUsage, CouponUserCounter, CouponReservation, StockReservation
 from django.contrib.auth.models import User
 
 
@@ -63,4 +63,25 @@ class CouponAdmin(admin.ModelAdmin):
 class CouponUsageAdmin(admin.ModelAdmin):
     list_display = ['coupon', 'user', 'order', 'used_at']
     list_filter = ['used_at', 'coupon']
-    search_fields = ['coupon__code', 'user__username']
\ No newline at end of file
+    search_fields = ['coupon__code', 'user__username']
+
+@admin.register(CouponUserCounter)
+class CouponUserCounterAdmin(admin.ModelAdmin):
+    list_display = ['coupon', 'user', 'uses']
+    list_filter = ['coupon']
+    search_fields = ['coupon__code', 'user__username']
+
+
+@admin.register(CouponReservation)
+class CouponReservationAdmin(admin.ModelAdmin):
+    list_display = ['buy_order', 'coupon', 'user', 'status', 'expires_at']
+    list_filter = ['status', 'coupon']
+    search_fields = ['buy_order', 'coupon__code', 'user__username']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['buy_order', 'product', 'quantity', 'is_international', 'status', 'expires_at']
+    list_filter = ['status', 'is_international']
+    search_fields = ['buy_order', 'product__sku', 'product__name']
+    raw_id_fields = ['product']
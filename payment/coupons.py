@@ -0,0 +1,114 @@
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from payment.models import Coupon, CouponReservation, CouponUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+# Minutos que un uso de cupón queda reclamado mientras el cliente paga en Transbank
+COUPON_RESERVATION_MINUTES = getattr(
+    settings, 'COUPON_RESERVATION_MINUTES', getattr(settings, 'STOCK_RESERVATION_MINUTES', 20)
+)
+
+
+@dataclass
+class CouponEvaluation:
+    """Resultado de validar un cupón contra el monto del carrito"""
+    coupon: Coupon = None
+    discount: float = 0
+    message: str = ''
+
+    @property
+    def valid(self):
+        return self.coupon is not None
+
+
+def evaluate_coupon(request, code, amount):
+    """Valida el cupón para el usuario del request y el monto indicado"""
+    coupon = Coupon.objects.filter(code=code).first()
+    if coupon is None:
+        return CouponEvaluation(message='Cupón inválido')
+    user = request.user if request.user.is_authenticated else None
+    can_use, message = coupon.can_use(user=user, amount=amount)
+    if not can_use:
+        return CouponEvaluation(message=message)
+    return CouponEvaluation(coupon, float(coupon.calculate_discount(amount)), message)
+
+
+def session_coupon(request, amount):
+    """Evalúa el cupón guardado en sesión; si ya no es válido se quita de la sesión"""
+    code = request.session.get('coupon_code')
+    if not code:
+        return CouponEvaluation()
+    evaluation = evaluate_coupon(request, code, amount)
+    if not evaluation.valid:
+        request.session.pop('coupon_code', None)
+        request.session.pop('coupon_discount', None)
+    return evaluation
+
+
+def reserve_coupon(buy_order, coupon, user=None, minutes=COUPON_RESERVATION_MINUTES):
+    """
+    Reclama un uso del cupón para la compra `buy_order` antes de ir a pagar:
+    el uso se cuenta con los UPDATE condicionales de Coupon.redeem, así dos
+    checkouts simultáneos no pueden tomar el último uso. Lanza
+    CouponUnavailable si se agotó.
+    """
+    release_expired_coupons(coupon)
+    with transaction.atomic():
+        coupon.redeem(user)
+        CouponReservation.objects.create(
+            buy_order=buy_order,
+            coupon=coupon,
+            user=user,
+            expires_at=timezone.now() + timedelta(minutes=minutes),
+        )
+
+
+def commit_coupon(buy_order, coupon, user=None):
+    """
+    Confirma el uso reclamado por una compra pagada (held -> committed, UPDATE
+    condicional). Si la reserva ya se liberó por vencimiento el uso se vuelve a
+    reclamar con los límites; si el cupón se agotó entre medio el pago ya se
+    cobró con el descuento, así que el uso se cuenta igual y queda en el log.
+    """
+    if CouponReservation.objects.filter(buy_order=buy_order, status='held').update(status='committed'):
+        return
+    try:
+        with transaction.atomic():
+            coupon.redeem(user)
+    except CouponUnavailable:
+        logger.warning('[COUPON] Compra %s pagada con el cupón %s ya agotado', buy_order, coupon.code)
+        coupon.redeem(user, enforce_limits=False)
+
+
+def _release(reservations):
+    released = 0
+    for reservation in reservations.select_related('coupon', 'user'):
+        with transaction.atomic():
+            # Solo devuelve el uso quien cambia el estado: liberar dos veces no descuenta dos veces
+            if CouponReservation.objects.filter(pk=reservation.pk, status='held').update(status='released'):
+                reservation.coupon.release(reservation.user)
+                released += 1
+    return released
+
+
+def release_coupon(buy_order):
+    """Devuelve el uso reclamado por una compra cancelada, rechazada o fallida"""
+    if not buy_order:
+        return 0
+    return _release(CouponReservation.objects.filter(buy_order=buy_order, status='held'))
+
+
+def release_expired_coupons(coupon=None):
+    """Devuelve los usos de las reservas que pasaron su plazo (checkouts abandonados)"""
+    expired = CouponReservation.objects.filter(status='held', expires_at__lte=timezone.now())
+    if coupon is not None:
+        expired = expired.filter(coupon=coupon)
+    return _release(expired)
@@ -0,0 +1,161 @@
+import logging
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from payment.models import StockReservation
+from store.catalog import bump_catalog_version
+from store.detail import invalidate_product_detail
+from store.models import Product
+
+
+logger = logging.getLogger(__name__)
+
+# Minutos que se retiene el stock mientras el cliente paga en Transbank
+STOCK_RESERVATION_MINUTES = getattr(settings, 'STOCK_RESERVATION_MINUTES', 20)
+
+# Horas que se retiene el stock de un pedido por transferencia hasta que se confirma el pago
+BANK_TRANSFER_RESERVATION_HOURS = getattr(settings, 'BANK_TRANSFER_RESERVATION_HOURS', 48)
+
+
+# Reservas que un pago todavía puede descontar (las vencidas incluidas: el pago llegó tarde)
+COMMITTABLE_STATUSES = ['held', 'expired']
+
+
+class InsufficientStock(Exception):
+    """No hay stock disponible (descontando reservas vigentes) para alguna línea del carrito"""
+
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.name for product in products))
+
+
+def _column(is_international):
+    return 'stock_international' if is_international else 'stock'
+
+
+def _line_tuples(lines):
+    """(product_id, quantity, is_international) desde líneas del carrito u OrderItems"""
+    return [
+        (line.product_id if hasattr(line, 'product_id') else line.product.pk, line.quantity, line.is_international)
+        for line in lines
+        if line.quantity > 0
+    ]
+
+
+def held_quantities(product_ids, exclude_buy_order=None):
+    """Unidades retenidas por reservas vigentes: {(product_id, is_international): cantidad}"""
+    held = StockReservation.objects.filter(
+        product_id__in=product_ids, status='held', expires_at__gt=timezone.now()
+    )
+    if exclude_buy_order:
+        held = held.exclude(buy_order=exclude_buy_order)
+    return {
+        (product_id, is_international): total
+        for product_id, is_international, total in held.values('product_id', 'is_international')
+        .annotate(total=Sum('quantity')).values_list('product_id', 'is_international', 'total')
+    }
+
+
+def reserve_stock(buy_order, lines, minutes=STOCK_RESERVATION_MINUTES):
+    """
+    Retiene el stock de las líneas para la compra `buy_order` durante `minutes`.
+    Las filas de producto se bloquean (SELECT ... FOR UPDATE, en orden de id)
+    para que dos checkouts simultáneos no reserven las mismas unidades.
+    Lanza InsufficientStock si alguna línea supera lo disponible.
+    """
+    lines = _line_tuples(lines)
+    product_ids = sorted({product_id for product_id, _, _ in lines})
+
+    with transaction.atomic():
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+        }
+        held = held_quantities(product_ids, exclude_buy_order=buy_order)
+
+        short = []
+        for product_id, quantity, is_international in lines:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            available = getattr(product, _column(is_international)) - held.get((product_id, is_international), 0)
+            if quantity > available:
+                short.append(product)
+        if short:
+            raise InsufficientStock(short)
+
+        # Un reintento con el mismo buy_order reemplaza sus reservas anteriores
+        StockReservation.objects.filter(buy_order=buy_order, status__in=COMMITTABLE_STATUSES).update(status='released')
+        expires_at = timezone.now() + timedelta(minutes=minutes)
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                buy_order=buy_order,
+                product_id=product_id,
+                quantity=quantity,
+                is_international=is_international,
+                expires_at=expires_at,
+            )
+            for product_id, quantity, is_international in lines
+            if product_id in products
+        ])
+
+
+def commit_stock(buy_order):
+    """
+    Descuenta el stock reservado por una compra pagada. Cada reserva se reclama
+    con un UPDATE condicional (held/expired -> committed) y solo se descuentan
+    las que este llamado reclamó, así confirmar dos veces la misma compra no
+    descuenta dos veces. El descuento es un UPDATE condicional por línea
+    (stock >= cantidad), así el stock nunca queda negativo aunque la reserva
+    haya vencido. Retorna las líneas que no se pudieron descontar completas.
+    """
+    now = timezone.now()
+    claimed = []
+    shortfalls = []
+
+    with transaction.atomic():
+        reservations = StockReservation.objects.filter(
+            buy_order=buy_order, status__in=COMMITTABLE_STATUSES
+        ).values_list('pk', 'status', 'product_id', 'quantity', 'is_international')
+        for pk, status, product_id, quantity, is_international in reservations:
+            if StockReservation.objects.filter(pk=pk, status=status).update(status='committed'):
+                claimed.append((product_id, quantity, is_international))
+
+        for product_id, quantity, is_international in claimed:
+            column = _column(is_international)
+            updated = Product.objects.filter(pk=product_id, **{f'{column}__gte': quantity}).update(
+                # sync_hash vacío: la próxima carga del proveedor vuelve a escribir el stock
+                **{column: F(column) - quantity, 'sync_hash': '', 'updated_at': now}
+            )
+            if not updated:
+                shortfalls.append((product_id, quantity, is_international))
+        product_ids = {product_id for product_id, _, _ in claimed}
+        Product.refresh_availability(product_ids)
+        # Stock nuevo en la ficha de este proceso (los UPDATE con F() no disparan post_save)
+        for product_id in product_ids:
+            transaction.on_commit(partial(invalidate_product_detail, product_id))
+
+    if shortfalls:
+        logger.warning('[STOCK] Compra %s pagada sin stock suficiente: %s', buy_order, shortfalls)
+    if claimed:
+        bump_catalog_version()
+    return shortfalls
+
+
+def release_stock(buy_order):
+    """Libera las reservas de una compra cancelada, rechazada o fallida"""
+    return StockReservation.objects.filter(buy_order=buy_order, status__in=COMMITTABLE_STATUSES).update(status='released')
+
+
+def release_expired_reservations():
+    """
+    Marca como vencidas las reservas que pasaron su plazo (ya no afectan la
+    disponibilidad). Siguen siendo descontables: un pago que llega tarde
+    todavía descuenta su stock.
+    """
+    return StockReservation.objects.filter(status='held', expires_at__lte=timezone.now()).update(status='expired')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from payment.coupons import release_expired_coupons
+from payment.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        'Marca como vencidas las reservas de stock que pasaron su plazo y devuelve los usos '
+        'de cupón reclamados (checkouts abandonados)'
+    )
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'🔓 Reservas marcadas como vencidas: {released}'))
+        coupons = release_expired_coupons()
+        self.stdout.write(self.style.SUCCESS(f'🎟️  Usos de cupón devueltos: {coupons}'))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0011_order_order_status_order_payment_method'),
+        ('store', '0018_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('buy_order', models.CharField(db_index=True, max_length=50)),
+                ('quantity', models.PositiveIntegerField()),
+                ('is_international', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('held', 'Retenida'), ('committed', 'Descontada'), ('released', 'Liberada')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'status', 'expires_at'], name='payment_reservation_active_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    """Contadores por usuario a partir del historial de CouponUsage"""
+    CouponUsage = apps.get_model('payment', 'CouponUsage')
+    CouponUserCounter = apps.get_model('payment', 'CouponUserCounter')
+    usages = (
+        CouponUsage.objects.filter(user__isnull=False)
+        .values('coupon_id', 'user_id').annotate(uses=Count('id'))
+    )
+    CouponUserCounter.objects.bulk_create([
+        CouponUserCounter(coupon_id=row['coupon_id'], user_id=row['user_id'], uses=row['uses'])
+        for row in usages
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0012_stockreservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponUserCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uses', models.PositiveIntegerField(default=0)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_counters', to='payment.coupon')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'user'), name='payment_couponusercounter_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0013_coupon_user_counter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockreservation',
+            name='status',
+            field=models.CharField(choices=[('held', 'Retenida'), ('committed', 'Descontada'), ('released', 'Liberada'), ('expired', 'Vencida')], default='held', max_length=10),
+        ),
+    ]
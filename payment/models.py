@@ -1,8 +1,11 @@
+import uuid
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 from store.models import Product
-from django.db.models.signals import post_save, pre_save
+from store.tracking import TrackedFieldsMixin
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 from payment.validators import validar_rut
 import datetime
@@ -61,7 +64,7 @@ class ShippingAddress(models.Model):
 
 
 
-class Order(models.Model):
+class Order(TrackedFieldsMixin, models.Model):
      # Choices para método de pago
     PAYMENT_METHOD_CHOICES = [
         ('transbank', 'Transbank'),
@@ -117,25 +120,67 @@ class Order(models.Model):
     coupon_discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     amount_before_discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    # Campos cuyo cambio se detecta en memoria (ver TrackedFieldsMixin)
+    tracked_fields = ('shipped',)
+
     class Meta:
         ordering = ['-date_order']
     
     def save(self, *args, **kwargs):
-        """Genera buy_order automáticamente si no existe"""
+        """Asigna el buy_order antes del INSERT: la orden se guarda en una sola escritura"""
         if not self.buy_order:
-            # Primera guardada sin buy_order
-            is_new = self.pk is None
-            super().save(*args, **kwargs)
-            
-            # Generar buy_order basado en ID y fecha
-            if is_new:
-                # Formato: YYYYMMDD-XXXXXX
-                # Ejemplo: 20241223-000001
-                date_str = self.date_order.strftime('%Y%m%d')
-                self.buy_order = f"{date_str}-{self.id:06d}"
-                super().save(update_fields=['buy_order'])
-        else:
-            super().save(*args, **kwargs)
+            self.buy_order = self.generate_buy_order()
+
+        # Auto add shipping date al pasar a enviada (sin SELECT previo)
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'shipped' in update_fields) and self.shipped and self.has_changed('shipped'):
+            self.date_shipped = datetime.datetime.now()
+            if update_fields is not None and 'date_shipped' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'date_shipped']
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def generate_buy_order():
+        """
+        Formato: YYYYMMDD-XXXXXXXX (el mismo que se envía a Transbank)
+        Ejemplo: 20241223-1A2B3C4D
+        """
+        return f"{timezone.localdate():%Y%m%d}-{uuid.uuid4().hex[:8].upper()}"
+
+    def place(self, lines, coupon=None, coupon_reserved=False):
+        """
+        Inserta la orden, sus ítems y el uso del cupón en una sola transacción:
+        un INSERT de la orden con su buy_order definitivo, un bulk_create de los
+        ítems y el registro del cupón. `lines` son las líneas del snapshot del carrito.
+        Con coupon_reserved=True el uso ya se reclamó antes del pago (ver
+        payment/coupons.py reserve_coupon) y aquí solo se confirma la reserva.
+        Lanza CouponUnavailable (y no se guarda nada) si el cupón se agotó.
+        """
+        lines = [line for line in lines if line.quantity > 0]
+        self.has_international_items = self.has_international_items or any(line.is_international for line in lines)
+        self.coupon = coupon
+
+        with transaction.atomic():
+            self.save(force_insert=True)
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=self,
+                    product=line.product,
+                    user=self.user,
+                    quantity=line.quantity,
+                    price=line.unit_price,
+                    is_international=line.is_international,
+                )
+                for line in lines
+            ])
+            if coupon:
+                if coupon_reserved:
+                    from payment.coupons import commit_coupon
+                    commit_coupon(self.buy_order, coupon, self.user)
+                else:
+                    coupon.redeem(self.user)
+                CouponUsage.objects.create(coupon=coupon, user=self.user, order=self)
+        return self
     
     def __str__(self):
         return f"Order #{self.id} - {self.buy_order or 'Pending'} - {self.full_name}"
@@ -152,15 +197,6 @@ class Order(models.Model):
         }
         return payment_types.get(self.payment_type_code, 'No especificado')
     
-# Auto add shipping date
-@receiver(pre_save, sender=Order)
-def set_shipped_date_on_update(sender, instance, **kwargs):
-    if instance.pk:
-        now = datetime.datetime.now()
-        obj = sender._default_manager.get(pk=instance.pk)
-        if instance.shipped and not obj.shipped:
-            instance.date_shipped = now
-    
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True)
@@ -242,12 +278,71 @@ class Coupon(models.Model):
             return False, f"Compra mínima de ${self.min_purchase_amount:,.0f} requerida"
         
         if user and self.max_uses_per_user > 0:
-            user_usage = CouponUsage.objects.filter(coupon=self, user=user).count()
+            user_usage = CouponUserCounter.objects.filter(coupon=self, user=user).values_list('uses', flat=True).first() or 0
             if user_usage >= self.max_uses_per_user:
                 return False, "Ya has usado este cupón el máximo de veces permitidas"
         
         return True, "Cupón válido"
 
+    def redeem(self, user=None, enforce_limits=True):
+        """
+        Registra un uso con UPDATE condicionales, sin leer y luego escribir: el
+        contador global sube solo si times_used < max_uses y el del usuario solo
+        si uses < max_uses_per_user. Lanza CouponUnavailable si se agotó; debe
+        llamarse dentro de una transacción para deshacer el otro contador.
+        Con enforce_limits=False solo se cuentan los usos.
+        """
+        coupons = Coupon.objects.filter(pk=self.pk)
+        if enforce_limits:
+            # El cupón también debe seguir activo y vigente al momento de registrar el uso
+            now = timezone.now()
+            coupons = coupons.filter(
+                Q(max_uses=0) | Q(times_used__lt=F('max_uses')),
+                is_active=True, valid_from__lte=now, valid_until__gte=now,
+            )
+        if not coupons.update(times_used=F('times_used') + 1):
+            raise CouponUnavailable("El cupón ya no está disponible")
+
+        if user is None or self.max_uses_per_user <= 0:
+            return
+        counters = CouponUserCounter.objects.filter(coupon=self, user=user)
+        if enforce_limits:
+            counters = counters.filter(uses__lt=self.max_uses_per_user)
+        if counters.update(uses=F('uses') + 1):
+            return
+        try:
+            with transaction.atomic():
+                CouponUserCounter.objects.create(coupon=self, user=user, uses=1)
+        except IntegrityError:
+            # Otro request creó el contador en paralelo: se reintenta el UPDATE condicional
+            if not counters.update(uses=F('uses') + 1):
+                raise CouponUnavailable("Ya has usado este cupón el máximo de veces permitidas")
+
+    def release(self, user=None):
+        """Devuelve un uso registrado con redeem (pago rechazado, cancelado o reserva vencida)"""
+        Coupon.objects.filter(pk=self.pk, times_used__gt=0).update(times_used=F('times_used') - 1)
+        if user is not None and self.max_uses_per_user > 0:
+            CouponUserCounter.objects.filter(coupon=self, user=user, uses__gt=0).update(uses=F('uses') - 1)
+
+
+class CouponUnavailable(Exception):
+    """El cupón se agotó entre la validación y el registro del uso"""
+
+
+class CouponUserCounter(models.Model):
+    """Usos de un cupón por usuario (reemplaza el COUNT sobre CouponUsage)"""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='user_counters')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    uses = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['coupon', 'user'], name='payment_couponusercounter_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon.code} - {self.user.username}: {self.uses}"
+
 
 class CouponUsage(models.Model):
     """Registro de uso de cupones"""
@@ -261,4 +356,55 @@ class CouponUsage(models.Model):
         verbose_name_plural = "Usos de Cupones"
     
     def __str__(self):
-        return f"{self.coupon.code} - {self.user.username if self.user else 'Invitado'} - {self.used_at}"
\ No newline at end of file
+        return f"{self.coupon.code} - {self.user.username if self.user else 'Invitado'} - {self.used_at}"
+
+class StockReservation(models.Model):
+    """Stock retenido para una compra en curso (ver payment/inventory.py)"""
+    STATUS_CHOICES = [
+        ('held', 'Retenida'),
+        ('committed', 'Descontada'),
+        ('released', 'Liberada'),
+        ('expired', 'Vencida'),
+    ]
+
+    buy_order = models.CharField(max_length=50, db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    is_international = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Reservas vigentes de un producto (disponibilidad al reservar)
+            models.Index(fields=['product', 'status', 'expires_at'], name='payment_reservation_active_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.buy_order} - {self.product_id} x{self.quantity} ({self.status})"
+
+
+class CouponReservation(models.Model):
+    """Uso de cupón reclamado antes de ir a pagar a Transbank (ver payment/coupons.py)"""
+    STATUS_CHOICES = [
+        ('held', 'Retenida'),
+        ('committed', 'Confirmada'),
+        ('released', 'Liberada'),
+    ]
+
+    buy_order = models.CharField(max_length=50, db_index=True)
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Reservas vencidas por liberar
+            models.Index(fields=['status', 'expires_at'], name='payment_couponres_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.buy_order} - {self.coupon_id} ({self.status})"
@@ -1,3 +1,311 @@
-from django.test import TestCase
+import threading
+from collections import Counter, namedtuple
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from cart.pricing import CartLine
+from payment.coupons import commit_coupon, release_coupon, release_expired_coupons, reserve_coupon
+from payment.inventory import (
+    InsufficientStock, commit_stock, held_quantities, release_expired_reservations, release_stock, reserve_stock,
+)
+from payment.models import Coupon, CouponReservation, CouponUnavailable, CouponUserCounter, Order, StockReservation
+from store.models import Category, Product
+
+
+# Línea mínima con la interfaz que esperan reserve_stock y commit_stock
+Line = namedtuple('Line', ['product_id', 'quantity', 'is_international'])
+
+
+def create_product(**kwargs):
+    defaults = {
+        'sku': 'TEST-1', 'part_number': 'TEST-1', 'name': 'Producto de prueba', 'price': 1000, 'stock': 5,
+        'category': Category.objects.get_or_create(name='ENGINE')[0],
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.product = create_product(stock=5, stock_international=2)
+
+    def statuses(self, buy_order):
+        return sorted(StockReservation.objects.filter(buy_order=buy_order).values_list('status', flat=True))
+
+    def test_reserve_holds_stock(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False)])
+
+        self.assertEqual(held_quantities([self.product.pk]), {(self.product.pk, False): 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_reserve_counts_other_holds(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False)])
+
+        with self.assertRaises(InsufficientStock) as cm:
+            reserve_stock('B', [Line(self.product.pk, 3, False)])
+        self.assertEqual(cm.exception.products, [self.product])
+        self.assertFalse(StockReservation.objects.filter(buy_order='B').exists())
+
+        # El stock internacional es una columna aparte
+        reserve_stock('C', [Line(self.product.pk, 2, True)])
+
+    def test_reserve_ignores_expired_holds(self):
+        reserve_stock('A', [Line(self.product.pk, 5, False)], minutes=-1)
+        reserve_stock('B', [Line(self.product.pk, 5, False)])
+
+    def test_reserve_retry_replaces_previous_holds(self):
+        reserve_stock('A', [Line(self.product.pk, 2, False)])
+        reserve_stock('A', [Line(self.product.pk, 5, False)])
+
+        self.assertEqual(self.statuses('A'), ['held', 'released'])
+        self.assertEqual(held_quantities([self.product.pk]), {(self.product.pk, False): 5})
+
+    def test_commit_decrements_reserved_stock(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False), Line(self.product.pk, 1, True)])
+
+        self.assertEqual(commit_stock('A'), [])
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.stock_international), (2, 1))
+        self.assertEqual(self.product.sync_hash, '')
+        self.assertEqual(self.statuses('A'), ['committed', 'committed'])
+        self.assertEqual(held_quantities([self.product.pk]), {})
+
+    def test_commit_is_idempotent(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False)])
+
+        commit_stock('A')
+        commit_stock('A')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+    def test_commit_after_expiry_still_decrements(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False)], minutes=-1)
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(self.statuses('A'), ['expired'])
+
+        self.assertEqual(commit_stock('A'), [])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual(self.statuses('A'), ['committed'])
+
+    def test_commit_shortfall_never_goes_negative(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False)], minutes=-1)
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+
+        self.assertEqual(commit_stock('A'), [(self.product.pk, 3, False)])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def test_commit_updates_availability(self):
+        reserve_stock('A', [Line(self.product.pk, 5, False)])
+
+        commit_stock('A')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.availability, 'internacional')
+
+    def test_release_frees_holds(self):
+        reserve_stock('A', [Line(self.product.pk, 5, False)])
+
+        self.assertEqual(release_stock('A'), 1)
+
+        self.assertEqual(held_quantities([self.product.pk]), {})
+        reserve_stock('B', [Line(self.product.pk, 5, False)])
+
+    def test_commit_after_release_does_nothing(self):
+        reserve_stock('A', [Line(self.product.pk, 3, False)])
+        release_stock('A')
+
+        self.assertEqual(commit_stock('A'), [])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(self.statuses('A'), ['released'])
+
+    def test_release_expired_only_touches_past_holds(self):
+        reserve_stock('A', [Line(self.product.pk, 1, False)], minutes=-1)
+        reserve_stock('B', [Line(self.product.pk, 1, False)])
+        StockReservation.objects.filter(buy_order='B').update(expires_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(self.statuses('A'), ['expired'])
+        self.assertEqual(self.statuses('B'), ['held'])
+
+
+def create_coupon(**kwargs):
+    now = timezone.now()
+    defaults = {
+        'code': 'DESCUENTO', 'discount_type': 'fixed', 'discount_value': 1000, 'max_uses': 1, 'max_uses_per_user': 1,
+        'valid_from': now - timedelta(days=1), 'valid_until': now + timedelta(days=1),
+    }
+    defaults.update(kwargs)
+    return Coupon.objects.create(**defaults)
+
+
+class CouponRedeemTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente')
+
+    def test_redeem_stops_at_max_uses(self):
+        coupon = create_coupon(max_uses=2, max_uses_per_user=0)
+
+        coupon.redeem()
+        coupon.redeem()
+        with self.assertRaises(CouponUnavailable):
+            coupon.redeem()
+
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.times_used, 2)
+
+    def test_redeem_stops_at_max_uses_per_user(self):
+        coupon = create_coupon(max_uses=0, max_uses_per_user=1)
+
+        coupon.redeem(self.user)
+        with self.assertRaises(CouponUnavailable):
+            coupon.redeem(self.user)
+        coupon.redeem(User.objects.create_user('otro'))
+
+        self.assertEqual(CouponUserCounter.objects.get(coupon=coupon, user=self.user).uses, 1)
+
+    def test_redeem_rejects_inactive_or_expired_coupon(self):
+        inactive = create_coupon(code='INACTIVO', max_uses=0, is_active=False)
+        expired = create_coupon(code='VENCIDO', max_uses=0, valid_until=timezone.now() - timedelta(minutes=1))
+
+        for coupon in (inactive, expired):
+            with self.assertRaises(CouponUnavailable):
+                coupon.redeem()
+
+    def test_redeem_without_limits_always_counts(self):
+        coupon = create_coupon(max_uses=1)
+        coupon.redeem()
+
+        coupon.redeem(enforce_limits=False)
+
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.times_used, 2)
+
+
+class CouponReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente')
+        self.coupon = create_coupon(max_uses=1, max_uses_per_user=1)
+
+    def uses(self):
+        self.coupon.refresh_from_db()
+        counter = CouponUserCounter.objects.filter(coupon=self.coupon, user=self.user).first()
+        return self.coupon.times_used, counter.uses if counter else 0
+
+    def test_reserve_claims_the_last_use(self):
+        reserve_coupon('A', self.coupon, self.user)
+
+        self.assertEqual(self.uses(), (1, 1))
+        with self.assertRaises(CouponUnavailable):
+            reserve_coupon('B', self.coupon)
+        self.assertFalse(CouponReservation.objects.filter(buy_order='B').exists())
+
+    def test_release_returns_the_use_once(self):
+        reserve_coupon('A', self.coupon, self.user)
+
+        self.assertEqual(release_coupon('A'), 1)
+        self.assertEqual(release_coupon('A'), 0)
+
+        self.assertEqual(self.uses(), (0, 0))
+        reserve_coupon('B', self.coupon, self.user)
+
+    def test_expired_reservation_frees_the_use(self):
+        reserve_coupon('A', self.coupon, self.user, minutes=-1)
+
+        reserve_coupon('B', self.coupon)
+
+        self.assertEqual(CouponReservation.objects.get(buy_order='A').status, 'released')
+        self.assertEqual(self.uses(), (1, 0))
+
+    def test_release_expired_only_touches_past_reservations(self):
+        reserve_coupon('A', self.coupon, minutes=-1)
+        release_expired_coupons()
+        reserve_coupon('B', self.coupon)
+
+        self.assertEqual(release_expired_coupons(), 0)
+        self.assertEqual(CouponReservation.objects.get(buy_order='B').status, 'held')
+
+    def test_commit_confirms_without_counting_again(self):
+        reserve_coupon('A', self.coupon, self.user)
+
+        commit_coupon('A', self.coupon, self.user)
+
+        self.assertEqual(self.uses(), (1, 1))
+        self.assertEqual(CouponReservation.objects.get(buy_order='A').status, 'committed')
+        self.assertEqual(release_coupon('A'), 0)
+
+    def test_commit_after_expiry_claims_again(self):
+        reserve_coupon('A', self.coupon, self.user, minutes=-1)
+        release_expired_coupons()
+
+        commit_coupon('A', self.coupon, self.user)
+
+        self.assertEqual(self.uses(), (1, 1))
+
+    def test_place_confirms_reserved_coupon(self):
+        product = create_product()
+        reserve_coupon('A', self.coupon, self.user)
+        order = Order(user=self.user, full_name='Cliente', email='c@x.cl', shipping_address='x', amount_pay=0, buy_order='A')
+
+        order.place([CartLine(product, 1, False)], coupon=self.coupon, coupon_reserved=True)
+
+        self.assertEqual(self.uses(), (1, 1))
+        self.assertEqual(order.couponusage_set.count(), 1)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Checkouts simultáneos sobre un mismo producto: el stock descontado nunca supera el disponible"""
+
+    workers = 20
+    stock = 5
+
+    def checkout(self, product_id):
+        """Flujo real: reserva al ir a pagar y descuento condicional al autorizar"""
+        buy_order = Order.generate_buy_order()
+        try:
+            reserve_stock(buy_order, [Line(product_id, 1, False)])
+        except InsufficientStock:
+            return 'sin stock'
+        if commit_stock(buy_order):
+            release_stock(buy_order)
+            return 'pagado sin stock'
+        return 'pagado'
+
+    def test_no_oversell(self):
+        product = create_product(stock=self.stock)
+        results = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.workers)
+
+        def worker():
+            try:
+                barrier.wait()
+                outcome = self.checkout(product.pk)
+            except OperationalError as e:
+                outcome = f'error: {e}'
+            finally:
+                connection.close()
+            with lock:
+                results[outcome] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results, Counter({'pagado': self.stock, 'sin stock': self.workers - self.stock}))
+        self.assertEqual(product.stock, 0)
@@ -5,13 +5,16 @@ from payment.forms import ShippingForm, PaymentForm
 from payment.models import ShippingAddress
 from django.contrib import messages
 from django.utils import timezone
-from payment.models import Order, OrderItem, Coupon, CouponUsage
+from payment.models import Order, OrderItem, Coupon, CouponUsage, CouponUnavailable
+from payment.coupons import evaluate_coupon, release_coupon, reserve_coupon, session_coupon
+from payment.inventory import (
+    InsufficientStock, reserve_stock, commit_stock, release_stock, BANK_TRANSFER_RESERVATION_HOURS,
+)
 from django.contrib.auth.models import User
 from store.models import Product, Profile
 from store.forms import GuestUserForm, UserInfoForm
 from workshop.models import Workshop
 import datetime
-import uuid
 from store.emails import send_order_confirmation_email_async, send_pending_order_email_async, send_provider_order_notification_async
 from django.http import JsonResponse
 
@@ -29,39 +32,26 @@ env = os.getenv('DJANGO_SETTINGS_MODULE', '')
 
 def checkout(request):
     cart = Cart(request)
-    cart_products = cart.get_products()
-    quantities = cart.get_quants()
+    snapshot = cart.snapshot()
+    cart_products = snapshot.products
+    quantities = snapshot.quantities
     
     # ===== CUPONES =====
     coupon_code = request.session.get('coupon_code')
     coupon_discount = request.session.get('coupon_discount', 0)
     
     # Calcular totales
-    cart_total = float(cart.cart_total())
+    cart_total = float(snapshot.total)
     total_after_discount = cart_total - coupon_discount
     
-    # Validar cupón si existe
-    coupon = None
-    if coupon_code:
-        try:
-            coupon = Coupon.objects.get(code=coupon_code)
-            user = request.user if request.user.is_authenticated else None
-            can_use, message = coupon.can_use(user=user, amount=cart_total)
-            
-            if not can_use:
-                # Cupón ya no es válido, removerlo
-                del request.session['coupon_code']
-                del request.session['coupon_discount']
-                messages.warning(request, f'El cupón ya no es válido: {message}')
-                coupon = None
-                coupon_discount = 0
-                total_after_discount = cart_total
-        except Coupon.DoesNotExist:
-            del request.session['coupon_code']
-            del request.session['coupon_discount']
-            coupon = None
-            coupon_discount = 0
-            total_after_discount = cart_total
+    # Validar cupón si existe (si ya no es válido se quita de la sesión)
+    evaluation = session_coupon(request, cart_total)
+    coupon = evaluation.coupon
+    if coupon_code and not coupon:
+        if evaluation.message != 'Cupón inválido':
+            messages.warning(request, f'El cupón ya no es válido: {evaluation.message}')
+        coupon_discount = 0
+        total_after_discount = cart_total
 
     personal_info = None
     guest_user_form = None
@@ -326,9 +316,10 @@ def billing_info(request):
     2. POST: Procesa el pago y redirige a Transbank
     """
     cart = Cart(request)
-    cart_products = cart.get_products()
-    quantities = cart.get_quants()
-    cart_total = cart.cart_total()
+    snapshot = cart.snapshot()
+    cart_products = snapshot.products
+    quantities = snapshot.quantities
+    cart_total = snapshot.total
 
     # ===== OBTENER CUPÓN Y CALCULAR TOTAL CON DESCUENTO =====
     coupon_code = request.session.get('coupon_code')
@@ -337,28 +328,14 @@ def billing_info(request):
     # Total final que se pagará
     total = float(cart_total) - coupon_discount
     
-    # Validar cupón si existe
-    coupon = None
-    if coupon_code:
-        try:
-            coupon = Coupon.objects.get(code=coupon_code)
-            user = request.user if request.user.is_authenticated else None
-            can_use, message = coupon.can_use(user=user, amount=cart_total)
-            
-            if not can_use:
-                # Cupón ya no es válido
-                del request.session['coupon_code']
-                del request.session['coupon_discount']
-                messages.warning(request, f'El cupón ya no es válido: {message}')
-                coupon = None
-                coupon_discount = 0
-                total = cart_total
-        except Coupon.DoesNotExist:
-            del request.session['coupon_code']
-            del request.session['coupon_discount']
-            coupon = None
-            coupon_discount = 0
-            total = cart_total
+    # Validar cupón si existe (si ya no es válido se quita de la sesión)
+    evaluation = session_coupon(request, cart_total)
+    coupon = evaluation.coupon
+    if coupon_code and not coupon:
+        if evaluation.message != 'Cupón inválido':
+            messages.warning(request, f'El cupón ya no es válido: {evaluation.message}')
+        coupon_discount = 0
+        total = cart_total
 
     # Validar que hay información de envío en sesión
     shipping_info = request.session.get('shipping_info')
@@ -393,9 +370,25 @@ def billing_info(request):
         if payment_method == 'transbank':
         
             # Generar un buy_order único
-            timestamp = datetime.datetime.now().strftime('%Y%m%d')
-            unique_id = str(uuid.uuid4())[:8].upper()
-            buy_order = f"{timestamp}-{unique_id}"
+            buy_order = Order.generate_buy_order()
+
+            # Retener el stock mientras el cliente paga en Transbank
+            try:
+                reserve_stock(buy_order, snapshot.lines)
+            except InsufficientStock as e:
+                messages.error(request, f"No hay stock suficiente para: {e}. Ajusta las cantidades en el carrito.")
+                return redirect('cart_summary')
+
+            # Reclamar el uso del cupón antes de cobrar: dos checkouts no pueden tomar el último uso
+            if coupon:
+                try:
+                    reserve_coupon(buy_order, coupon, request.user if request.user.is_authenticated else None)
+                except CouponUnavailable as e:
+                    release_stock(buy_order)
+                    request.session.pop('coupon_code', None)
+                    request.session.pop('coupon_discount', None)
+                    messages.warning(request, f'El cupón ya no es válido: {e}')
+                    return redirect('billing_info')
         
             try:
                 env = os.getenv('DJANGO_SETTINGS_MODULE', '')
@@ -435,6 +428,8 @@ def billing_info(request):
                 print(f"Error creando transacción Transbank: {e}")
                 import traceback
                 traceback.print_exc()
+                release_stock(buy_order)
+                release_coupon(buy_order)
                 
                 messages.error(request, "Error al iniciar el pago con Transbank. Intenta nuevamente.")
                 return render(request, "payment/billing_info.html", {
@@ -469,8 +464,8 @@ def billing_info(request):
                         shipping_address += f"CP: {shipping_info['shipping_zipcode']}\n"
                     shipping_address += f"{shipping_info['shipping_country']}"
 
-                # Crear la orden
-                order = Order.objects.create(
+                # Crear la orden, sus items y el uso del cupón en una sola transacción
+                order = Order(
                     user=request.user if request.user.is_authenticated else None,
                     full_name=personal_info['full_name'],
                     email=personal_info['email'],
@@ -482,45 +477,20 @@ def billing_info(request):
                     payment_method='bank_transfer',
                     order_status='pending',  # Estado pendiente
                     # Cupón
-                    coupon=coupon,
                     coupon_discount=coupon_discount,
                     amount_before_discount=cart_total if coupon else total,
+                    buy_order=Order.generate_buy_order(),
                 )
 
-                # Crear los items de la orden
-                has_international = False
-                for product in cart_products:
-                    quantity = quantities.get(str(product.id), 0)
-                    
-                    # Determinar precio
-                    if product.is_sale:
-                        price = product.sale_price
-                    else:
-                        price = product.price
-                    
-                    # Verificar si es internacional
-                    is_international = getattr(product, 'is_international', False)
-                    if is_international:
-                        has_international = True
-                    
-                    # Crear OrderItem
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        user=request.user if request.user.is_authenticated else None,
-                        quantity=quantity,
-                        price=price,
-                        is_international=is_international,
-                    )
-
-                # Actualizar flag de items internacionales
-                if has_international:
-                    order.has_international_items = True
-                    order.save()
+                # Retener el stock hasta que se confirme la transferencia
+                reserve_stock(order.buy_order, snapshot.lines, minutes=BANK_TRANSFER_RESERVATION_HOURS * 60)
 
-                # Marcar cupón como usado
-                if coupon:
-                    coupon.use_coupon(user=request.user if request.user.is_authenticated else None)
+                # Precios y flags desde el snapshot del carrito
+                try:
+                    order.place(snapshot.lines, coupon=coupon)
+                except Exception:
+                    release_stock(order.buy_order)
+                    raise
 
                 # Limpiar carrito y sesión
                 clear_cart_and_session(request)
@@ -536,6 +506,16 @@ def billing_info(request):
                 # Redirigir a página de confirmación
                 return redirect('order_pending', order_id=order.id)
 
+            except InsufficientStock as e:
+                messages.error(request, f"No hay stock suficiente para: {e}. Ajusta las cantidades en el carrito.")
+                return redirect('cart_summary')
+
+            except CouponUnavailable as e:
+                request.session.pop('coupon_code', None)
+                request.session.pop('coupon_discount', None)
+                messages.warning(request, f'El cupón ya no es válido: {e}')
+                return redirect('billing_info')
+
             except Exception as e:
                 print(f"Error creando orden con transferencia bancaria: {e}")
                 import traceback
@@ -579,7 +559,9 @@ def evaluate_payment(request):
         tbk_id_sesion = request.GET.get('TBK_ID_SESION')
         
         if tbk_token or tbk_orden_compra or tbk_id_sesion:
-            # Usuario canceló - NO hay orden creada aún, solo limpiar sesión
+            # Usuario canceló - NO hay orden creada aún, liberar el stock y limpiar sesión
+            release_stock(request.session.get('pending_buy_order'))
+            release_coupon(request.session.get('pending_buy_order'))
             request.session.pop('pending_buy_order', None)
             request.session.pop('pending_payment', None)
             
@@ -624,20 +606,20 @@ def evaluate_payment(request):
                 if not pending_buy_order:
                     raise ValueError("No se encontró información de la orden pendiente")
                 
-                # CREAR LA ORDEN AHORA
-                order = create_order_from_session(request)
-                order.buy_order = pending_buy_order
-                order.session_id = request.session.session_key
-                order.payment_method='transbank',
-                order.order_status='paid',
-                order.paid = True
-                order.payment_status = 'APPROVED'
-                order.save()
-                
-                # Actualizar orden con datos de Transbank
-                update_order_with_transaction(order, response)
+                # CREAR LA ORDEN AHORA (un solo INSERT con el buy_order y los datos de Transbank)
+                order = create_order_from_session(
+                    request,
+                    transaction_response=response,
+                    buy_order=pending_buy_order,
+                    session_id=request.session.session_key,
+                    payment_method='transbank',
+                    order_status='paid',
+                )
                 
-                order_items = order.orderitem_set.all()
+                order_items = list(order.orderitem_set.select_related('product'))
+
+                # Descontar el stock reservado (UPDATE condicional, nunca queda negativo)
+                commit_stock(order.buy_order)
                 
                 # Limpiar sesión y carrito
                 request.session.pop('pending_buy_order', None)
@@ -677,7 +659,9 @@ def evaluate_payment(request):
                     'transaction': transaction_data,
                 })
             else:
-                # ❌ PAGO RECHAZADO - No hay orden creada, solo limpiar sesión
+                # ❌ PAGO RECHAZADO - No hay orden creada, liberar el stock y limpiar sesión
+                release_stock(request.session.get('pending_buy_order'))
+                release_coupon(request.session.get('pending_buy_order'))
                 request.session.pop('pending_buy_order', None)
                 request.session.pop('pending_payment', None)
                 
@@ -695,7 +679,9 @@ def evaluate_payment(request):
             import traceback
             traceback.print_exc()
             
-            # Limpiar sesión pendiente (no hay orden que eliminar)
+            # Limpiar sesión pendiente (no hay orden que eliminar) y liberar el stock
+            release_stock(request.session.get('pending_buy_order'))
+            release_coupon(request.session.get('pending_buy_order'))
             request.session.pop('pending_buy_order', None)
             request.session.pop('pending_payment', None)
             
@@ -712,6 +698,12 @@ def evaluate_payment(request):
 
 def update_order_with_transaction(order, transaction_response):
     """Actualiza la orden con los datos de la transacción de Transbank"""
+    apply_transaction(order, transaction_response)
+    order.save()
+
+
+def apply_transaction(order, transaction_response):
+    """Copia los datos de la transacción de Transbank a la orden, sin guardarla"""
     
     # Procesar fecha de transacción
     transaction_date_str = transaction_response.get('transaction_date')
@@ -733,8 +725,6 @@ def update_order_with_transaction(order, transaction_response):
     order.commerce_code = transaction_response.get('commerce_code') or settings.TRANSBANK_COMMERCE_CODE
     order.accounting_date = transaction_response.get('accounting_date')
     order.transaction_status = transaction_response.get('status')
-    
-    order.save()
 
 
 def clear_cart_and_session(request):
@@ -743,6 +733,8 @@ def clear_cart_and_session(request):
     """
     # Limpiar sesión
     request.session.pop('session_key', None)
+    request.session.pop('cart_count', None)
+    request.session.pop('cart_dirty', None)
     request.session.pop('shipping_info', None)
     request.session.pop('personal_info', None)
     request.session.pop('guest_info', None)
@@ -761,13 +753,16 @@ def clear_cart_and_session(request):
             del request.session[key]
 
 
-def create_order_from_session(request, transaction_response=None):
+def create_order_from_session(request, transaction_response=None, **fields):
+    """
+    Crea la orden de un pago ya autorizado a partir del carrito en sesión, con
+    una sola transacción (ver Order.place). `fields` se asignan a la orden antes
+    del INSERT (buy_order, estado, etc.).
+    """
 
     cart = Cart(request)
-    cart_products = cart.get_products()
-    quantities = cart.get_quants()
-    international_status = cart.get_international_status()
-    cart_total = cart.cart_total()
+    snapshot = cart.snapshot()
+    cart_total = snapshot.total
 
     # ===== OBTENER CUPÓN DE LA SESIÓN =====
     coupon_code = request.session.get('coupon_code')
@@ -809,23 +804,13 @@ def create_order_from_session(request, transaction_response=None):
             pass
 
     # Verificar si hay productos internacionales
-    has_international = any(international_status.values())
+    has_international = snapshot.has_international
 
-    # ===== VALIDAR Y OBTENER CUPÓN =====
+    # ===== CUPÓN DEL PAGO =====
+    # Transbank ya cobró el total con el descuento de la sesión; el uso se reclamó
+    # en billing_info (reserve_coupon) y aquí solo se confirma
     if coupon_code:
-        try:
-            coupon = Coupon.objects.get(code=coupon_code)
-            # Verificar que el cupón sigue siendo válido
-            can_use, message = coupon.can_use(user=user, amount=cart_total)
-            if not can_use:
-                # Si el cupón ya no es válido, no aplicar descuento
-                coupon = None
-                coupon_discount = 0
-                amount_pay = cart_total
-        except Coupon.DoesNotExist:
-            coupon = None
-            coupon_discount = 0
-            amount_pay = cart_total
+        coupon = Coupon.objects.filter(code=coupon_code).first()
 
     # Crear la orden (buy_order se genera automáticamente)
     order = Order(
@@ -840,52 +825,20 @@ def create_order_from_session(request, transaction_response=None):
         coupon_discount=coupon_discount,  # NUEVO: Monto del descuento
         amount_pay=amount_pay,  # Total final con descuento
         workshop=workshop,
-        has_international_items=has_international
+        has_international_items=has_international,
+        **fields
     )
-    
-    # Guardar - esto generará automáticamente el buy_order
-    order.save()
+    if transaction_response:
+        apply_transaction(order, transaction_response)
+
+    # Orden + ítems + confirmación del uso del cupón: buy_order definitivo en el INSERT (sin segunda escritura)
+    order.place(snapshot.lines, coupon=coupon, coupon_reserved=True)
 
-    # ===== REGISTRAR USO DEL CUPÓN =====
+    # Limpiar cupón de la sesión
     if coupon:
-        try:
-            # Crear registro de uso
-            CouponUsage.objects.create(
-                coupon=coupon,
-                user=user,
-                order=order
-            )
-            
-            # Incrementar contador de usos
-            coupon.times_used += 1
-            coupon.save()
-            
-            # Limpiar cupón de la sesión
-            if 'coupon_code' in request.session:
-                del request.session['coupon_code']
-            if 'coupon_discount' in request.session:
-                del request.session['coupon_discount']
-                
-        except Exception as e:
-            # Log del error pero no fallar la orden
-            print(f"Error al registrar uso del cupón: {e}")
-
-    # Crear los ítems de la orden
-    for product in cart_products:
-        price = product.sale_price if product.is_sale else product.price
-        quantity = quantities.get(str(product.id), 0)
-        is_international = international_status.get(str(product.id), False)
-        
-        if quantity > 0:
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                user=user,
-                quantity=quantity,
-                price=price,
-                is_international=is_international
-            )
-    
+        request.session.pop('coupon_code', None)
+        request.session.pop('coupon_discount', None)
+
     return order
 
 
@@ -906,11 +859,9 @@ def confirmed_orders_dash(request):
                 order = Order.objects.get(id=order_id)
                 
                 if action == 'mark_shipped':
-                    # Marcar como enviada
-                    now = datetime.datetime.now()
+                    # Marcar como enviada (Order.save asigna date_shipped)
                     order.shipped = True
-                    order.date_shipped = now
-                    order.save()
+                    order.save(update_fields=['shipped'])
                     
                     messages.success(request, f"✅ Orden #{order.buy_order} marcada como enviada.")
                     return redirect('confirmed_orders_dash')
@@ -946,7 +897,7 @@ def shipped_orders_dash(request):
                     # Marcar como no enviada
                     order.shipped = False
                     order.date_shipped = None
-                    order.save()
+                    order.save(update_fields=['shipped', 'date_shipped'])
                     
                     messages.success(request, f"✅ Orden #{order.buy_order} marcada como no enviada.")
                     return redirect('shipped_orders_dash')
@@ -982,9 +933,14 @@ def pending_orders_dash(request):
                 order = Order.objects.get(id=order_id)
                 
                 if action == 'confirm_payment':
-                    # Cambiar estado a pagado
+                    # Cambiar estado a pagado solo si sigue pendiente (doble click o pestaña vieja)
+                    if not Order.objects.filter(pk=order.pk, order_status='pending').update(order_status='paid'):
+                        messages.warning(request, f"⚠️ La orden #{order.buy_order} ya fue procesada.")
+                        return redirect('pending_orders_dash')
                     order.order_status = 'paid'
-                    order.save()
+
+                    # Descontar el stock retenido
+                    commit_stock(order.buy_order)
                     
                     # Enviar email de confirmación al cliente
                     try:
@@ -1004,9 +960,11 @@ def pending_orders_dash(request):
                     return redirect('pending_orders_dash')
                 
                 elif action == 'cancel_order':
-                    # Cancelar orden
-                    order.order_status = 'cancelled'
-                    order.save()
+                    # Cancelar orden (solo si sigue pendiente) y liberar el stock retenido
+                    if not Order.objects.filter(pk=order.pk, order_status='pending').update(order_status='cancelled'):
+                        messages.warning(request, f"⚠️ La orden #{order.buy_order} ya fue procesada.")
+                        return redirect('pending_orders_dash')
+                    release_stock(order.buy_order)
                     
                     messages.warning(request, f"❌ Orden #{order.buy_order} cancelada.")
                     return redirect('pending_orders_dash')
@@ -1069,25 +1027,16 @@ def validate_coupon(request):
         if not code:
             return JsonResponse({'valid': False, 'message': 'Ingresa un código de cupón'})
         
-        try:
-            coupon = Coupon.objects.get(code=code)
-        except Coupon.DoesNotExist:
-            return JsonResponse({'valid': False, 'message': 'Cupón inválido'})
-        
         # Obtener monto del carrito
-        from cart.cart import Cart
         cart = Cart(request)
         cart_total = float(cart.cart_total())
         
-        # Verificar si puede usar el cupón
-        user = request.user if request.user.is_authenticated else None
-        can_use, message = coupon.can_use(user=user, amount=cart_total)
-        
-        if not can_use:
-            return JsonResponse({'valid': False, 'message': message})
+        # Verificar si puede usar el cupón y calcular descuento
+        evaluation = evaluate_coupon(request, code, cart_total)
+        if not evaluation.valid:
+            return JsonResponse({'valid': False, 'message': evaluation.message})
         
-        # Calcular descuento
-        discount_amount = float(coupon.calculate_discount(cart_total))
+        discount_amount = evaluation.discount
         new_total = cart_total - discount_amount
         
         # Guardar en sesión
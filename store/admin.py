@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Category, Customer, Product, Profile, Compatibility, Provider
+from .models import Category, Customer, Product, Profile, Compatibility, Provider, EmailJob
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Register your models here.
 admin.site.register(Category)
@@ -29,6 +30,7 @@ admin.site.register(User, UserAdmin)
 class CompatibilityInline(admin.TabularInline):
     model = Compatibility
     extra = 0
+    raw_id_fields = ['serie']
 
 class ProductAdmin(admin.ModelAdmin):
     from django.contrib import admin
@@ -40,7 +42,7 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['sku', 'name', 'part_number', 'description']
     
     # Filtros en el panel lateral
-    list_filter = ['category', 'provider', 'is_sale']
+    list_filter = ['category', 'provider', 'is_sale', 'availability']
     
     # Campos a mostrar en la lista
     list_display = ['sku', 'name', 'category', 'price', 'stock', 'stock_international', 'provider']
@@ -51,3 +53,17 @@ class ProductAdmin(admin.ModelAdmin):
     # Paginación
     list_per_page = 50
 
+
+
+@admin.register(EmailJob)
+class EmailJobAdmin(admin.ModelAdmin):
+    list_display = ['idempotency_key', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['idempotency_key', 'last_error']
+    readonly_fields = ['created_at', 'sent_at', 'locked_at']
+    actions = ['retry_now']
+
+    @admin.action(description='Reintentar ahora')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} email(s) vueltos a la cola')
@@ -0,0 +1,134 @@
+import re
+import threading
+from bisect import bisect_left
+
+from django.urls import reverse
+
+from store.catalog import get_catalog_version
+from store.facets import IN_STOCK
+from store.models import Product
+from store.search import normalize
+
+
+# Largo mínimo del texto para sugerir
+MIN_QUERY_LENGTH = 2
+
+# Cuántas claves se recorren como máximo por término (prefijos muy cortos)
+MAX_SCAN = 5000
+
+NON_ALNUM_RE = re.compile(r'[^0-9a-z]')
+
+# Tipo de coincidencia: los números de parte y SKU van antes que las palabras del nombre
+CODE_MATCH = 0
+NAME_MATCH = 1
+
+
+def compact(text):
+    """Normaliza y deja solo letras y dígitos ('AB-391 177' -> 'ab391177')"""
+    return NON_ALNUM_RE.sub('', normalize(text))
+
+
+class PrefixIndex:
+    """
+    Arreglo ordenado de claves (número de parte, SKU y palabras del nombre)
+    de los productos con stock. Las búsquedas por prefijo son un bisect sobre
+    el arreglo, sin consultar la base de datos.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.keys = []
+        self.entries = []
+        self.products = {}
+
+    @classmethod
+    def build(cls, version=None):
+        index = cls(version)
+        rows = (
+            Product.objects.filter(IN_STOCK)
+            .exclude(name__isnull=True).exclude(name='')
+            .values_list('id', 'part_number', 'sku', 'name', 'price', 'is_sale', 'sale_price', 'availability')
+        )
+        pairs = []
+        for product_id, part_number, sku, name, price, is_sale, sale_price, availability in rows.iterator(chunk_size=2000):
+            index.products[product_id] = {
+                'id': product_id,
+                'name': name,
+                'part_number': part_number or '',
+                'price': float(sale_price if is_sale else price),
+                'stock_type': availability,
+            }
+            for code in {compact(part_number), compact(sku)}:
+                if code:
+                    pairs.append((code, CODE_MATCH, product_id))
+            for word in set(normalize(name).split()):
+                word = compact(word)
+                if word:
+                    pairs.append((word, NAME_MATCH, product_id))
+
+        pairs.sort()
+        index.keys = [key for key, _, _ in pairs]
+        index.entries = [(kind, product_id) for _, kind, product_id in pairs]
+        return index
+
+    def _matches(self, prefix):
+        """ids que tienen alguna clave con ese prefijo, con su mejor tipo de coincidencia"""
+        found = {}
+        position = bisect_left(self.keys, prefix)
+        end = min(position + MAX_SCAN, len(self.keys))
+        while position < end and self.keys[position].startswith(prefix):
+            kind, product_id = self.entries[position]
+            exact = self.keys[position] == prefix
+            rank = (kind, not exact)
+            if product_id not in found or rank < found[product_id]:
+                found[product_id] = rank
+            position += 1
+        return found
+
+    def lookup(self, query, limit=10):
+        """Los `limit` mejores productos para el texto escrito"""
+        whole = compact(query)
+        if len(whole) < MIN_QUERY_LENGTH:
+            return []
+
+        # Número de parte completo (con o sin guiones/espacios)
+        found = self._matches(whole)
+
+        # Varias palabras: todas deben coincidir como prefijo de alguna palabra
+        words = [compact(word) for word in normalize(query).split()]
+        words = [word for word in words if word]
+        if len(words) > 1:
+            per_word = [self._matches(word) for word in words]
+            common = set(per_word[0]).intersection(*per_word[1:])
+            for product_id in common:
+                rank = max(matches[product_id] for matches in per_word)
+                if product_id not in found or rank < found[product_id]:
+                    found[product_id] = rank
+
+        ranked = sorted(found, key=lambda product_id: (found[product_id], self.products[product_id]['name']))
+        return [self.products[product_id] for product_id in ranked[:limit]]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_prefix_index():
+    """Índice del proceso; se reconstruye cuando cambia la versión del catálogo"""
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = PrefixIndex.build(version)
+            index = _index
+    return index
+
+
+def suggest(query, limit=10):
+    """Sugerencias listas para JSON, con la URL de cada producto"""
+    results = []
+    for product in get_prefix_index().lookup(query, limit):
+        results.append({**product, 'url': reverse('product', args=[product['id']])})
+    return results
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+
+from store.models import CatalogVersion
+
+
+# Cada cuántos segundos un proceso vuelve a consultar la versión en la BD
+VERSION_CHECK_SECONDS = getattr(settings, 'CATALOG_VERSION_CHECK_SECONDS', 30)
+
+_state = {'version': None, 'checked_at': 0.0}
+
+
+def get_catalog_version(force=False):
+    """
+    Retorna la versión del catálogo. La consulta a la BD se hace como máximo
+    una vez cada VERSION_CHECK_SECONDS por proceso.
+    """
+    now = time.monotonic()
+    if force or _state['version'] is None or now - _state['checked_at'] >= VERSION_CHECK_SECONDS:
+        _state['version'] = CatalogVersion.current()
+        _state['checked_at'] = now
+    return _state['version']
+
+
+def bump_catalog_version():
+    """Marca el catálogo como modificado para que todos los procesos reconstruyan sus índices"""
+    CatalogVersion.bump()
+    return get_catalog_version(force=True)
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from store.models import Compatibility, Product
+
+
+# Segundos que una ficha vive en el caché del proceso. Las ediciones hechas en
+# este proceso la invalidan al instante (invalidate_product_detail); las de otros
+# procesos (cargas, otros workers) se ven a más tardar al vencer este plazo.
+PRODUCT_DETAIL_CACHE_SECONDS = getattr(settings, 'PRODUCT_DETAIL_CACHE_SECONDS', 5 * 60)
+
+
+def _cache_key(product_id):
+    return f'product:detail:{product_id}'
+
+
+def build_product_detail(product_id):
+    """
+    Ficha del producto con su árbol marca -> modelo -> [series] ya armado.
+    Retorna None si el producto no existe.
+    """
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None:
+        return None
+
+    compat_data = {}
+    compatibilities = Compatibility.objects.filter(product_id=product_id).values_list(
+        'serie__model__brand__name', 'serie__model__name', 'serie__name'
+    ).order_by('serie__model__brand__name', 'serie__model__name', 'serie__name')
+    for brand, model, serie in compatibilities:
+        compat_data.setdefault(brand, {}).setdefault(model, []).append(serie)
+
+    return {'product': product, 'compat_data': compat_data}
+
+
+def get_product_detail(product_id):
+    """
+    Ficha del producto desde el caché del proceso; si no está (o venció) se
+    arma en el request. Los ids inexistentes no se guardan: un 404 cuesta una
+    consulta por PK y nadie puede llenar el caché pidiendo ids al azar.
+    Retorna None si el producto no existe.
+    """
+    detail = cache.get(_cache_key(product_id))
+    if detail is None:
+        detail = build_product_detail(product_id)
+        if detail is not None:
+            cache.set(_cache_key(product_id), detail, PRODUCT_DETAIL_CACHE_SECONDS)
+    return detail
+
+
+def invalidate_product_detail(product_id):
+    """Descarta la ficha en el caché de este proceso: la próxima visita la arma de nuevo"""
+    cache.delete(_cache_key(product_id))
@@ -1,9 +1,10 @@
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils.html import strip_tags
-from threading import Thread
 import logging
 
+from store.jobs import enqueue_email
+
 
 logger = logging.getLogger(__name__)
 
@@ -69,18 +70,8 @@ def send_registration_email(user_email, full_name):
 
 
 def send_registration_email_async(user_email, full_name):
-    """Envía email de bienvenida de forma asíncrona"""
-    def send_in_background():
-        try:
-            send_registration_email(user_email, full_name)
-        except Exception as e:
-            # El error ya se imprimió en send_registration_email
-            pass
-    
-    email_thread = Thread(target=send_in_background)
-    email_thread.daemon = True
-    email_thread.start()
-    logger.info("[EMAIL] Thread iniciado para envío asíncrono")
+    """Encola el email de bienvenida (lo envía el worker process_email_jobs)"""
+    enqueue_email('registration', f'registration:{user_email.lower()}', email=user_email, full_name=full_name)
 
 
 def send_order_confirmation_email(order):
@@ -462,28 +453,23 @@ def send_order_confirmation_email(order):
 
 
 def send_order_confirmation_email_async(order):
-    """Envía email de confirmación de orden de forma asíncrona"""
-    def send_in_background():
-        try:
-            send_order_confirmation_email(order)
-        except Exception as e:
-            logger.error(f"[ORDER EMAIL ASYNC] Error en thread: {e}")
-    
-    email_thread = Thread(target=send_in_background)
-    email_thread.daemon = True
-    email_thread.start()
-    # logger.info(f"[ORDER EMAIL] Thread iniciado para orden #{order.id}")
+    """Encola el email de confirmación de la orden (una sola vez por orden)"""
+    enqueue_email('order_confirmation', f'order_confirmation:{order.buy_order}', order_id=order.pk)
 
 
-def send_provider_order_notification(order):
-    """Envía email a cada proveedor con sus productos de la orden"""
+def send_provider_order_notification(order, provider_id=None):
+    """
+    Envía email a cada proveedor con sus productos de la orden (o solo al
+    proveedor `provider_id`). Un error de envío se propaga para que la cola lo
+    reintente.
+    """
     logger.info(f"[PROVIDER EMAIL] Iniciando envío para orden #{order.id}")
     
     # Agrupar items por proveedor
     items_by_provider = {}
     for item in order.orderitem_set.all():
         provider = item.product.provider
-        if provider:
+        if provider and (provider_id is None or provider.pk == provider_id):
             if provider not in items_by_provider:
                 items_by_provider[provider] = []
             items_by_provider[provider].append(item)
@@ -663,20 +649,20 @@ def send_provider_order_notification(order):
             logger.info(f"[PROVIDER EMAIL] ✅ Email enviado a {provider.name} ({provider.email})")
         except Exception as e:
             logger.error(f"[PROVIDER EMAIL] ❌ Error enviando a {provider.name}: {e}")
+            raise
 
 
 def send_provider_order_notification_async(order):
-    """Envía emails a proveedores de forma asíncrona"""
-    def send_in_background():
-        try:
-            send_provider_order_notification(order)
-        except Exception as e:
-            logger.error(f"[PROVIDER EMAIL ASYNC] Error en thread: {e}")
-    
-    email_thread = Thread(target=send_in_background)
-    email_thread.daemon = True
-    email_thread.start()
-    logger.info(f"[PROVIDER EMAIL] Thread iniciado para orden #{order.id}")
+    """Encola un email por proveedor de la orden (cada uno se reintenta por separado)"""
+    provider_ids = (
+        order.orderitem_set.filter(product__provider__isnull=False)
+        .values_list('product__provider_id', flat=True).distinct()
+    )
+    for provider_id in provider_ids:
+        enqueue_email(
+            'provider_notification', f'provider_notification:{order.buy_order}:{provider_id}',
+            order_id=order.pk, provider_id=provider_id,
+        )
 
 
 def send_pending_order_email(order):
@@ -1034,14 +1020,5 @@ def send_pending_order_email(order):
 
 
 def send_pending_order_email_async(order):
-    """Envía email de orden pendiente de forma asíncrona"""
-    def send_in_background():
-        try:
-            send_pending_order_email(order)
-        except Exception as e:
-            logger.error(f"[PENDING ORDER EMAIL ASYNC] Error en thread: {e}")
-    
-    email_thread = Thread(target=send_in_background)
-    email_thread.daemon = True
-    email_thread.start()
-    logger.info(f"[PENDING ORDER EMAIL] Thread iniciado para orden #{order.id}")
\ No newline at end of file
+    """Encola el email de orden pendiente por transferencia (una sola vez por orden)"""
+    enqueue_email('pending_order', f'pending_order:{order.buy_order}', order_id=order.pk)
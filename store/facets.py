@@ -0,0 +1,222 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+
+from store.catalog import get_catalog_version
+from store.models import Category, Compatibility, Product, VehicleSerie
+
+
+# Productos con stock nacional o internacional (columna desnormalizada Product.availability)
+IN_STOCK = Q(availability__in=Product.IN_STOCK_AVAILABILITY)
+
+# Categorías que no se muestran en el listado general
+HIDDEN_CATEGORIES = ['BRAKE GR SPORT & ROGUE', 'WHEEL']
+
+# Cantidad máxima de árboles de compatibilidad guardados por proceso
+COMPAT_TREE_CACHE_SIZE = getattr(settings, 'COMPAT_TREE_CACHE_SIZE', 256)
+
+
+class FacetIndex:
+    """
+    Índice en memoria de los productos con stock.
+
+    Para cada valor de filtro (categoría, subcategoría, marca, modelo, serie y
+    tipo de stock) guarda el conjunto de ids de producto que lo cumplen, de modo
+    que cualquier combinación de filtros se resuelve intersectando conjuntos en
+    lugar de hacer JOINs contra Compatibility.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.all_ids = set()
+        self.unnamed_ids = set()
+        self.by_category = {}
+        self.by_subcategory = {}
+        self.by_brand = {}
+        self.by_model = {}
+        self.by_serie = {}
+        self.by_stock_type = {'nacional': set(), 'internacional': set()}
+        self.category_names = {}
+        self.category_of = {}
+        self.subcategory_of = {}
+        self.compat_of = {}
+        self.vehicles = {}
+
+    @classmethod
+    def build(cls, version=None):
+        """Construye el índice completo con cuatro consultas"""
+        index = cls(version)
+        index.category_names = dict(Category.objects.values_list('id', 'name'))
+
+        # serie_id -> (marca, modelo, serie); tablas chicas, se cargan completas
+        index.vehicles = {
+            serie_id: (brand, model, serie)
+            for serie_id, serie, model, brand in VehicleSerie.objects.values_list(
+                'id', 'name', 'model__name', 'model__brand__name'
+            )
+        }
+
+        products = Product.objects.filter(IN_STOCK).values_list(
+            'id', 'category_id', 'subcategory', 'availability', 'name'
+        )
+        for row in products.iterator(chunk_size=2000):
+            index._add_product(*row)
+
+        compatibilities = Compatibility.objects.filter(
+            product__availability__in=Product.IN_STOCK_AVAILABILITY
+        ).values_list('product_id', 'serie_id')
+        for row in compatibilities.iterator(chunk_size=5000):
+            index._add_compatibility(*row)
+
+        return index
+
+    def _add_product(self, product_id, category_id, subcategory, availability, name):
+        self.all_ids.add(product_id)
+        if not name:
+            self.unnamed_ids.add(product_id)
+
+        self.category_of[product_id] = category_id
+        category_name = self.category_names.get(category_id)
+        if category_name is not None:
+            self.by_category.setdefault(category_name, set()).add(product_id)
+
+        if subcategory:
+            self.subcategory_of[product_id] = subcategory
+            self.by_subcategory.setdefault(subcategory, set()).add(product_id)
+
+        if availability in self.by_stock_type:
+            self.by_stock_type[availability].add(product_id)
+
+    def _add_compatibility(self, product_id, serie_id):
+        brand, model, serie = self.vehicles[serie_id]
+        self.compat_of.setdefault(product_id, set()).add(serie_id)
+        self.by_brand.setdefault(brand, set()).add(product_id)
+        self.by_model.setdefault(model, set()).add(product_id)
+        self.by_serie.setdefault(serie, set()).add(product_id)
+
+    def match(self, category=None, subcategory=None, brand=None, model=None, serie=None, stock_type=None):
+        """Retorna un conjunto nuevo con los ids que cumplen todos los filtros indicados"""
+        sets = []
+        if category:
+            sets.append(self.by_category.get(category, set()))
+        if subcategory:
+            sets.append(self.by_subcategory.get(subcategory, set()))
+        if brand:
+            sets.append(self.by_brand.get(brand.strip(), set()))
+        if model:
+            sets.append(self.by_model.get(model.strip(), set()))
+        if serie:
+            sets.append(self.by_serie.get(serie.strip(), set()))
+        if stock_type in self.by_stock_type:
+            sets.append(self.by_stock_type[stock_type])
+
+        if not sets:
+            return set(self.all_ids)
+
+        # Intersectar partiendo del conjunto más chico
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def all_categories(self, exclude=()):
+        """Todas las categorías del catálogo, ordenadas por nombre"""
+        return sorted(
+            ({'id': category_id, 'name': name} for category_id, name in self.category_names.items() if name not in exclude),
+            key=lambda category: category['name'],
+        )
+
+    def categories_for(self, product_ids, exclude=()):
+        """Categorías presentes en el conjunto de productos, ordenadas por nombre"""
+        category_ids = {self.category_of[product_id] for product_id in product_ids}
+        return sorted(
+            (
+                {'id': category_id, 'name': self.category_names[category_id]}
+                for category_id in category_ids
+                if category_id in self.category_names and self.category_names[category_id] not in exclude
+            ),
+            key=lambda category: category['name'],
+        )
+
+    def subcategories_for(self, product_ids):
+        """Subcategorías no vacías presentes en el conjunto de productos"""
+        subcategory_of = self.subcategory_of
+        return sorted({subcategory_of[product_id] for product_id in product_ids if product_id in subcategory_of})
+
+    def compat_tree_for(self, product_ids):
+        """Árbol marca -> modelo -> [series] de las compatibilidades del conjunto de productos"""
+        serie_ids = set()
+        for product_id in product_ids:
+            serie_ids.update(self.compat_of.get(product_id, ()))
+
+        compat_data = {}
+        for brand, model, serie in sorted(self.vehicles[serie_id] for serie_id in serie_ids):
+            compat_data.setdefault(brand, {}).setdefault(model, []).append(serie)
+        return compat_data
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_facet_index():
+    """Retorna el índice del proceso, reconstruyéndolo si cambió la versión del catálogo"""
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = FacetIndex.build(version)
+            index = _index
+    return index
+
+
+class CompatTreeCache:
+    """
+    Caché LRU de árboles de compatibilidad, uno por combinación de categoría,
+    subcategoría y tipo de stock. Se vacía cuando cambia la versión del catálogo.
+    """
+
+    def __init__(self, maxsize=COMPAT_TREE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version = None
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, index, category=None, subcategory=None, stock_type=None):
+        if stock_type not in index.by_stock_type:
+            stock_type = None
+        key = (category or '', subcategory or '', stock_type or '')
+
+        with self._lock:
+            if self.version != index.version:
+                self._trees.clear()
+                self.version = index.version
+            tree = self._trees.get(key)
+            if tree is not None:
+                self._trees.move_to_end(key)
+                return tree
+
+        tree = index.compat_tree_for(index.match(category=category, subcategory=subcategory, stock_type=stock_type))
+
+        with self._lock:
+            if self.version == index.version:
+                self._trees[key] = tree
+                self._trees.move_to_end(key)
+                while len(self._trees) > self.maxsize:
+                    self._trees.popitem(last=False)
+        return tree
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self.version = None
+
+
+_compat_trees = CompatTreeCache()
+
+
+def get_compat_tree(category=None, subcategory=None, stock_type=None):
+    """Árbol marca -> modelo -> [series] para el corte indicado, servido desde memoria"""
+    return _compat_trees.get(get_facet_index(), category, subcategory, stock_type)
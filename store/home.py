@@ -0,0 +1,95 @@
+import random
+import threading
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from store.catalog import get_catalog_version
+from store.facets import get_facet_index
+from store.models import Category, Product
+
+
+# Rieles de productos del home: clave del template -> nombre de la categoría
+FEATURED_CATEGORIES = {
+    'batteries': 'BATTERIES',
+    'rear_axle': 'REAR AXLE',
+    'engine': 'ENGINE',
+}
+
+# Productos por riel
+RAIL_SIZE = 4
+
+# Tiempo máximo en caché del listado de categorías (se invalida antes si cambia el catálogo)
+CATEGORIES_CACHE_SECONDS = 60 * 60
+
+_pools = {'version': None, 'pools': {}}
+_counts = {'version': None, 'counts': {}}
+_lock = threading.Lock()
+
+
+def get_featured_pools():
+    """Ids con stock de cada categoría destacada, precalculados por versión del catálogo"""
+    index = get_facet_index()
+    with _lock:
+        if _pools['version'] != index.version:
+            pools = {}
+            for key, category_name in FEATURED_CATEGORIES.items():
+                ids = set()
+                for name, product_ids in index.by_category.items():
+                    if name.lower() == category_name.lower():
+                        ids |= product_ids
+                pools[key] = tuple(sorted(ids))
+            _pools['pools'] = pools
+            _pools['version'] = index.version
+        return _pools['pools']
+
+
+def get_home_rails():
+    """Muestra aleatoria de cada riel, resuelta con una sola consulta id__in"""
+    samples = {
+        key: random.sample(pool, min(RAIL_SIZE, len(pool)))
+        for key, pool in get_featured_pools().items()
+    }
+    all_ids = [product_id for sample in samples.values() for product_id in sample]
+    products = Product.objects.in_bulk(all_ids) if all_ids else {}
+    return {
+        key: [products[product_id] for product_id in sample if product_id in products]
+        for key, sample in samples.items()
+    }
+
+
+def get_category_counts():
+    """Productos con stock y nombre por categoría, precalculados desde el índice de facetas"""
+    index = get_facet_index()
+    with _lock:
+        if _counts['version'] != index.version:
+            _counts['counts'] = {
+                name: len(product_ids - index.unnamed_ids)
+                for name, product_ids in index.by_category.items()
+            }
+            _counts['version'] = index.version
+        return _counts['counts']
+
+
+def get_categories():
+    """Todas las categorías con su conteo (product_count), en caché por versión del catálogo"""
+    key = f'catalog:categories:{get_catalog_version()}'
+    categories = cache.get_or_set(key, lambda: list(Category.objects.order_by('name')), CATEGORIES_CACHE_SECONDS)
+    counts = get_category_counts()
+    for category in categories:
+        category.product_count = counts.get(category.name, 0)
+    return categories
+
+
+def get_home_categories():
+    """
+    Categorías con al menos un producto (con o sin stock, como siempre mostró
+    el home), en el caché del proceso por versión del catálogo: sin consultas
+    mientras la versión no cambie.
+    """
+    key = f'catalog:home_categories:{get_catalog_version()}'
+    return cache.get_or_set(
+        key,
+        lambda: list(Category.objects.annotate(product_count=Count('product')).filter(product_count__gt=0).order_by('name')),
+        CATEGORIES_CACHE_SECONDS,
+    )
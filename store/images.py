@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from store.models import ImageCheck
+from store.utils import DEFAULT_PRODUCT_IMAGE
+
+
+# Días que una verificación sigue vigente antes de volver a consultar la URL
+IMAGE_CHECK_TTL_DAYS = getattr(settings, 'IMAGE_CHECK_TTL_DAYS', 30)
+
+# Requests HEAD simultáneos
+IMAGE_CHECK_WORKERS = getattr(settings, 'IMAGE_CHECK_WORKERS', 8)
+
+# Máximo de requests por segundo a un mismo host
+IMAGE_CHECK_RATE_PER_HOST = getattr(settings, 'IMAGE_CHECK_RATE_PER_HOST', 10)
+
+# Reintentos ante errores de conexión, 429 y 5xx (con backoff exponencial)
+IMAGE_CHECK_RETRIES = getattr(settings, 'IMAGE_CHECK_RETRIES', 2)
+
+IMAGE_CHECK_TIMEOUT = 5
+
+
+class HostRateLimiter:
+    """Espacia los requests a cada host para no superar `rate` por segundo"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ImageVerifier:
+    """
+    Verifica URLs de imagen con HEAD concurrentes sobre una sesión con pool de
+    conexiones. Los resultados se guardan en ImageCheck y solo se vuelven a
+    consultar las URLs nuevas o con la verificación vencida.
+    """
+
+    def __init__(self, workers=IMAGE_CHECK_WORKERS, rate_per_host=IMAGE_CHECK_RATE_PER_HOST,
+                 retries=IMAGE_CHECK_RETRIES, ttl_days=IMAGE_CHECK_TTL_DAYS, default_url=DEFAULT_PRODUCT_IMAGE):
+        self.workers = workers
+        self.ttl = timedelta(days=ttl_days)
+        self.default_url = default_url
+        self.limiter = HostRateLimiter(rate_per_host)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['HEAD'],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def check(self, url):
+        """Código de estado de la URL (None si no hubo respuesta)"""
+        self.limiter.wait(url)
+        try:
+            response = self.session.head(url, timeout=IMAGE_CHECK_TIMEOUT, allow_redirects=True)
+            return response.status_code
+        except requests.exceptions.RequestException:
+            return None
+
+    def cached(self, urls):
+        """Verificaciones vigentes guardadas: url -> is_valid"""
+        since = timezone.now() - self.ttl
+        results = {}
+        urls = list(urls)
+        for start in range(0, len(urls), 500):
+            results.update(
+                ImageCheck.objects.filter(url__in=urls[start:start + 500], checked_at__gte=since)
+                .values_list('url', 'is_valid')
+            )
+        return results
+
+    def verify_many(self, urls, force=False):
+        """
+        Retorna {url: url_resuelta}: la misma URL si responde 200 o la imagen
+        por defecto si no. Con force=True se ignora el caché.
+        """
+        urls = {url for url in urls if url and str(url).strip()}
+        valid = {} if force else self.cached(urls)
+        pending = [url for url in urls if url not in valid]
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                statuses = dict(zip(pending, executor.map(self.check, pending)))
+
+            now = timezone.now()
+            checks = []
+            for url, status in statuses.items():
+                valid[url] = status == 200
+                # Los errores de conexión no se guardan: se reintentan en la próxima corrida
+                if status is not None:
+                    checks.append(ImageCheck(url=url, is_valid=status == 200, last_status=status, checked_at=now))
+            if checks:
+                ImageCheck.objects.bulk_create(
+                    checks,
+                    batch_size=500,
+                    update_conflicts=True,
+                    unique_fields=['url'],
+                    update_fields=['is_valid', 'last_status', 'checked_at'],
+                )
+
+        return {url: url if is_valid else self.default_url for url, is_valid in valid.items()}
+
+
+def verify_images(urls, default_url=DEFAULT_PRODUCT_IMAGE, force=False):
+    """Atajo para verificar un lote de URLs con la configuración por defecto"""
+    return ImageVerifier(default_url=default_url).verify_many(urls, force=force)
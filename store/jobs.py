@@ -0,0 +1,141 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from store.models import EmailJob
+
+
+logger = logging.getLogger(__name__)
+
+# Emails enviados en paralelo por el worker (cada hilo usa su propia conexión SMTP y a la BD)
+EMAIL_JOB_WORKERS = getattr(settings, 'EMAIL_JOB_WORKERS', 4)
+
+# Intentos antes de dejar el job como fallido
+EMAIL_JOB_MAX_ATTEMPTS = getattr(settings, 'EMAIL_JOB_MAX_ATTEMPTS', 6)
+
+# Espera antes del primer reintento; se duplica en cada intento hasta EMAIL_JOB_RETRY_MAX_SECONDS
+EMAIL_JOB_RETRY_BASE_SECONDS = getattr(settings, 'EMAIL_JOB_RETRY_BASE_SECONDS', 60)
+EMAIL_JOB_RETRY_MAX_SECONDS = getattr(settings, 'EMAIL_JOB_RETRY_MAX_SECONDS', 6 * 60 * 60)
+
+# Un job 'running' más antiguo que esto se considera abandonado (worker reiniciado) y se vuelve a tomar
+EMAIL_JOB_LOCK_SECONDS = getattr(settings, 'EMAIL_JOB_LOCK_SECONDS', 10 * 60)
+
+
+def enqueue_email(kind, idempotency_key, **payload):
+    """
+    Encola un email y retorna de inmediato. Si ya existe un job con la misma
+    llave (p. ej. el mismo tipo de email para la misma orden) no se encola de
+    nuevo. Retorna (job, created).
+    """
+    try:
+        return EmailJob.objects.get_or_create(
+            idempotency_key=idempotency_key,
+            defaults={'kind': kind, 'payload': payload},
+        )
+    except IntegrityError:
+        # Otro request encoló la misma llave entre el SELECT y el INSERT
+        return EmailJob.objects.get(idempotency_key=idempotency_key), False
+
+
+def _order(payload):
+    from payment.models import Order
+    return Order.objects.get(pk=payload['order_id'])
+
+
+def _send_registration(payload):
+    from store.emails import send_registration_email
+    send_registration_email(payload['email'], payload['full_name'])
+
+
+def _send_order_confirmation(payload):
+    from store.emails import send_order_confirmation_email
+    send_order_confirmation_email(_order(payload))
+
+
+def _send_provider_notification(payload):
+    from store.emails import send_provider_order_notification
+    send_provider_order_notification(_order(payload), provider_id=payload.get('provider_id'))
+
+
+def _send_pending_order(payload):
+    from store.emails import send_pending_order_email
+    if not send_pending_order_email(_order(payload)):
+        raise RuntimeError('send_pending_order_email no pudo enviar el email')
+
+
+HANDLERS = {
+    'registration': _send_registration,
+    'order_confirmation': _send_order_confirmation,
+    'provider_notification': _send_provider_notification,
+    'pending_order': _send_pending_order,
+}
+
+
+def retry_delay(attempts):
+    """Backoff exponencial: base, 2x base, 4x base... con tope"""
+    return timedelta(seconds=min(EMAIL_JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), EMAIL_JOB_RETRY_MAX_SECONDS))
+
+
+def claim_jobs(limit):
+    """
+    Toma hasta `limit` jobs vencidos. Cada job se reclama con un UPDATE
+    condicional sobre (status, attempts): si otro worker lo tomó antes, el
+    UPDATE no afecta filas y se salta. Retorna los jobs reclamados.
+    """
+    now = timezone.now()
+    abandoned = Q(status='running', locked_at__lt=now - timedelta(seconds=EMAIL_JOB_LOCK_SECONDS))
+
+    # Abandonados sin intentos restantes
+    EmailJob.objects.filter(abandoned, attempts__gte=EMAIL_JOB_MAX_ATTEMPTS).update(
+        status='failed', last_error='Worker interrumpido en el último intento'
+    )
+
+    candidates = EmailJob.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now) | abandoned
+    ).order_by('next_attempt_at').values_list('pk', 'status', 'attempts')[:limit]
+
+    claimed = []
+    for pk, status, attempts in candidates:
+        if EmailJob.objects.filter(pk=pk, status=status, attempts=attempts).update(
+            status='running', locked_at=now, attempts=attempts + 1
+        ):
+            claimed.append(pk)
+    return list(EmailJob.objects.filter(pk__in=claimed).order_by('next_attempt_at'))
+
+
+def run_job(job):
+    """
+    Envía el email del job y registra el resultado. Si falla se reprograma con
+    backoff hasta agotar EMAIL_JOB_MAX_ATTEMPTS. Retorna True si se envió.
+    """
+    # Solo se actualiza si el job sigue reclamado por este worker
+    mine = EmailJob.objects.filter(pk=job.pk, status='running', locked_at=job.locked_at)
+    try:
+        close_old_connections()
+        HANDLERS[job.kind](job.payload)
+    except Exception as e:
+        if job.attempts >= EMAIL_JOB_MAX_ATTEMPTS:
+            mine.update(status='failed', last_error=repr(e))
+            logger.error('[EMAIL JOB] ❌ %s falló definitivamente tras %s intentos: %s', job.idempotency_key, job.attempts, e)
+        else:
+            mine.update(status='pending', next_attempt_at=timezone.now() + retry_delay(job.attempts), last_error=repr(e))
+            logger.warning('[EMAIL JOB] Intento %s de %s falló, se reintentará: %s', job.attempts, job.idempotency_key, e)
+        return False
+    else:
+        mine.update(status='sent', sent_at=timezone.now(), last_error='')
+        logger.info('[EMAIL JOB] ✅ %s enviado', job.idempotency_key)
+        return True
+    finally:
+        connection.close()
+
+
+def process_jobs(executor, batch_size):
+    """Reclama un lote y lo envía con el pool del worker. Retorna (reclamados, enviados)"""
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0, 0
+    return len(jobs), sum(executor.map(run_job, jobs))
@@ -0,0 +1,118 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, Exists, OuterRef, Q, Case, When, Value, IntegerField
+from django.db.models.expressions import RawSQL
+
+from store.facets import IN_STOCK
+from store.models import Compatibility, Product
+from store.pagination import KeysetPage, KeysetPaginator
+from store.search import get_search_backend
+from store.utils import DEFAULT_PRODUCT_IMAGE
+
+
+# Productos por página en los listados (all_products y páginas de categoría)
+PRODUCTS_PER_PAGE = 15
+
+# Hasta cuántos ids del índice de facetas se pasan como id IN (...); sobre eso se filtra en SQL
+FACET_ID_FILTER_MAX = getattr(settings, 'FACET_ID_FILTER_MAX', 500)
+
+# Tiempo máximo en caché de la primera página de cada listado (se invalida antes si cambia el catálogo)
+FIRST_PAGE_CACHE_SECONDS = 10 * 60
+
+
+def listing_queryset(index, category=None, subcategory=None, brand=None, model=None, serie=None,
+                     stock_type=None, search=''):
+    """Productos con stock y nombre que cumplen los filtros, anotados para el orden del paginador"""
+    products = (
+        Product.objects.filter(IN_STOCK)
+        .exclude(Q(name__isnull=True) | Q(name__exact=''))
+        .select_related('category')
+    )
+
+    # Búsqueda de texto (índice del backend configurado)
+    if search:
+        products = get_search_backend().filter(products, search)
+
+    if stock_type in Product.IN_STOCK_AVAILABILITY:
+        products = products.filter(availability=stock_type)
+
+    if subcategory or brand or model or serie:
+        ids = index.match(category=category, subcategory=subcategory, brand=brand, model=model, serie=serie)
+        if len(ids) <= FACET_ID_FILTER_MAX:
+            # Intersección en el índice de facetas, sin JOIN a compatibilidades
+            products = products.filter(id__in=ids)
+        elif connection.vendor == 'postgresql':
+            # Un solo parámetro (arreglo) en vez de miles de placeholders
+            products = products.filter(RawSQL(
+                f'{connection.ops.quote_name(Product._meta.db_table)}.id = ANY(%s)', (sorted(ids),),
+                output_field=BooleanField(),
+            ))
+        else:
+            products = facet_filter(products, category, subcategory, brand, model, serie)
+    elif category:
+        # Solo categoría: filtro directo, sin pasar ids del índice de facetas
+        products = products.filter(category__name=category)
+
+    return products.annotate(
+        has_default_image=Case(
+            When(image=DEFAULT_PRODUCT_IMAGE, then=Value(1)),
+            When(image__isnull=True, then=Value(1)),
+            When(image='', then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def facet_filter(products, category=None, subcategory=None, brand=None, model=None, serie=None):
+    """
+    Los mismos filtros que FacetIndex.match resueltos en SQL, para facetas
+    amplias: cada filtro de vehículo es un EXISTS independiente sobre
+    compatibilidades (índice serie, product), igual que la intersección del índice.
+    """
+    if category:
+        products = products.filter(category__name=category)
+    if subcategory:
+        products = products.filter(subcategory=subcategory)
+    for lookup, value in (
+        ('serie__model__brand__name', brand), ('serie__model__name', model), ('serie__name', serie),
+    ):
+        if value:
+            products = products.filter(Exists(
+                Compatibility.objects.filter(product=OuterRef('pk'), **{lookup: value.strip()})
+            ))
+    return products
+
+
+def listing_count(index, category=None, subcategory=None, brand=None, model=None, serie=None,
+                  stock_type=None, search=''):
+    """Total exacto desde el índice de facetas; None con búsqueda de texto (se usa un COUNT con tope)"""
+    if search:
+        return None
+    return len(index.match(
+        category=category, subcategory=subcategory, brand=brand, model=model, serie=serie, stock_type=stock_type,
+    ) - index.unnamed_ids)
+
+
+def listing_page(index, cursor=None, page_number=None, **filters):
+    """
+    Página del listado por cursor. La primera página sin búsqueda de texto se
+    guarda en caché por versión del catálogo, porque es la que más se visita.
+    """
+    paginator = KeysetPaginator(listing_queryset(index, **filters), PRODUCTS_PER_PAGE, count=listing_count(index, **filters))
+    if cursor or (page_number not in (None, '', '1', 1)) or filters.get('search'):
+        return paginator.page(cursor=cursor, page_number=page_number)
+
+    query = urlencode(sorted((key, value) for key, value in filters.items() if value))
+    key = f'listing:{index.version}:{hashlib.md5(query.encode()).hexdigest()}'
+    cached = cache.get(key)
+    if cached is None:
+        page = paginator.page()
+        cache.set(key, (page.object_list, page.has_next()), FIRST_PAGE_CACHE_SECONDS)
+        return page
+    object_list, has_next = cached
+    return KeysetPage(object_list, 1, has_next, False, paginator)
@@ -0,0 +1,189 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from store.listing import facet_filter, listing_queryset
+from store.models import Category, Compatibility, Product, Provider, VehicleSerie
+
+
+# Índices de la migración 0016 que se comparan
+BENCHMARK_INDEXES = [
+    'store_product_provider_pn_idx',
+    'store_compat_serie_product_idx',
+]
+
+SEED_CATEGORIES = ['ENGINE', 'BATTERIES', 'REAR AXLE', 'SUSPENSION', 'BRAKES', 'FILTERS']
+SEED_SUBCATEGORIES = ['', 'FILTROS', 'BUJIAS', 'PASTILLAS', 'AMORTIGUADORES']
+SEED_VEHICLES = [
+    (brand, model, str(year))
+    for brand, models in {
+        'TOYOTA': ['HILUX', 'LAND CRUISER', '4RUNNER'],
+        'NISSAN': ['PATROL', 'NAVARA'],
+        'SUZUKI': ['JIMNY', 'GRAND VITARA'],
+        'JEEP': ['WRANGLER', 'CHEROKEE'],
+    }.items()
+    for model in models
+    for year in range(2005, 2025)
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara planes de consulta y latencia de los filtros del catálogo con y sin los índices de la '
+        'migración 0016. Borra los índices dentro de una transacción: solo en desarrollo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Crea N productos sintéticos antes de medir (se descartan al terminar)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Ejecuciones por consulta (se reporta la mediana)'
+        )
+        parser.add_argument(
+            '--allow-lock',
+            action='store_true',
+            help='Permite correr fuera de SQLite (DROP INDEX bloquea store_product durante toda la medición)'
+        )
+
+    def handle(self, *args, **options):
+        # DROP INDEX toma un lock exclusivo sobre la tabla hasta el ROLLBACK: nunca contra producción
+        if not settings.DEBUG:
+            raise CommandError('Solo se puede correr con DEBUG activo (usar una copia de la base)')
+        if connection.vendor != 'sqlite' and not options['allow_lock']:
+            raise CommandError(
+                f'En {connection.vendor} el DROP INDEX bloquea store_product mientras dura la medición; '
+                'correr contra una copia de la base con --allow-lock'
+            )
+
+        # Todo corre en una transacción que se revierte: datos sintéticos e índices borrados no quedan
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+
+            queries = self.queries()
+            self.stdout.write(self.style.WARNING(f'⏱️  Con índices ({connection.vendor})...'))
+            after = self.measure(queries, options['repeat'], 'con_indices')
+
+            self.drop_indexes()
+            self.stdout.write(self.style.WARNING('⏱️  Sin índices...'))
+            before = self.measure(queries, options['repeat'], 'sin_indices')
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'\n{"="*78}')
+        self.stdout.write(f'{"Consulta":<34}{"sin índices":>14}{"con índices":>14}{"mejora":>12}')
+        self.stdout.write(f'{"="*78}')
+        for name in queries:
+            before_ms, after_ms = before[name][0], after[name][0]
+            speedup = before_ms / after_ms if after_ms else 0
+            self.stdout.write(f'{name:<34}{before_ms:>11.2f} ms{after_ms:>11.2f} ms{speedup:>11.1f}x')
+
+        for name in queries:
+            self.stdout.write(self.style.SUCCESS(f'\n📋 {name}'))
+            self.stdout.write('  Sin índices:')
+            for line in before[name][1].splitlines():
+                self.stdout.write(f'    {line}')
+            self.stdout.write('  Con índices:')
+            for line in after[name][1].splitlines():
+                self.stdout.write(f'    {line}')
+
+    def queries(self):
+        """Los filtros más usados del catálogo, con valores tomados de la base actual"""
+        serie = VehicleSerie.objects.filter(compatibilities__isnull=False).select_related('model__brand').first()
+        provider_id = Product.objects.exclude(provider__isnull=True).values_list('provider_id', flat=True).first()
+        part_numbers = list(
+            Product.objects.filter(provider_id=provider_id).values_list('part_number', flat=True)[:5000]
+        )
+
+        queries = {
+            'proveedor + números de parte': Product.objects.filter(
+                provider_id=provider_id, part_number__in=part_numbers
+            ).values_list('part_number', 'id'),
+        }
+        if serie is not None:
+            # Mismo filtro y orden que el listado cuando la faceta es amplia (store.listing.facet_filter)
+            queries['compatibilidad por vehículo'] = facet_filter(
+                listing_queryset(None),
+                brand=serie.model.brand.name, model=serie.model.name, serie=serie.name,
+            ).order_by('has_default_image', 'name', 'id')[:15]
+            queries['productos de una serie'] = Compatibility.objects.filter(serie=serie).values_list('product_id')
+        return queries
+
+    def measure(self, queries, repeat, label):
+        """{nombre: (mediana en ms, plan)}"""
+        results = {}
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (statistics.median(timings), self.explain(queryset, label))
+        return results
+
+    def explain(self, queryset, label):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            # El comentario cambia el texto de la sentencia: el caché de sentencias de
+            # sqlite3 devolvería el plan de la fase anterior aunque el índice ya no exista
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} /* {label} */', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for name in BENCHMARK_INDEXES:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+    def seed(self, n):
+        """Catálogo sintético: n productos con 1 a 4 compatibilidades cada uno"""
+        start = time.time()
+        provider, _ = Provider.objects.get_or_create(id=1, defaults={'name': 'Terraintamer'})
+        categories = [Category.objects.get_or_create(name=name)[0] for name in SEED_CATEGORIES]
+        serie_ids = list(VehicleSerie.ids_for(SEED_VEHICLES).values())
+
+        rng = random.Random(4)
+        products = [
+            Product(
+                sku=f'BENCH-{i:07d}',
+                part_number=f'BENCH-{i:07d}',
+                name=f'Repuesto {i}',
+                price=rng.randint(1, 500) * 1000,
+                category=rng.choice(categories),
+                subcategory=rng.choice(SEED_SUBCATEGORIES),
+                stock=rng.choice([0, 0, 0, 1, 5]),
+                stock_international=rng.choice([0, 0, 3]),
+                provider=provider,
+            )
+            for i in range(n)
+        ]
+        for product in products:
+            product.availability = Product.compute_availability(product.stock, product.stock_international)
+        Product.objects.bulk_create(products, batch_size=2000)
+        product_ids = Product.objects.filter(sku__startswith='BENCH-').values_list('id', flat=True)
+
+        compatibilities = [
+            Compatibility(product_id=product_id, serie_id=serie_id)
+            for product_id in product_ids
+            for serie_id in rng.sample(serie_ids, rng.randint(1, 4))
+        ]
+        Compatibility.objects.bulk_create(compatibilities, batch_size=5000)
+
+        # Estadísticas actualizadas para que el planificador use los índices
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'🌱 Catálogo sintético: {n} productos, {len(compatibilities)} compatibilidades '
+            f'({time.time() - start:.1f} s)'
+        ))
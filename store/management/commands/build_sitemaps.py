@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.catalog import get_catalog_version
+from store.sitemaps import build_sitemaps, current_build
+
+
+class Command(BaseCommand):
+    help = (
+        'Pre-genera el índice y las secciones del sitemap si el catálogo cambió desde la última '
+        'generación (se programa en el worker; los requests nunca generan el sitemap)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Generar aunque la versión del catálogo no haya cambiado'
+        )
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        version = get_catalog_version(force=True)
+        current = current_build()
+        if not options['force'] and current and current['version'] == version:
+            self.stdout.write(f'🗺️  Sitemap al día (versión del catálogo {version})')
+            return
+
+        sections = build_sitemaps(version)
+        if sections is None:
+            self.stdout.write(self.style.WARNING('⚠️  Otro proceso está generando el sitemap'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'🗺️  Sitemap pre-generado: {len(sections)} secciones ({time.time() - start_time:.1f} s)'
+        ))
@@ -4,7 +4,8 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 
 from store.models import Product
-from store.utils import verify_image_url, DEFAULT_PRODUCT_IMAGE
+from store.utils import DEFAULT_PRODUCT_IMAGE
+from store.images import verify_images
 
 
 class Command(BaseCommand):
@@ -16,6 +17,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Solo reporta los links rotos, no modifica la base de datos'
         )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Vuelve a consultar todas las URLs aunque tengan una verificación vigente'
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -29,19 +35,17 @@ class Command(BaseCommand):
         total = len(products)
         self.stdout.write(f'🔍 Productos con imagen propia a revisar: {total}')
 
-        verified = {}
+        # Todas las URLs únicas en paralelo; las vigentes en ImageCheck no se consultan
+        verified = verify_images({product.image for product in products}, force=options['force'])
+        elapsed = time.time() - start_time
+        self.stdout.write(f'⏱️  Links verificados - Tiempo transcurrido: {timedelta(seconds=int(elapsed))}')
+
         broken = []
         products_to_update = []
 
-        for i, product in enumerate(products, start=1):
-            if i % 100 == 0:
-                elapsed = time.time() - start_time
-                self.stdout.write(f'⏱️  Revisando {i}/{total} - Tiempo transcurrido: {timedelta(seconds=int(elapsed))}')
-
+        for product in products:
             url = product.image
-            if url not in verified:
-                verified[url] = verify_image_url(url)
-            result = verified[url]
+            result = verified.get(url, DEFAULT_PRODUCT_IMAGE)
 
             if result != url:
                 broken.append((product.part_number, url))
@@ -1,15 +1,27 @@
 from django.core.management.base import BaseCommand
+import numpy as np
 import pandas as pd
-from store.models import Category, Product, Compatibility, Provider
-from store.utils import verify_image_url, DEFAULT_PRODUCT_IMAGE
+from store.models import Category, Product, Compatibility, Provider, VehicleSerie
+from store.utils import DEFAULT_PRODUCT_IMAGE
+from store.images import verify_images
+from store.catalog import bump_catalog_version
+from store.search import get_search_backend, product_search_text
+from store.sitemaps import build_sitemaps
 import math
 import time
 from datetime import timedelta
 
 
+TARIF = 1.23
+
+
 def convertion(value):
-    tarif = 1.23
-    return math.ceil(value*tarif/100)*100
+    return math.ceil(value*TARIF/100)*100
+
+
+def convertion_column(values):
+    """Versión vectorizada de convertion() para una columna completa"""
+    return np.ceil(values * TARIF / 100) * 100
 
 class Command(BaseCommand):
     help = 'Carga productos y compatibilidades desde un archivo CSV'
@@ -61,7 +73,7 @@ class Command(BaseCommand):
 
         # 3. Reemplazar imágenes vacías
         default_image = DEFAULT_PRODUCT_IMAGE
-        df['Foto'] = df['Foto'].replace("", default_image)
+        df['Foto'] = df['Foto'].fillna('').replace("", default_image)
 
         # 4. FILTRAR productos sin stock
         # Convertir a numérico y llenar NaN con 0
@@ -72,119 +84,129 @@ class Command(BaseCommand):
         df = df[(df['BR SOH'] > 0) | (df['MELSOH'] > 0)]
         
         # Obtener todos los part_numbers existentes en la BD
-        productos = Product.objects.filter(provider=provider)
-        print('Todos los productos', len(productos))
-
         existing_part_numbers = set(
             Product.objects.filter(provider=provider)
             .values_list('part_number', flat=True)
         )
-        
+        self.stdout.write(f'🔍 Productos en BD con este provider: {len(existing_part_numbers)}')
+
         # Filtrar productos que ya existen (solo crear nuevos)
         df = df[~df['Numero de parte'].astype(str).isin(existing_part_numbers)]
 
-        creados = 0
-        compatibles = 0
-        compatibles_duplicados = 0
+        # 5. Columnas calculadas de forma vectorizada
+        text_columns = ['Numero de parte', 'Descripcion', 'Subgrupo', 'Tarrif Code', 'Motor', 'Grupo', 'Marca', 'Modelo', 'Serie']
+        df[text_columns] = df[text_columns].fillna('').astype(str)
+        for column in ['Peso (kg)', 'Largo (cm)', 'Alto (cm)', 'Ancho (cm)', 'Volumen (m3)']:
+            df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0)
+        df['Minorista'] = pd.to_numeric(df['Minorista'], errors='coerce')
+        df['price'] = convertion_column(df['Minorista'])
+        df['BR SOH'] = df['BR SOH'].astype(int)
+        df['MELSOH'] = df['MELSOH'].astype(int)
+
+        sin_precio = df['Minorista'].isna()
+        if sin_precio.any():
+            self.stderr.write(self.style.ERROR(f'Filas sin precio válido (se omiten): {int(sin_precio.sum())}'))
+            df = df[~sin_precio]
+
+        # Un producto por número de parte; cada fila aporta una compatibilidad
+        products_df = df.drop_duplicates(subset=['Numero de parte'], keep='first')
+
+        # sku es único en toda la tabla: se omiten los números de parte que ya usa otro proveedor
+        part_numbers = products_df['Numero de parte'].tolist()
+        taken_skus = set()
+        for start in range(0, len(part_numbers), 1000):
+            taken_skus.update(
+                Product.objects.filter(sku__in=part_numbers[start:start + 1000]).values_list('sku', flat=True)
+            )
+        if taken_skus:
+            self.stderr.write(self.style.ERROR(f'SKUs ya usados por otro proveedor (se omiten): {len(taken_skus)}'))
+            products_df = products_df[~products_df['Numero de parte'].isin(taken_skus)]
+        compat_df = df[['Numero de parte', 'Marca', 'Modelo', 'Serie']].drop_duplicates()
+        compatibles_duplicados = len(df) - len(compat_df)
+
         imagenes_invalidas = 0
-        
-        # Cache para imágenes ya verificadas (optimización)
-        verified_images = {}
-        
-        total_rows = len(df)
-        new_products_preview = "0000"
-        n = 0
-        for index, row in df.iterrows():
-            n = n + 1
+
+        # Verificar todas las fotos de una vez (en paralelo y con caché en ImageCheck)
+        if not skip_image_check:
+            verified_images = verify_images(products_df['Foto'].dropna().unique().tolist(), default_image)
+            imagenes_invalidas = sum(
+                1 for url, result in verified_images.items() if result == default_image and url != default_image
+            )
+            products_df = products_df.assign(Foto=products_df['Foto'].map(lambda url: verified_images.get(url, default_image)))
+
+        # 6. Categorías: una consulta y un bulk_create para las que falten
+        group_names = set(products_df['Grupo'].tolist())
+        categories = {cat.name: cat for cat in Category.objects.filter(name__in=group_names)}
+        missing_categories = group_names - categories.keys()
+        if missing_categories:
+            Category.objects.bulk_create([Category(name=name) for name in missing_categories])
+            categories = {cat.name: cat for cat in Category.objects.filter(name__in=group_names)}
+            self.stdout.write(self.style.SUCCESS(f'✅ Categorías nuevas: {len(missing_categories)}'))
+
+        # 7. Productos: bulk_create (retorna los ids en PostgreSQL y SQLite)
+        products_to_create = []
+        for row in products_df.to_dict('records'):
             try:
-                # Progress indicator cada 50 filas
-                if index % 50 == 0:
-                    elapsed = time.time() - start_time
-                    self.stdout.write(f"⏱️  Procesando fila {n}/{total_rows} - Tiempo transcurrido: {timedelta(seconds=int(elapsed))}")
-
-                # Limpieza de columnas
-                sku = str(row["Numero de parte"])
-                brand = str(row["Marca"])
-                model = str(row["Modelo"])
-                serie = str(row["Serie"])
-
-                # Primera ves que ve el producto
-                if sku != new_products_preview:
-                    new_products_preview = sku
-
-                    name = row["Descripcion"]
-                    part_number = row["Numero de parte"]
-                    price = convertion(float(row["Minorista"]))
-                    description = row["Descripcion"]
-                    stock = int(row["BR SOH"]) if pd.notna(row["BR SOH"]) else 0
-                    stock_international = int(row["MELSOH"]) if pd.notna(row["MELSOH"]) else 0
-                    subcategory = row['Subgrupo'] if pd.notna(row['Subgrupo']) else ''
-                    tariff_code = str(row["Tarrif Code"]) if pd.notna(row["Tarrif Code"]) else ""
-                    weight = float(row["Peso (kg)"]) if pd.notna(row["Peso (kg)"]) else 0
-                    length = float(row["Largo (cm)"]) if pd.notna(row["Largo (cm)"]) else 0
-                    height = float(row["Alto (cm)"]) if pd.notna(row["Alto (cm)"]) else 0
-                    width = float(row["Ancho (cm)"]) if pd.notna(row["Ancho (cm)"]) else 0
-                    volume = float(row["Volumen (m3)"]) if pd.notna(row["Volumen (m3)"]) else 0
-                    motor = str(row["Motor"]) if pd.notna(row["Motor"]) else ""
-                    grupo = str(row["Grupo"])
-                    image = row["Foto"]
-
-                    # Verificar imagen usando caché (solo verifica URLs no vistas antes)
-                    if not skip_image_check:
-                        if image not in verified_images:
-                            original_image = image
-                            image = verify_image_url(image, default_image)
-                            verified_images[original_image] = image
-                            
-                            if image == default_image and original_image != default_image:
-                                imagenes_invalidas += 1
-                        else:
-                            image = verified_images[image]
-
-                    # Obtener o crear categoría
-                    category, _ = Category.objects.get_or_create(name=grupo)
-
-                    # Crear nuevo producto
-                    product = Product.objects.create(
-                            part_number=part_number,
-                            sku=sku,
-                            name=name,
-                            price=price,
-                            category=category,
-                            subcategory=subcategory,
-                            description=description,
-                            image=image,
-                            is_sale=False,
-                            sale_price=0,
-                            stock=stock,
-                            stock_international=stock_international,
-                            tariff_code=tariff_code,
-                            weight_kg=weight,
-                            length_cm=length,
-                            height_cm=height,
-                            width_cm=width,
-                            volume_m3=volume,
-                            motor=motor,
-                            provider=provider,
-                        )
-                    creados += 1
-
-                # Crear compatibilidad SOLO si no existe
-                compatibility, comp_created = Compatibility.objects.get_or_create(
-                    product=product,
-                    brand=brand,
-                    model=model,
-                    serie=serie
+                product = Product(
+                    part_number=row['Numero de parte'],
+                    sku=row['Numero de parte'],
+                    name=row['Descripcion'],
+                    price=row['price'],
+                    category=categories[row['Grupo']],
+                    subcategory=row['Subgrupo'],
+                    description=row['Descripcion'],
+                    image=row['Foto'],
+                    is_sale=False,
+                    sale_price=0,
+                    stock=row['BR SOH'],
+                    stock_international=row['MELSOH'],
+                    availability=Product.compute_availability(row['BR SOH'], row['MELSOH']),
+                    tariff_code=row['Tarrif Code'],
+                    weight_kg=row['Peso (kg)'],
+                    length_cm=row['Largo (cm)'],
+                    height_cm=row['Alto (cm)'],
+                    width_cm=row['Ancho (cm)'],
+                    volume_m3=row['Volumen (m3)'],
+                    motor=row['Motor'],
+                    provider=provider,
                 )
-                
-                if comp_created:
-                    compatibles += 1
-                else:
-                    compatibles_duplicados += 1
-                    
+                product.search_text = product_search_text(product, row['Grupo'])
+                products_to_create.append(product)
             except Exception as e:
-                self.stderr.write(self.style.ERROR(f"Error al procesar la fila {index}: {e}"))
-                continue
+                self.stderr.write(self.style.ERROR(f"Error al procesar el producto {row['Numero de parte']}: {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f'📦 Creando {len(products_to_create)} productos en bulk...'))
+        created = Product.objects.bulk_create(products_to_create, batch_size=1000)
+        sku_to_id = {product.sku: product.pk for product in created if product.pk is not None}
+        if len(sku_to_id) < len(created):
+            # Backends que no retornan ids en bulk_create
+            sku_to_id = dict(
+                Product.objects.filter(provider=provider, sku__in=[p.sku for p in created]).values_list('sku', 'id')
+            )
+        creados = len(created)
+
+        # Indexar los productos nuevos en el backend de búsqueda
+        get_search_backend().index_products(list(sku_to_id.values()))
+
+        # 8. Compatibilidades: un INSERT por lote con las combinaciones únicas
+        compat_df = compat_df.assign(product_id=compat_df['Numero de parte'].map(sku_to_id)).dropna(subset=['product_id'])
+        vehicles = list(zip(compat_df['Marca'].tolist(), compat_df['Modelo'].tolist(), compat_df['Serie'].tolist()))
+        serie_ids = VehicleSerie.ids_for(vehicles)
+        compatibilities = {
+            (int(product_id), serie_ids[vehicle])
+            for product_id, vehicle in zip(compat_df['product_id'].tolist(), vehicles)
+        }
+        self.stdout.write(self.style.SUCCESS(f'📦 Creando {len(compatibilities)} compatibilidades en bulk...'))
+        compatibles = Compatibility.insert_missing(compatibilities, batch_size=2000)
+
+        # Invalidar índices del catálogo en los procesos web
+        version = bump_catalog_version()
+        self.stdout.write(f'🔄 Versión del catálogo: {version}')
+        sections = build_sitemaps(version)
+        if sections is None:
+            self.stdout.write(self.style.WARNING('⚠️  Otro proceso está generando el sitemap; lo actualizará build_sitemaps'))
+        else:
+            self.stdout.write(f'🗺️  Sitemap pre-generado: {len(sections)} secciones')
 
         # ============ FINALIZAR TIMER ============
         end_time = time.time()
@@ -197,4 +219,6 @@ class Command(BaseCommand):
             f'⏱️  Tiempo total: {timedelta(seconds=int(total_time))} ({total_time:.2f} segundos)\n'
             f'✨ Productos nuevos creados: {creados}\n'
             f'🔗 Compatibilidades nuevas: {compatibles}\n'
+            f'♻️  Compatibilidades duplicadas en el archivo: {compatibles_duplicados}\n'
+            f'🖼️  Imágenes inválidas: {imagenes_invalidas}\n'
         ))
\ No newline at end of file
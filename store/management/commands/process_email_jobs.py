@@ -0,0 +1,61 @@
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.jobs import EMAIL_JOB_WORKERS, process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de emails transaccionales (EmailJob): envía los pendientes con reintentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=EMAIL_JOB_WORKERS,
+            help=f'Emails enviados en paralelo (default: {EMAIL_JOB_WORKERS})',
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=None,
+            help='Jobs reclamados por vuelta (default: 2 por hilo)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando la cola está vacía (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Procesar los jobs vencidos una vez y terminar',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch'] or workers * 2
+        stopping = []
+
+        # SIGTERM (reinicio del dyno): terminar el lote en curso y salir
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(True))
+
+        self.stdout.write(self.style.WARNING(f'📬 Worker de emails iniciado ({workers} hilos)'))
+        total_sent = total_failed = 0
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='email-job') as executor:
+            while not stopping:
+                claimed, sent = process_jobs(executor, batch_size)
+                total_sent += sent
+                total_failed += claimed - sent
+                if claimed:
+                    self.stdout.write(f'   📨 Lote: {claimed} reclamados, {sent} enviados')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Emails enviados: {total_sent} | con error: {total_failed}'))
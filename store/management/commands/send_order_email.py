@@ -39,8 +39,14 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f'❌ Error enviando al cliente: {e}'))
 
         if not solo_cliente:
-            try:
-                send_provider_order_notification(order)
-                self.stdout.write(self.style.SUCCESS(f'✅ Emails enviados a los proveedores'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'❌ Error enviando a proveedores: {e}'))
\ No newline at end of file
+            # Un email por proveedor: si uno falla, los demás igual se envían
+            provider_ids = (
+                order.orderitem_set.filter(product__provider__isnull=False)
+                .values_list('product__provider_id', flat=True).distinct()
+            )
+            for provider_id in provider_ids:
+                try:
+                    send_provider_order_notification(order, provider_id=provider_id)
+                    self.stdout.write(self.style.SUCCESS(f'✅ Email enviado al proveedor #{provider_id}'))
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'❌ Error enviando al proveedor #{provider_id}: {e}'))
\ No newline at end of file
@@ -1,21 +1,44 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+import numpy as np
 import pandas as pd
-from store.models import Category, Product, Compatibility, Provider
-from store.utils import verify_image_url, DEFAULT_PRODUCT_IMAGE
+from store.models import Category, Product, Compatibility, Provider, VehicleSerie
+from store.utils import DEFAULT_PRODUCT_IMAGE
+from store.images import ImageVerifier
+from store.catalog import bump_catalog_version
+from store.facets import IN_STOCK
+from store.sitemaps import build_sitemaps
+from store.search import get_search_backend, product_search_text
 import math
 import time
+from collections import Counter
 from datetime import timedelta
-from django.db.models import F
+from django.utils import timezone
+
+
+TARIF = 1.19
+
+# Columnas del CSV que usa el comando (el resto no se lee)
+TEXT_COLUMNS = [
+    'Numero de parte', 'Marca', 'Modelo', 'Serie', 'Descripcion', 'Subgrupo',
+    'Tarrif Code', 'Motor', 'Grupo', 'Cant', 'Foto',
+]
+NUMERIC_COLUMNS = [
+    'Minorista', 'BR SOH', 'MELSOH', 'Peso (kg)', 'Largo (cm)', 'Alto (cm)', 'Ancho (cm)', 'Volumen (m3)',
+]
+
+# Filas por chunk: la memoria queda acotada por este valor y no por el tamaño del archivo
+CHUNK_SIZE = 5000
+
+# Campos de origen que definen Product.sync_hash; si el hash no cambia la fila no se escribe
+SYNC_HASH_COLUMNS = ['price', 'BR SOH', 'MELSOH', 'Foto']
 
 
 def convertion(value):
     """
     Convierte precio aplicando tarifa del 0% y redondea a .0 o .5
     """
-    tarif = 1.19 #1.19
-
     # Aplicar tarifa y dividir por 1000 para generar decimales
-    precio_base = value * tarif / 1000
+    precio_base = value * TARIF / 1000
 
     # Redondear a .0 o .5
     precio_redondeado = math.floor(precio_base * 2) / 2
@@ -24,6 +47,58 @@ def convertion(value):
     return precio_redondeado * 1000
 
 
+def convertion_column(values):
+    """Versión vectorizada de convertion() para una columna completa"""
+    return np.floor(values * TARIF / 1000 * 2) / 2 * 1000
+
+
+def read_csv_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Lee el CSV por chunks, solo con las columnas usadas y todas como texto
+    (sin inferencia de tipos). Los encabezados del archivo traen espacios,
+    así que se mapean a su nombre limpio.
+    """
+    header = pd.read_csv(path, encoding='latin-1', nrows=0).columns
+    columns = {name: name.strip() for name in header if name.strip() in TEXT_COLUMNS + NUMERIC_COLUMNS}
+    missing = set(TEXT_COLUMNS + NUMERIC_COLUMNS) - set(columns.values())
+    if missing:
+        raise CommandError(f'Faltan columnas en el CSV: {", ".join(sorted(missing))}')
+
+    reader = pd.read_csv(
+        path,
+        encoding='latin-1',
+        usecols=list(columns),
+        dtype={name: str for name in columns},
+        chunksize=chunk_size,
+    )
+    for chunk in reader:
+        yield prepare_chunk(chunk.rename(columns=columns))
+
+
+def prepare_chunk(chunk):
+    """Limpieza y cálculos vectorizados de un chunk; deja solo productos con stock"""
+    for column in TEXT_COLUMNS:
+        chunk[column] = chunk[column].str.strip().fillna('')
+    for column in NUMERIC_COLUMNS:
+        chunk[column] = pd.to_numeric(chunk[column], errors='coerce').fillna(0)
+
+    chunk['BR SOH'] = chunk['BR SOH'].astype(int)
+    chunk['MELSOH'] = chunk['MELSOH'].astype(int)
+    chunk['price'] = convertion_column(chunk['Minorista'])
+
+    # Imagen por defecto
+    chunk['Foto'] = chunk['Foto'].mask(chunk['Foto'] == '', DEFAULT_PRODUCT_IMAGE)
+
+    # Filtrar productos sin stock
+    return chunk[(chunk['BR SOH'] > 0) | (chunk['MELSOH'] > 0)]
+
+
+def sync_hashes(chunk, columns=SYNC_HASH_COLUMNS):
+    """Hash (hex de 16) de los campos sincronizados de cada fila, calculado sobre la columna completa"""
+    hashes = pd.util.hash_pandas_object(chunk[columns], index=False)
+    return hashes.map('{:016x}'.format)
+
+
 class Command(BaseCommand):
     help = 'Actualiza productos comparando archivo nuevo vs antiguo del csv.'
 
@@ -42,12 +117,27 @@ class Command(BaseCommand):
             help='Omite la verificación de imágenes (más rápido)'
         )
 
+        parser.add_argument(
+            '--skip-retire',
+            action='store_true',
+            help='No deja en stock 0 los productos del proveedor que ya no vienen en el archivo'
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Filas del CSV por chunk (default: {CHUNK_SIZE})'
+        )
+
     def handle(self, *args, **kwargs):
         # ============ INICIAR TIMER ============ #
         start_time = time.time()
 
         new_csv_path = kwargs['csv_path']
         skip_image_check = kwargs.get('skip_image_check', False)
+        chunk_size = kwargs.get('chunk_size') or CHUNK_SIZE
+        skip_retire = kwargs.get('skip_retire', False)
 
         # Obtener o crear el proveedor Terraintamer
         provider, _ = Provider.objects.get_or_create(
@@ -55,263 +145,268 @@ class Command(BaseCommand):
             defaults={'name': 'Terraintamer'}
         )
 
-        # ============ Procesar Dataframe ============ #
-        df_new = pd.read_csv(new_csv_path, encoding='latin-1')
-            
-        # Limpiar columnas
-        df_new.columns = df_new.columns.str.strip()
-
-        # Convertir columnas numéricas
-        df_new['BR SOH'] = pd.to_numeric(df_new['BR SOH'], errors='coerce').fillna(0)   
-        df_new['MELSOH'] = pd.to_numeric(df_new['MELSOH'], errors='coerce').fillna(0)
-        df_new['Minorista'] = pd.to_numeric(df_new['Minorista'], errors='coerce').fillna(0)
-
-        # Limpiar espacios en columnas de texto
-        string_columns = df_new.select_dtypes(include=['object']).columns
-        df_new[string_columns] = df_new[string_columns].apply(lambda col: col.str.strip())
+        # Estado entre chunks: solo claves e ids, nunca el archivo completo
+        self.provider = provider
+        self.skip_image_check = skip_image_check
+        self.verified_images = {}
+        self.image_verifier = ImageVerifier()
+        self.categories = {}
+        self.seen_part_numbers = set()
+        self.created_ids = {}  # sku -> id de los productos creados en esta corrida
+        self.changeset = Counter()
 
-        # Imagen por defecto
-        default_image = DEFAULT_PRODUCT_IMAGE
-        df_new['Foto'] = df_new['Foto'].replace("", default_image)
+        # Con --skip-image-check la foto no se aplica, así que tampoco entra al hash
+        self.hash_columns = [c for c in SYNC_HASH_COLUMNS if not (skip_image_check and c == 'Foto')]
 
-        # Filtrar productos sin stock
-        df_new = df_new[(df_new['BR SOH'] > 0) | (df_new['MELSOH'] > 0)]
+        n_update = 0
+        creados = 0
+        n_rows = 0
+
+        # ============ Procesar CSV por chunks ============ #
+        self.stdout.write(self.style.WARNING(f'⏱️  Iniciando actualización de productos (chunks de {chunk_size} filas)...'))
+        for n_chunk, chunk in enumerate(read_csv_chunks(new_csv_path, chunk_size), start=1):
+            n_rows += len(chunk)
+            chunk['sync_hash'] = sync_hashes(chunk, self.hash_columns)
+            part_numbers = [pn for pn in chunk['Numero de parte'].unique().tolist() if pn not in self.created_ids]
+
+            # Productos del proveedor presentes en el chunk: una query por chunk
+            existing = {
+                row[0]: row[1:]
+                for row in Product.objects.filter(
+                    provider=provider, part_number__in=part_numbers
+                ).values_list('part_number', 'id', 'image', 'price', 'stock', 'stock_international', 'sync_hash')
+            }
+            is_existing = chunk['Numero de parte'].isin(existing.keys())
+
+            n_update += self.update_existing(chunk[is_existing], existing)
+            creados += self.create_new(chunk[~is_existing])
+            self.insert_compatibilities(chunk, existing)
+
+            elapsed = time.time() - start_time
+            self.stdout.write(
+                f'⏱️  Chunk {n_chunk}: {n_rows} filas con stock - {n_update} actualizados, '
+                f'{creados} nuevos - Tiempo transcurrido: {timedelta(seconds=int(elapsed))}'
+            )
 
-        # Obtener la Base de Datos: crear un diccionario para búsqueda O(1) en lugar de queries O(n)
-        products_dict = {p.part_number: p for p in Product.objects.filter(provider=provider)}
-        self.stdout.write(f'🔍 Productos en BD con este provider: {len(products_dict)}')
+        # Productos del proveedor con stock que no vinieron en el archivo
+        if n_rows and not skip_retire:
+            self.retire_missing()
 
-        # Filtrar productos que no existen (solo actualizar existentes)
-        df_nuevos_unique = df_new[df_new['Numero de parte'].astype(str).isin(products_dict.keys())]
-        # Eliminar duplicados
-        df_nuevos_unique = df_nuevos_unique.drop_duplicates(subset=['Numero de parte'], keep='first')
+        self.stdout.write(self.style.SUCCESS(f'✅ Proceso completado: {creados} productos nuevos cargados'))
 
-        # Filtrar productos que ya existen (solo crear nuevos)
-        df_new_products = df_new[~df_new['Numero de parte'].astype(str).isin(products_dict.keys())]
+        # Invalidar índices del catálogo en los procesos web (solo si algo cambió)
+        if n_update or creados or self.changeset['retirados'] or self.changeset['compatibilidades']:
+            version = bump_catalog_version()
+            self.stdout.write(f'🔄 Versión del catálogo: {version}')
+            sections = build_sitemaps(version)
+            if sections is None:
+                self.stdout.write(self.style.WARNING('⚠️  Otro proceso está generando el sitemap; lo actualizará build_sitemaps'))
+            else:
+                self.stdout.write(f'🗺️  Sitemap pre-generado: {len(sections)} secciones')
 
 
-        # ============ Actualizar ============ #
-        self.stdout.write(self.style.WARNING(f'⏱️  Iniciando actualización de productos...'))
+        # ============ FINALIZAR ============ #
+        end_time = time.time()
+        total_time = end_time - start_time
 
-        products_not_found = []
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{"="*70}\n'
+            f'✅ ACTUALIZACIÓN COMPLETADA\n'
+            f'{"="*70}\n'
+            f'⏱️  Tiempo total: {timedelta(seconds=int(total_time))} ({total_time:.2f} segundos)\n'
+            f'{"="*70}\n'
+            f' - Productos actualizados: {n_update}\n'
+            f'     precio: {self.changeset["precio"]}, stock: {self.changeset["stock"]}, imagen: {self.changeset["imagen"]}\n'
+            f' - Productos sin cambios: {self.changeset["sin cambios"]}\n'
+            f' - Productos nuevos creados: {creados}\n'
+            f' - Compatibilidades nuevas: {self.changeset["compatibilidades"]}\n'
+            f' - Productos retirados (stock 0): {self.changeset["retirados"]}\n'
+        ))
+
+    def verify_images(self, urls):
+        """Verifica en paralelo (y con caché en ImageCheck) las URLs que aún no se vieron en la corrida"""
+        pending = set(urls) - self.verified_images.keys()
+        if pending:
+            self.verified_images.update(self.image_verifier.verify_many(pending))
+
+    def verified_image(self, image):
+        return self.verified_images.get(image, DEFAULT_PRODUCT_IMAGE)
+
+    def update_existing(self, rows, existing):
+        """Precio, stock e imagen de los productos existentes cuyo hash cambió, en un bulk_update"""
+        # Solo la primera aparición de cada número de parte en el archivo
+        rows = rows.drop_duplicates(subset=['Numero de parte'], keep='first')
+        rows = rows[~rows['Numero de parte'].isin(self.seen_part_numbers)]
+        self.seen_part_numbers.update(rows['Numero de parte'].tolist())
+
+        # Delta: se descartan las filas idénticas a la última sincronización
+        stored_hashes = rows['Numero de parte'].map(lambda part_number: existing[part_number][5])
+        changed = rows[rows['sync_hash'] != stored_hashes]
+        self.changeset['sin cambios'] += len(rows) - len(changed)
+
+        if not self.skip_image_check:
+            current_images = changed['Numero de parte'].map(lambda part_number: existing[part_number][1])
+            self.verify_images(changed['Foto'][changed['Foto'] != current_images].tolist())
+
+        now = timezone.now()
         products_to_update = []
-        n_update = 0
-        verified_images = {}
-        for index, row in df_nuevos_unique.iterrows():
-            part_number = row['Numero de parte']
-
-            # Búsqueda en diccionario (instantánea, sin query)
-            product = products_dict.get(part_number)
-
-            if product:
-                product.price = convertion(float(row["Minorista"]))
-                product.stock = int(row["BR SOH"]) if pd.notna(row["BR SOH"]) else 0
-                product.stock_international = int(row["MELSOH"]) if pd.notna(row["MELSOH"]) else 0
-
-                # Si el CSV trae una foto distinta a la guardada, se re-verifica antes de aceptarla
-                new_image = row["Foto"] if pd.notna(row["Foto"]) else default_image
-                if not skip_image_check and new_image != product.image:
-                    if new_image not in verified_images:
-                        verified_images[new_image] = verify_image_url(new_image, default_image)
-                    product.image = verified_images[new_image]
-
-                # Por esta vez actualizar subcatory y recomended_auantities
-                # product.subcategory = row['Subgrupo'] if pd.notna(row['Subgrupo']) else ''
-                # product.recommended_quantities = row['Cant'] if pd.notna(row['Cant']) else ''
-
-                products_to_update.append(product)
-                n_update += 1
+        for part_number, price, stock, stock_international, image, sync_hash in zip(
+            changed['Numero de parte'].tolist(), changed['price'].tolist(),
+            changed['BR SOH'].tolist(), changed['MELSOH'].tolist(), changed['Foto'].tolist(),
+            changed['sync_hash'].tolist(),
+        ):
+            product_id, current_image, current_price, current_stock, current_international, _ = existing[part_number]
+
+            # Si el CSV trae una foto distinta a la guardada, se re-verifica antes de aceptarla
+            if self.skip_image_check or image == current_image:
+                image = current_image
             else:
-                products_not_found.append(part_number)
+                image = self.verified_image(image)
+
+            if price != float(current_price):
+                self.changeset['precio'] += 1
+            if (stock, stock_international) != (current_stock, current_international):
+                self.changeset['stock'] += 1
+            if image != current_image:
+                self.changeset['imagen'] += 1
+
+            products_to_update.append(Product(
+                id=product_id,
+                price=price,
+                stock=stock,
+                stock_international=stock_international,
+                availability=Product.compute_availability(stock, stock_international),
+                image=image,
+                sync_hash=sync_hash,
+                updated_at=now,
+            ))
 
-        # Una sola query para actualizar todos
-        # Actualizar todo de una vez
         if products_to_update:
             Product.objects.bulk_update(
                 products_to_update,
-                ['price', 'stock', 'stock_international', 'image'],
+                ['price', 'stock', 'stock_international', 'availability', 'image', 'sync_hash', 'updated_at'],
                 batch_size=500  # Procesa en lotes de 500
             )
-        elapsed = time.time() - start_time
-        self.stdout.write(self.style.WARNING(f'⏱️  Productos Actualizados {n_update} - Tiempo transcurrido: {timedelta(seconds=int(elapsed))}'))
-
-
-        # ============ Cargar nuevos productos ============ #
-        self.stdout.write(self.style.WARNING(f'⏱️  Iniciando carga de nuevos productos: '))
-        creados = 0
-        total_rows = len(df_new_products)
-        new_products_preview = "0000"
-        n = 0
+        return len(products_to_update)
+
+    def retire_missing(self):
+        """Deja en stock 0 los productos del proveedor que ya no vienen con stock en el archivo"""
+        seen = self.seen_part_numbers | self.created_ids.keys()
+        in_stock = Product.objects.filter(provider=self.provider).filter(IN_STOCK)
+        to_retire = [
+            product_id
+            for product_id, part_number in in_stock.values_list('id', 'part_number').iterator(chunk_size=5000)
+            if part_number not in seen
+        ]
+        for start in range(0, len(to_retire), 1000):
+            Product.objects.filter(id__in=to_retire[start:start + 1000]).update(
+                stock=0, stock_international=0, availability='sin_stock', sync_hash='', updated_at=timezone.now()
+            )
+        self.changeset['retirados'] = len(to_retire)
+
+    def create_new(self, rows):
+        """Crea los productos nuevos del chunk con sus categorías"""
+        if rows.empty:
+            return 0
+
+        # Un producto por número de parte; las demás filas solo aportan compatibilidades
+        first_rows = rows.drop_duplicates(subset=['Numero de parte'], keep='first')
+        first_rows = first_rows[~first_rows['Numero de parte'].isin(self.created_ids.keys())]
+
+        # sku es único en toda la tabla: se omiten los números de parte que ya usa otro proveedor
+        part_numbers = first_rows['Numero de parte'].tolist()
+        taken_skus = set()
+        for start in range(0, len(part_numbers), 1000):
+            taken_skus.update(
+                Product.objects.filter(sku__in=part_numbers[start:start + 1000]).values_list('sku', flat=True)
+            )
+        if taken_skus:
+            self.stderr.write(self.style.ERROR(f'SKUs ya usados por otro proveedor (se omiten): {len(taken_skus)}'))
+            first_rows = first_rows[~first_rows['Numero de parte'].isin(taken_skus)]
+        self.ensure_categories(set(first_rows['Grupo'].tolist()))
+        if not self.skip_image_check:
+            self.verify_images(first_rows['Foto'].tolist())
 
-        # Listas para bulk_create
         products_to_create = []
-        compatibilities_to_create = []
-        categories_to_create = {}
-        product_map = {}  # Mapeo de SKU a producto para compatibilidades
-
-        for index, row in df_new_products.iterrows():
-            n = n + 1
-            sku = str(row["Numero de parte"])
+        for row in first_rows.to_dict('records'):
+            sku = row['Numero de parte']
             try:
-                # Progress indicator cada 50 filas
-                if n % 50 == 0:
-                    elapsed = time.time() - start_time
-                    self.stdout.write(f"⏱️  Procesando fila {n}/{total_rows} - Tiempo transcurrido: {timedelta(seconds=int(elapsed))}")
-
-                # Limpieza de columnas
-                sku = str(row["Numero de parte"])
-                brand = str(row["Marca"])
-                model = str(row["Modelo"])
-                serie = str(row["Serie"])
-
-                # Primera vez que ve el producto
-                if sku != new_products_preview:
-                    new_products_preview = sku
-
-                    name = row["Descripcion"]
-                    part_number = row["Numero de parte"]
-                    price = convertion(float(row["Minorista"]))
-                    description = row["Descripcion"]
-                    stock = int(row["BR SOH"]) if pd.notna(row["BR SOH"]) else 0
-                    stock_international = int(row["MELSOH"]) if pd.notna(row["MELSOH"]) else 0
-                    subcategory = row['Subgrupo'] if pd.notna(row['Subgrupo']) else ''
-                    tariff_code = str(row["Tarrif Code"]) if pd.notna(row["Tarrif Code"]) else ""
-                    weight = float(row["Peso (kg)"]) if pd.notna(row["Peso (kg)"]) else 0
-                    length = float(row["Largo (cm)"]) if pd.notna(row["Largo (cm)"]) else 0
-                    height = float(row["Alto (cm)"]) if pd.notna(row["Alto (cm)"]) else 0
-                    width = float(row["Ancho (cm)"]) if pd.notna(row["Ancho (cm)"]) else 0
-                    volume = float(row["Volumen (m3)"]) if pd.notna(row["Volumen (m3)"]) else 0
-                    motor = str(row["Motor"]) if pd.notna(row["Motor"]) else ""
-                    grupo = str(row["Grupo"])
-                    recommended_quantities = row['Cant'] if pd.notna(row['Cant']) else ''
-                    image = row["Foto"]
-
-                    # Verificar imagen usando caché
-                    if not skip_image_check:
-                        if image not in verified_images:
-                            original_image = image
-                            image = verify_image_url(image, default_image)
-                            verified_images[original_image] = image
-                        else:
-                            image = verified_images[image]
-
-                    # Guardar categoría para crear después
-                    if grupo not in categories_to_create:
-                        categories_to_create[grupo] = grupo
-
-                    # Crear objeto producto (sin guardar aún)
-                    product = Product(
-                        part_number=part_number,
-                        sku=sku,
-                        name=name,
-                        price=price,
-                        category=None,  # Se asignará después
-                        subcategory=subcategory,
-                        description=description,
-                        image=image,
-                        is_sale=False,
-                        sale_price=0,
-                        stock=stock,
-                        stock_international=stock_international,
-                        tariff_code=tariff_code,
-                        weight_kg=weight,
-                        length_cm=length,
-                        height_cm=height,
-                        width_cm=width,
-                        volume_m3=volume,
-                        motor=motor,
-                        provider=provider,
-                        recommended_quantities=recommended_quantities
-                    )
-                    products_to_create.append(product)
-                    product_map[sku] = {'product': product, 'grupo': grupo, 'compatibilities': []}
-                    creados += 1
-
-                # Guardar datos de compatibilidad para crear después
-                product_map[sku]['compatibilities'].append({
-                    'brand': brand,
-                    'model': model,
-                    'serie': serie
-                })
-                    
+                image = row['Foto'] if self.skip_image_check else self.verified_image(row['Foto'])
+                product = Product(
+                    part_number=sku,
+                    sku=sku,
+                    name=row['Descripcion'],
+                    price=row['price'],
+                    category=self.categories[row['Grupo']],
+                    subcategory=row['Subgrupo'],
+                    description=row['Descripcion'],
+                    image=image,
+                    is_sale=False,
+                    sale_price=0,
+                    stock=row['BR SOH'],
+                    stock_international=row['MELSOH'],
+                    availability=Product.compute_availability(row['BR SOH'], row['MELSOH']),
+                    tariff_code=row['Tarrif Code'],
+                    weight_kg=row['Peso (kg)'],
+                    length_cm=row['Largo (cm)'],
+                    height_cm=row['Alto (cm)'],
+                    width_cm=row['Ancho (cm)'],
+                    volume_m3=row['Volumen (m3)'],
+                    motor=row['Motor'],
+                    provider=self.provider,
+                    recommended_quantities=row['Cant'],
+                    sync_hash=row['sync_hash'],
+                )
+                product.search_text = product_search_text(product, row['Grupo'])
+                products_to_create.append(product)
             except Exception as e:
                 self.stderr.write(self.style.ERROR(f"Error al procesar el producto {sku}: {e}"))
-                continue
-
-        # Bulk Create de Categorías 
-        self.stdout.write(self.style.SUCCESS(f'📦 Creando categorías en bulk...'))
-        existing_categories = {cat.name: cat for cat in Category.objects.filter(name__in=categories_to_create.keys())}
-        new_categories = []
-        for cat_name in categories_to_create.keys():
-            if cat_name not in existing_categories:
-                new_categories.append(Category(name=cat_name))
 
-        if new_categories:
-            Category.objects.bulk_create(new_categories, ignore_conflicts=True)
-            # Actualizar el diccionario con las nuevas categorías
-            all_categories = {cat.name: cat for cat in Category.objects.filter(name__in=categories_to_create.keys())}
-        else:
-            all_categories = existing_categories
-
-        # Asignar categorías a productos
-        for product in products_to_create:
-            category_name = product_map[product.sku]['grupo']
-            product.category = all_categories[category_name]
-
-        # Bulk Create de Productos 
-        self.stdout.write(self.style.SUCCESS(f'📦 Creando {len(products_to_create)} productos en bulk...'))
         if products_to_create:
             Product.objects.bulk_create(products_to_create, batch_size=500)
-            self.stdout.write(self.style.SUCCESS(f'✅ {len(products_to_create)} productos creados'))
-
-        # Bulk Create de Compatibilidades
-        self.stdout.write(self.style.SUCCESS(f'📦 Preparando compatibilidades...'))
-        # Obtener los productos recién creados con sus IDs
-        created_products = Product.objects.filter(sku__in=product_map.keys())
-        sku_to_product_db = {p.sku: p for p in created_products}
-
-        # Obtener compatibilidades existentes para evitar duplicados
-        existing_compatibilities = set(
-            Compatibility.objects.filter(
-                product__in=created_products
-            ).values_list('product_id', 'brand', 'model', 'serie')
+            created = dict(
+                Product.objects.filter(provider=self.provider, sku__in=[p.sku for p in products_to_create])
+                .values_list('sku', 'id')
+            )
+            self.created_ids.update(created)
+
+            # Indexar los productos nuevos en el backend de búsqueda
+            get_search_backend().index_products(list(created.values()))
+
+        return len(products_to_create)
+
+    def insert_compatibilities(self, rows, existing):
+        """
+        Compatibilidades de todas las filas del chunk, de productos existentes y
+        creados (en este chunk o en uno anterior). Solo se escriben las que no
+        estaban; las nuevas se cuentan para invalidar el catálogo.
+        """
+        product_ids = {part_number: values[0] for part_number, values in existing.items()}
+        product_ids.update(self.created_ids)
+        compatibilities = [
+            (product_ids[sku], (brand, model, serie))
+            for sku, brand, model, serie in zip(
+                rows['Numero de parte'].tolist(), rows['Marca'].tolist(),
+                rows['Modelo'].tolist(), rows['Serie'].tolist(),
+            )
+            if sku in product_ids
+        ]
+        if not compatibilities:
+            return
+
+        serie_ids = VehicleSerie.ids_for(vehicle for _, vehicle in compatibilities)
+        self.changeset['compatibilidades'] += Compatibility.insert_missing(
+            (product_id, serie_ids[vehicle]) for product_id, vehicle in compatibilities
         )
 
-        for sku, data in product_map.items():
-            product_db = sku_to_product_db.get(sku)
-            if product_db:
-                for comp_data in data['compatibilities']:
-                    # Verificar si ya existe
-                    comp_tuple = (product_db.id, comp_data['brand'], comp_data['model'], comp_data['serie'])
-                    if comp_tuple not in existing_compatibilities:
-                        compatibilities_to_create.append(
-                            Compatibility(
-                                product=product_db,
-                                brand=comp_data['brand'],
-                                model=comp_data['model'],
-                                serie=comp_data['serie']
-                            )
-                        )
-
-        if compatibilities_to_create:
-            self.stdout.write(self.style.SUCCESS(f'📦 Creando {len(compatibilities_to_create)} compatibilidades en bulk...'))
-            Compatibility.objects.bulk_create(compatibilities_to_create, batch_size=1000, ignore_conflicts=True)
-            self.stdout.write(self.style.SUCCESS(f'✅ {len(compatibilities_to_create)} compatibilidades creadas'))
-
-        self.stdout.write(self.style.SUCCESS(f'✅ Proceso completado: {creados} productos nuevos cargados'))
-
-
-        # ============ FINALIZAR ============ #
-        end_time = time.time()
-        total_time = end_time - start_time
-
-        self.stdout.write(self.style.SUCCESS(
-            f'\n{"="*70}\n'
-            f'✅ ACTUALIZACIÓN COMPLETADA\n'
-            f'{"="*70}\n'
-            f'⏱️  Tiempo total: {timedelta(seconds=int(total_time))} ({total_time:.2f} segundos)\n'
-            f'{"="*70}\n'
-            f' - Productos actualizados: {n_update}\n'
-            f' - Productos nuevos creados: {creados}\n'
-            f' - Productos no encontrado: {len(products_not_found)}\n'
-        ))
\ No newline at end of file
+    def ensure_categories(self, names):
+        """Categorías por nombre, creando las que falten; se recuerdan entre chunks"""
+        missing = names - self.categories.keys()
+        if not missing:
+            return
+        existing = {cat.name: cat for cat in Category.objects.filter(name__in=missing)}
+        new_categories = [Category(name=name) for name in missing if name not in existing]
+        if new_categories:
+            Category.objects.bulk_create(new_categories, ignore_conflicts=True)
+            existing = {cat.name: cat for cat in Category.objects.filter(name__in=missing)}
+        self.categories.update(existing)
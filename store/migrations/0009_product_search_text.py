@@ -0,0 +1,98 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:53
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Copias congeladas de store.search: la migración no debe cambiar si cambia el código de la app
+SQLITE_FTS_TABLE = 'store_product_fts'
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower().strip()
+
+
+def build_search_text(*parts):
+    return ' '.join(normalize(part) for part in parts if part)
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Misma expresión que genera SearchVector('search_text', config='spanish') en
+    # PostgresSearchBackend: to_tsvector(%s::regconfig, COALESCE(search_text, %s))
+    # con ('spanish', ''). Si no coinciden, el planner no usa el índice.
+    "CREATE INDEX IF NOT EXISTS store_product_search_tsv_idx ON store_product "
+    "USING GIN (to_tsvector('spanish'::regconfig, COALESCE(search_text, '')))",
+    "CREATE INDEX IF NOT EXISTS store_product_search_trgm_idx ON store_product "
+    "USING GIN (search_text gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS store_product_part_number_prefix_idx ON store_product "
+    "(UPPER(part_number::text) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS store_product_sku_prefix_idx ON store_product "
+    "(UPPER(sku::text) text_pattern_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS store_product_search_tsv_idx",
+    "DROP INDEX IF EXISTS store_product_search_trgm_idx",
+    "DROP INDEX IF EXISTS store_product_part_number_prefix_idx",
+    "DROP INDEX IF EXISTS store_product_sku_prefix_idx",
+]
+
+
+def populate_search_text(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    batch = []
+    for product in Product.objects.select_related('category').iterator(chunk_size=2000):
+        product.search_text = build_search_text(
+            product.part_number, product.sku, product.name, product.description,
+            product.category.name if product.category_id else '', product.subcategory,
+        )
+        batch.append(product)
+        if len(batch) >= 2000:
+            Product.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['search_text'])
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+            f"USING fts5(search_text, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, search_text) SELECT id, search_text FROM store_product"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for statement in POSTGRES_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sync_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_product_sync_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, unique=True)),
+                ('is_valid', models.BooleanField(default=False)),
+                ('last_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
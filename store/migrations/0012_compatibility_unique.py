@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:03
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_compatibilities(apps, schema_editor):
+    """Deja una sola fila (la más antigua) por producto/marca/modelo/serie"""
+    Compatibility = apps.get_model('store', 'Compatibility')
+    keep = (
+        Compatibility.objects.values('product_id', 'brand', 'model', 'serie')
+        .annotate(keep_id=Min('id'))
+        .values('keep_id')
+    )
+    Compatibility.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_imagecheck'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compatibility',
+            name='seen_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(remove_duplicate_compatibilities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='compatibility',
+            constraint=models.UniqueConstraint(fields=('product', 'brand', 'model', 'serie'), name='store_compatibility_unique'),
+        ),
+    ]
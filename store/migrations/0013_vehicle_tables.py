@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_compatibility_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleBrand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VehicleModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='models', to='store.vehiclebrand')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('brand', 'name'), name='store_vehiclemodel_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VehicleSerie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='store.vehiclemodel')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('model', 'name'), name='store_vehicleserie_unique')],
+            },
+        ),
+        migrations.AddField(
+            model_name='compatibility',
+            name='serie_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.vehicleserie'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:20
+
+from django.db import migrations
+
+
+# Migración aparte de 0013 y 0015: en PostgreSQL las FKs son DEFERRABLE INITIALLY
+# DEFERRED y los UPDATE de serie_ref dejan chequeos pendientes hasta el COMMIT; un
+# ALTER TABLE sobre store_compatibility en la misma transacción falla.
+def backfill_vehicles(apps, schema_editor):
+    """
+    Crea marcas, modelos y series a partir de los textos de Compatibility y
+    apunta cada compatibilidad a su serie. Las filas que quedan repetidas al
+    quitar espacios se eliminan.
+    """
+    Compatibility = apps.get_model('store', 'Compatibility')
+    VehicleBrand = apps.get_model('store', 'VehicleBrand')
+    VehicleModel = apps.get_model('store', 'VehicleModel')
+    VehicleSerie = apps.get_model('store', 'VehicleSerie')
+
+    rows = [
+        (compat_id, product_id, (brand.strip(), model.strip(), serie.strip()))
+        for compat_id, product_id, brand, model, serie in Compatibility.objects.values_list(
+            'id', 'product_id', 'brand', 'model', 'serie'
+        ).iterator(chunk_size=5000)
+    ]
+    names = {vehicle for _, _, vehicle in rows}
+
+    VehicleBrand.objects.bulk_create([VehicleBrand(name=name) for name in {b for b, _, _ in names}])
+    brands = dict(VehicleBrand.objects.values_list('name', 'id'))
+
+    VehicleModel.objects.bulk_create([
+        VehicleModel(brand_id=brand_id, name=name) for brand_id, name in {(brands[b], m) for b, m, _ in names}
+    ])
+    vehicle_models = {(brand_id, name): model_id for model_id, brand_id, name in VehicleModel.objects.values_list('id', 'brand_id', 'name')}
+
+    VehicleSerie.objects.bulk_create([
+        VehicleSerie(model_id=model_id, name=name)
+        for model_id, name in {(vehicle_models[brands[b], m], s) for b, m, s in names}
+    ])
+    series = {(model_id, name): serie_id for serie_id, model_id, name in VehicleSerie.objects.values_list('id', 'model_id', 'name')}
+
+    by_serie = {}
+    duplicates = []
+    seen = set()
+    for compat_id, product_id, (brand, model, serie) in rows:
+        serie_id = series[vehicle_models[brands[brand], model], serie]
+        if (product_id, serie_id) in seen:
+            duplicates.append(compat_id)
+            continue
+        seen.add((product_id, serie_id))
+        by_serie.setdefault(serie_id, []).append(compat_id)
+
+    for start in range(0, len(duplicates), 1000):
+        Compatibility.objects.filter(id__in=duplicates[start:start + 1000]).delete()
+    for serie_id, compat_ids in by_serie.items():
+        for start in range(0, len(compat_ids), 1000):
+            Compatibility.objects.filter(id__in=compat_ids[start:start + 1000]).update(serie_ref_id=serie_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_vehicle_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_vehicles, migrations.RunPython.noop),
+    ]
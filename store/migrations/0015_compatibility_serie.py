@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_vehicle_backfill'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='compatibility',
+            name='store_compatibility_unique',
+        ),
+        migrations.RemoveField(
+            model_name='compatibility',
+            name='brand',
+        ),
+        migrations.RemoveField(
+            model_name='compatibility',
+            name='model',
+        ),
+        migrations.RemoveField(
+            model_name='compatibility',
+            name='serie',
+        ),
+        migrations.RenameField(
+            model_name='compatibility',
+            old_name='serie_ref',
+            new_name='serie',
+        ),
+        migrations.AlterField(
+            model_name='compatibility',
+            name='serie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatibilities', to='store.vehicleserie'),
+        ),
+        migrations.AddConstraint(
+            model_name='compatibility',
+            constraint=models.UniqueConstraint(fields=('product', 'serie'), name='store_compatibility_unique'),
+        ),
+    ]
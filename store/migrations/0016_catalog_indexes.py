@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_compatibility_serie'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='compatibility',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='compatibilities', to='store.product'),
+        ),
+        migrations.AlterField(
+            model_name='compatibility',
+            name='serie',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='compatibilities', to='store.vehicleserie'),
+        ),
+        migrations.AddIndex(
+            model_name='compatibility',
+            index=models.Index(fields=['serie', 'product'], name='store_compat_serie_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0), ('stock_international__gt', 0), _connector='OR'), fields=['category', 'name', 'id'], name='store_product_instock_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0), ('stock_international__gt', 0), _connector='OR'), fields=['name', 'id'], name='store_product_instock_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['provider', 'part_number'], name='store_product_provider_pn_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:09
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_availability(apps, schema_editor):
+    """Calcula la disponibilidad de los productos existentes con dos UPDATE"""
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(stock__gt=0).update(availability='nacional')
+    Product.objects.filter(Q(stock__lte=0) & Q(stock_international__gt=0)).update(availability='internacional')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='store_product_instock_cat_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='store_product_instock_name_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='availability',
+            field=models.CharField(choices=[('nacional', 'Stock nacional'), ('internacional', 'Stock internacional'), ('sin_stock', 'Sin stock')], db_index=True, default='sin_stock', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('availability__in', ['nacional', 'internacional'])), fields=['category', 'name', 'id'], name='store_product_instock_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('availability__in', ['nacional', 'internacional'])), fields=['name', 'id'], name='store_product_instock_name_idx'),
+        ),
+    ]
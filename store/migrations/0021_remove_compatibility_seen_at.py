@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_cache_table'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='compatibility',
+            name='seen_at',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_remove_compatibility_seen_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='store_product_instock_cat_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='store_product_instock_name_idx',
+        ),
+    ]
@@ -1,9 +1,13 @@
-from django.db import models
+from django.db import connection, models
 import datetime
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models import F, Case, When, Value
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from payment.validators import validar_rut
+from store.tracking import TrackedFieldsMixin
 
 
 class Profile(models.Model):
@@ -72,7 +76,25 @@ class Provider(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class Product(TrackedFieldsMixin, models.Model):
+    # Disponibilidad desnormalizada a partir de stock y stock_international
+    AVAILABILITY_CHOICES = [
+        ('nacional', 'Stock nacional'),
+        ('internacional', 'Stock internacional'),
+        ('sin_stock', 'Sin stock'),
+    ]
+    IN_STOCK_AVAILABILITY = ['nacional', 'internacional']
+
+    # Campos que usan los índices y cachés del catálogo (facetas, autocompletado,
+    # listados, fichas): si cambian, se incrementa la versión del catálogo
+    tracked_fields = (
+        'sku', 'part_number', 'name', 'description', 'price', 'is_sale', 'sale_price',
+        'category_id', 'subcategory', 'image', 'stock', 'stock_international',
+    )
+
+    # Campos que escribe update_products y que cubre sync_hash
+    SYNC_FIELDS = ('price', 'stock', 'stock_international', 'image')
+
     sku = models.CharField(max_length=50, unique=True, blank=True, null=True)
     name = models.CharField(max_length=100)
     part_number = models.CharField(max_length=50, default='', blank=True, null=True)
@@ -91,21 +113,289 @@ class Product(models.Model):
     motor = models.CharField(max_length=100, default='', blank=True, null=True)
     stock = models.IntegerField(default=0)
     stock_international = models.IntegerField(default=0)
+    availability = models.CharField(max_length=20, choices=AVAILABILITY_CHOICES, default='sin_stock', db_index=True, editable=False)
     tariff_code = models.CharField(max_length=50, default='', blank=True, null=True)
     provider = models.ForeignKey(Provider, on_delete=models.CASCADE, null=True, blank=True)
     recommended_quantities = models.CharField(max_length=200, default='', blank=True, null=True)
+    # Texto normalizado para búsqueda (nombre, descripción, sku, número de parte, categoría)
+    search_text = models.TextField(default='', blank=True, editable=False)
+    # Hash de los datos del proveedor en la última sincronización (update_products)
+    sync_hash = models.CharField(max_length=16, default='', blank=True, editable=False)
+    # Última modificación (lastmod del sitemap); las cargas masivas la fijan explícitamente
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Sin índices parciales para el listado: el paginador ordena por una expresión
+        # (has_default_image) que ningún índice de columnas cubre; el filtro con stock
+        # lo resuelve el índice de availability
+        indexes = [
+            # Búsqueda por número de parte de las cargas del proveedor
+            models.Index(fields=['provider', 'part_number'], name='store_product_provider_pn_idx'),
+        ]
 
     def __str__(self):
         return f"{self.part_number} - {self.name}"
 
+    @staticmethod
+    def compute_availability(stock, stock_international):
+        """Nacional si hay stock local; si no, internacional si hay stock afuera"""
+        if stock > 0:
+            return 'nacional'
+        if stock_international > 0:
+            return 'internacional'
+        return 'sin_stock'
+
+    @classmethod
+    def refresh_availability(cls, ids):
+        """Recalcula availability en la BD después de descontar stock con F()"""
+        return cls.objects.filter(pk__in=ids).update(availability=Case(
+            When(stock__gt=0, then=Value('nacional')),
+            When(stock_international__gt=0, then=Value('internacional')),
+            default=Value('sin_stock'),
+        ))
+
+    def save(self, *args, **kwargs):
+        from store.search import product_search_text
+        self.search_text = product_search_text(self, self.category.name if self.category_id else '')
+        self.availability = self.compute_availability(self.stock, self.stock_international)
+        update_fields = kwargs.get('update_fields')
+        derived = {'search_text', 'availability', 'updated_at'}
+
+        # Precio, stock o imagen editados fuera de la carga: update_products debe volver a escribir la fila
+        sync_fields = [name for name in self.SYNC_FIELDS if update_fields is None or name in update_fields]
+        if self.pk is not None and self.sync_hash and self.changed_fields(sync_fields):
+            self.sync_hash = ''
+            derived.add('sync_hash')
+
+        if update_fields is not None:
+            kwargs['update_fields'] = [*update_fields, *derived - set(update_fields)]
+        super().save(*args, **kwargs)
+
+class VehicleBrand(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class VehicleModel(models.Model):
+    brand = models.ForeignKey(VehicleBrand, related_name='models', on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['brand', 'name'], name='store_vehiclemodel_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.brand} {self.name}"
+
+
+class VehicleSerie(models.Model):
+    model = models.ForeignKey(VehicleModel, related_name='series', on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'name'], name='store_vehicleserie_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.name}"
+
+    @classmethod
+    def ids_for(cls, vehicles):
+        """
+        Retorna {(marca, modelo, serie): id} para las combinaciones indicadas,
+        creando en bulk las marcas, modelos y series que falten. Los nombres se
+        guardan sin espacios al inicio ni al final.
+        """
+        keys = {vehicle: tuple(str(part).strip() for part in vehicle) for vehicle in set(vehicles)}
+        names = set(keys.values())
+        if not names:
+            return {}
+
+        brand_names = {brand for brand, _, _ in names}
+        VehicleBrand.objects.bulk_create([VehicleBrand(name=name) for name in brand_names], ignore_conflicts=True)
+        brands = dict(VehicleBrand.objects.filter(name__in=brand_names).values_list('name', 'id'))
+
+        model_keys = {(brands[brand], model) for brand, model, _ in names}
+        VehicleModel.objects.bulk_create(
+            [VehicleModel(brand_id=brand_id, name=name) for brand_id, name in model_keys], ignore_conflicts=True
+        )
+        vehicle_models = {
+            (brand_id, name): model_id
+            for model_id, brand_id, name in VehicleModel.objects.filter(
+                brand_id__in=set(brands.values())
+            ).values_list('id', 'brand_id', 'name')
+        }
+
+        serie_keys = {(vehicle_models[brands[brand], model], serie) for brand, model, serie in names}
+        cls.objects.bulk_create([cls(model_id=model_id, name=name) for model_id, name in serie_keys], ignore_conflicts=True)
+        series = {
+            (model_id, name): serie_id
+            for serie_id, model_id, name in cls.objects.filter(
+                model_id__in={model_id for model_id, _ in serie_keys}
+            ).values_list('id', 'model_id', 'name')
+        }
+
+        return {
+            vehicle: series[vehicle_models[brands[brand], model], serie]
+            for vehicle, (brand, model, serie) in keys.items()
+        }
+
+
 class Compatibility(models.Model):
-    product = models.ForeignKey(Product, related_name='compatibilities', on_delete=models.CASCADE)
-    brand = models.CharField(max_length=100)
-    model = models.CharField(max_length=100)
-    serie = models.CharField(max_length=100)
+    # Sin índices simples: los cubren la restricción única (product, serie) y el índice (serie, product)
+    product = models.ForeignKey(Product, related_name='compatibilities', on_delete=models.CASCADE, db_index=False)
+    serie = models.ForeignKey(VehicleSerie, related_name='compatibilities', on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'serie'], name='store_compatibility_unique'),
+        ]
+        indexes = [
+            # Filtro por vehículo: productos de una serie
+            models.Index(fields=['serie', 'product'], name='store_compat_serie_product_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.serie)
+
+    @classmethod
+    def insert_missing(cls, pairs, batch_size=1000):
+        """
+        Inserta las compatibilidades (product_id, serie_id) que aún no existen,
+        con INSERT ... ON CONFLICT DO NOTHING sobre la restricción única: las
+        que ya están no se escriben. Retorna cuántas se insertaron.
+        """
+        # bulk_create(ignore_conflicts=True) no informa cuántas filas insertó; el rowcount sí
+        pairs = list(set(pairs))
+        fields = [cls._meta.get_field('product'), cls._meta.get_field('serie')]
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, pairs) or batch_size)
+        table = connection.ops.quote_name(cls._meta.db_table)
+
+        inserted = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(pairs), batch_size):
+                batch = pairs[start:start + batch_size]
+                cursor.execute(
+                    f'INSERT INTO {table} (product_id, serie_id) VALUES {", ".join(["(%s, %s)"] * len(batch))} '
+                    'ON CONFLICT (product_id, serie_id) DO NOTHING',
+                    [value for pair in batch for value in pair],
+                )
+                inserted += cursor.rowcount
+        return inserted
+
+
+class CatalogVersion(models.Model):
+    """Contador global del catálogo, compartido entre los procesos web y los comandos de carga"""
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Catálogo v{self.version}"
+
+    @classmethod
+    def current(cls):
+        """Retorna la versión actual (0 si el catálogo nunca se ha versionado)"""
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        """Incrementa la versión con un UPDATE atómico"""
+        updated = cls.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+class ImageCheck(models.Model):
+    """Resultado de la última verificación de una URL de imagen (ver store/images.py)"""
+    url = models.URLField(max_length=500, unique=True)
+    is_valid = models.BooleanField(default=False)
+    last_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    checked_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        return f"{self.brand} {self.model} {self.serie}"
+        return f"{self.url} ({self.last_status})"
+
+
+class EmailJob(models.Model):
+    """Email transaccional pendiente de envío (cola procesada por el comando process_email_jobs)"""
+    KIND_CHOICES = [
+        ('registration', 'Bienvenida'),
+        ('order_confirmation', 'Confirmación de orden'),
+        ('provider_notification', 'Aviso a proveedores'),
+        ('pending_order', 'Orden pendiente (transferencia)'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'Enviando'),
+        ('sent', 'Enviado'),
+        ('failed', 'Fallido'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    # Un mismo email (tipo + orden o destinatario) se encola una sola vez
+    idempotency_key = models.CharField(max_length=150, unique=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='emailjob_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} [{self.idempotency_key}] - {self.status}"
+
+
+# Cambios que invalidan los índices del catálogo (las cargas masivas llaman a bump_catalog_version directamente)
+@receiver(post_save, sender=Product)
+def bump_catalog_on_product_change(sender, instance, created, update_fields=None, **kwargs):
+    saved = None
+    if update_fields is not None:
+        saved = [name for name in instance.tracked_fields if sender._meta.get_field(name).name in update_fields]
+    if created or instance.changed_fields(saved):
+        from store.catalog import bump_catalog_version
+        bump_catalog_version()
+
+
+# Mantener el índice de texto (FTS5 en SQLite; en PostgreSQL es un índice sobre la columna)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def index_product_search(sender, instance, **kwargs):
+    from store.search import get_search_backend
+    get_search_backend().index_products([instance.pk])
+
+
+@receiver(post_save, sender=Compatibility)
+@receiver(post_delete, sender=Compatibility)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_on_delete_or_compatibility(sender, instance, **kwargs):
+    from store.catalog import bump_catalog_version
+    bump_catalog_version()
+
+
+# Descartar la ficha cacheada (store/detail.py) cuando se edita el producto o sus compatibilidades
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Compatibility)
+@receiver(post_delete, sender=Compatibility)
+def invalidate_product_detail_cache(sender, instance, **kwargs):
+    from django.db import transaction
+    from store.detail import invalidate_product_detail
+    product_id = instance.product_id if sender is Compatibility else instance.pk
+    # Después del COMMIT: así un request concurrente no vuelve a cachear la fila anterior
+    transaction.on_commit(lambda: invalidate_product_detail(product_id))
 
 
 # Guest Users
@@ -0,0 +1,152 @@
+import base64
+import json
+import math
+
+from django.db.models import Q
+from django.http import Http404
+
+
+# Páginas numeradas (?page=N) que se siguen aceptando con OFFSET; más allá se usa solo el cursor
+MAX_OFFSET_PAGE = 10
+
+# Tope del COUNT cuando no se conoce el total exacto (ej: búsquedas de texto)
+APPROXIMATE_COUNT_CAP = 1000
+
+
+def encode_cursor(direction, key, number):
+    """Serializa la posición (dirección, clave de orden y número de página) en un token opaco"""
+    payload = json.dumps([direction, list(key), number], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Retorna (dirección, clave, número) o None si el cursor es inválido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, key, number = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        has_default_image, name, pk = key
+        if direction not in ('n', 'p') or not isinstance(name, str):
+            return None
+        return direction, (int(has_default_image), name, int(pk)), max(int(number), 1)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """Página de resultados con la misma interfaz que usa el template de Paginator"""
+
+    def __init__(self, object_list, number, has_next, has_previous, paginator):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ''
+        return encode_cursor('n', self.paginator.key_of(self.object_list[-1]), self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ''
+        return encode_cursor('p', self.paginator.key_of(self.object_list[0]), self.number - 1)
+
+    @property
+    def last_cursor(self):
+        return encode_cursor('p', KeysetPaginator.END_KEY, self.paginator.num_pages)
+
+
+class KeysetPaginator:
+    """
+    Paginación por cursor sobre el orden (has_default_image, name, id).
+
+    Cada página se obtiene con un WHERE sobre la clave de la última fila vista,
+    así que el costo no crece con la profundidad como ocurre con OFFSET. El
+    total de páginas usa un conteo conocido (ej: del índice de facetas) o un
+    COUNT con tope.
+    """
+
+    # Clave mayor que cualquier fila real, para pedir la última página
+    END_KEY = (2, '', 0)
+
+    def __init__(self, queryset, per_page, count=None):
+        self.queryset = queryset.order_by('has_default_image', 'name', 'id')
+        self.per_page = per_page
+        self._count = count
+        self.is_approximate = False
+
+    @staticmethod
+    def key_of(obj):
+        return (obj.has_default_image, obj.name, obj.id)
+
+    @property
+    def count(self):
+        if self._count is None:
+            capped = self.queryset.order_by()[:APPROXIMATE_COUNT_CAP].count()
+            self.is_approximate = capped >= APPROXIMATE_COUNT_CAP
+            self._count = capped
+        return self._count
+
+    @property
+    def num_pages(self):
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    def page(self, cursor=None, page_number=None):
+        """Página indicada por el cursor; sin cursor acepta ?page=N hasta MAX_OFFSET_PAGE"""
+        position = decode_cursor(cursor) if cursor else None
+        if position:
+            direction, key, number = position
+            if direction == 'n':
+                return self._page_after(key, number)
+            return self._page_before(key, number)
+
+        try:
+            number = int(page_number or 1)
+        except (TypeError, ValueError):
+            number = 1
+        if number > MAX_OFFSET_PAGE:
+            raise Http404("Página no disponible")
+        number = max(number, 1)
+
+        offset = (number - 1) * self.per_page
+        rows = list(self.queryset[offset:offset + self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], number, len(rows) > self.per_page, number > 1, self)
+
+    def _page_after(self, key, number):
+        has_default_image, name, pk = key
+        rows = list(self.queryset.filter(
+            Q(has_default_image__gt=has_default_image) |
+            Q(has_default_image=has_default_image, name__gt=name) |
+            Q(has_default_image=has_default_image, name=name, id__gt=pk)
+        )[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], number, len(rows) > self.per_page, True, self)
+
+    def _page_before(self, key, number):
+        has_default_image, name, pk = key
+        rows = list(self.queryset.filter(
+            Q(has_default_image__lt=has_default_image) |
+            Q(has_default_image=has_default_image, name__lt=name) |
+            Q(has_default_image=has_default_image, name=name, id__lt=pk)
+        ).reverse()[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(rows, number if has_previous else 1, key != self.END_KEY, has_previous, self)
@@ -0,0 +1,169 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+# Tabla FTS5 usada en SQLite (desarrollo y tests)
+SQLITE_FTS_TABLE = 'store_product_fts'
+
+# Máximo de resultados de la vista de búsqueda
+SEARCH_RESULTS_LIMIT = 100
+
+TOKEN_RE = re.compile(r'[\w-]+')
+
+
+def normalize(text):
+    """Minúsculas y sin tildes, para que 'Filtro' y 'FILTRÓ' coincidan"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower().strip()
+
+
+def build_search_text(*parts):
+    """Texto desnormalizado que se guarda en Product.search_text"""
+    return ' '.join(normalize(part) for part in parts if part)
+
+
+def product_search_text(product, category_name=''):
+    return build_search_text(
+        product.part_number, product.sku, product.name, product.description,
+        category_name, product.subcategory,
+    )
+
+
+def part_number_prefix(query):
+    """Filtro de prefijo para números de parte y SKU"""
+    query = query.strip()
+    return Q(part_number__istartswith=query) | Q(sku__istartswith=query)
+
+
+class BasicSearchBackend:
+    """Búsqueda por substring sobre la columna desnormalizada (sin índices de texto)"""
+
+    def filter(self, queryset, query):
+        return queryset.filter(Q(search_text__contains=normalize(query)) | part_number_prefix(query))
+
+    def search(self, queryset, query, limit=SEARCH_RESULTS_LIMIT):
+        prefix = Case(When(part_number_prefix(query), then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+        return list(self.filter(queryset, query).annotate(rank=prefix).order_by('-rank', 'name')[:limit])
+
+    def index_products(self, product_ids):
+        """Sincroniza el índice de texto de los productos indicados"""
+
+    def rebuild(self):
+        """Reconstruye el índice de texto completo"""
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    """
+    tsvector con configuración 'spanish' (stemming) más índice trigram para
+    substrings. Los índices GIN se crean en la migración 0009.
+    """
+
+    def _vector(self):
+        # Debe renderizar la misma expresión que el índice store_product_search_tsv_idx (migración 0009)
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector('search_text', config='spanish')
+
+    def _query(self, query):
+        from django.contrib.postgres.search import SearchQuery
+        return SearchQuery(normalize(query), config='spanish', search_type='websearch')
+
+    def filter(self, queryset, query):
+        return queryset.annotate(search_vector=self._vector()).filter(
+            Q(search_vector=self._query(query)) |
+            Q(search_text__contains=normalize(query)) |
+            part_number_prefix(query)
+        )
+
+    def search(self, queryset, query, limit=SEARCH_RESULTS_LIMIT):
+        from django.contrib.postgres.search import SearchRank
+        prefix = Case(When(part_number_prefix(query), then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+        return list(
+            self.filter(queryset, query)
+            .annotate(rank=SearchRank(self._vector(), self._query(query)) + prefix)
+            .order_by('-rank', 'name')[:limit]
+        )
+
+
+class SqliteSearchBackend(BasicSearchBackend):
+    """
+    FTS5 en SQLite. No hay stemmer español, así que cada término se busca como
+    prefijo y se le quita el plural ('filtros' -> 'filtro*').
+    """
+
+    def _match_expression(self, query):
+        terms = []
+        for token in TOKEN_RE.findall(normalize(query)):
+            if len(token) > 4 and token.endswith('es'):
+                token = token[:-2]
+            elif len(token) > 3 and token.endswith('s'):
+                token = token[:-1]
+            terms.append('"%s"*' % token.replace('"', '""'))
+        return ' '.join(terms)
+
+    def filter(self, queryset, query):
+        expression = self._match_expression(query)
+        if not expression:
+            return queryset.filter(part_number_prefix(query))
+        matches = RawSQL(f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s', (expression,))
+        return queryset.filter(Q(id__in=matches) | part_number_prefix(query))
+
+    def search(self, queryset, query, limit=SEARCH_RESULTS_LIMIT):
+        expression = self._match_expression(query)
+        ranked_ids = []
+        if expression:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s '
+                    f'ORDER BY bm25({SQLITE_FTS_TABLE}) LIMIT %s',
+                    (expression, limit * 5),
+                )
+                ranked_ids = [row[0] for row in cursor.fetchall()]
+
+        # Coincidencias de número de parte primero, luego por relevancia bm25
+        prefix_ids = list(queryset.filter(part_number_prefix(query)).order_by('name').values_list('id', flat=True)[:limit])
+        order = {product_id: position for position, product_id in enumerate(dict.fromkeys(prefix_ids + ranked_ids))}
+        products = queryset.filter(id__in=list(order)).in_bulk()
+        return [products[product_id] for product_id in sorted(order, key=order.get) if product_id in products][:limit]
+
+    def index_products(self, product_ids):
+        from store.models import Product
+        rows = list(Product.objects.filter(id__in=product_ids).values_list('id', 'search_text'))
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s', [(product_id,) for product_id in product_ids])
+            cursor.executemany(f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, search_text) VALUES (%s, %s)', rows)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, search_text) SELECT id, search_text FROM store_product')
+
+
+def sqlite_fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (SQLITE_FTS_TABLE,))
+        return cursor.fetchone() is not None
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Backend configurado en PRODUCT_SEARCH_BACKEND o el adecuado para la BD actual"""
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        elif connection.vendor == 'sqlite' and sqlite_fts_available():
+            _backend = SqliteSearchBackend()
+        else:
+            _backend = BasicSearchBackend()
+    return _backend
@@ -1,6 +1,33 @@
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.core.cache import caches
+from django.template.loader import render_to_string
 from django.urls import reverse
-from .models import Product, Category
+
+from store.catalog import get_catalog_version
+from store.facets import IN_STOCK
+from .models import CatalogVersion, Product, Category
+
+
+# Dominio con el que se arman las URLs absolutas (el sitemap se genera fuera de un request)
+SITEMAP_BASE_URL = getattr(settings, 'SITEMAP_BASE_URL', 'https://4x4max.cl')
+
+# URLs por sección de productos (el protocolo permite hasta 50.000)
+SITEMAP_PAGE_SIZE = getattr(settings, 'SITEMAP_PAGE_SIZE', 10000)
+
+# Una generación que tarde más que esto se da por abandonada y otro proceso puede tomarla
+SITEMAP_BUILD_LOCK_SECONDS = 30 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    # Caché compartido entre procesos (settings.CACHES['sitemaps'])
+    return caches['sitemaps']
 
 
 class ProductSitemap(Sitemap):
@@ -8,15 +35,14 @@ class ProductSitemap(Sitemap):
     priority = 0.8
 
     def items(self):
-        return Product.objects.filter(
-            stock__gt=0
-        ) | Product.objects.filter(
-            stock_international__gt=0
-        )
+        return Product.objects.filter(IN_STOCK).only('id', 'updated_at').order_by('id')
 
     def location(self, obj):
         return reverse('product', args=[obj.id])
 
+    def lastmod(self, obj):
+        return obj.updated_at
+
 
 class StaticSitemap(Sitemap):
     changefreq = 'monthly'
@@ -26,4 +52,127 @@ class StaticSitemap(Sitemap):
         return ['home', 'all_products', 'about']
 
     def location(self, item):
-        return reverse(item)
\ No newline at end of file
+        return reverse(item)
+
+
+def _cache_key(build, section):
+    return f'sitemap:{build}:{section}'
+
+
+# Última generación completa: {'build': id, 'version': versión del catálogo}
+CURRENT_BUILD_KEY = 'sitemap:current'
+BUILD_LOCK_KEY = 'sitemap:lock'
+
+
+def current_build():
+    return _cache().get(CURRENT_BUILD_KEY)
+
+
+def _document(template, context, last_modified):
+    """XML renderizado con su ETag y fecha de última modificación"""
+    content = render_to_string(template, context)
+    return {
+        'content': content,
+        'etag': hashlib.md5(content.encode()).hexdigest(),
+        'last_modified': last_modified,
+    }
+
+
+def _urlset(sitemap, items):
+    urlset = []
+    for item in items:
+        urlset.append({
+            'location': SITEMAP_BASE_URL + sitemap.location(item),
+            'lastmod': sitemap.lastmod(item) if hasattr(sitemap, 'lastmod') else None,
+            'changefreq': sitemap.changefreq,
+            'priority': str(sitemap.priority),
+        })
+    return urlset
+
+
+def build_sitemaps(version=None):
+    """
+    Genera el índice y todas las secciones del sitemap y, cuando están todas en
+    caché, las publica como la generación vigente. Los productos se recorren
+    una sola vez en orden de id. Solo la llaman los comandos de carga y
+    build_sitemaps, nunca un request. Retorna los nombres de las secciones, o
+    None si otro proceso está generando el sitemap.
+    """
+    cache = _cache()
+    # cache.add es atómico en la tabla compartida: una sola generación a la vez entre procesos
+    if not cache.add(BUILD_LOCK_KEY, True, SITEMAP_BUILD_LOCK_SECONDS):
+        logger.warning('[SITEMAP] Otro proceso está generando el sitemap; se omite esta generación')
+        return None
+    try:
+        return _build(cache, get_catalog_version(force=True) if version is None else version)
+    finally:
+        cache.delete(BUILD_LOCK_KEY)
+
+
+def _build(cache, version):
+    catalog_updated_at = CatalogVersion.objects.filter(pk=1).values_list('updated_at', flat=True).first()
+
+    documents = {}
+    static = StaticSitemap()
+    documents['static'] = _document('sitemap.xml', {'urlset': _urlset(static, static.items())}, catalog_updated_at)
+
+    products = ProductSitemap()
+    page = []
+
+    def flush():
+        name = f'products-{sum(1 for section in documents if section.startswith("products-")) + 1}'
+        last_modified = max((product.updated_at for product in page), default=catalog_updated_at)
+        documents[name] = _document('sitemap.xml', {'urlset': _urlset(products, page)}, last_modified)
+        page.clear()
+
+    for product in products.items().iterator(chunk_size=2000):
+        page.append(product)
+        if len(page) == SITEMAP_PAGE_SIZE:
+            flush()
+    if page:
+        flush()
+
+    sections = list(documents)
+    index = [
+        {
+            'location': SITEMAP_BASE_URL + reverse('sitemap_section', args=[name]),
+            'last_mod': documents[name]['last_modified'],
+        }
+        for name in sections
+    ]
+    last_modified = max((site['last_mod'] for site in index if site['last_mod']), default=None)
+    documents['index'] = _document('sitemap_index.xml', {'sitemaps': index}, last_modified)
+    documents['index']['sections'] = sections
+
+    # Primero los documentos y después el puntero: un request nunca ve una generación a medias
+    build = uuid.uuid4().hex
+    previous = cache.get(CURRENT_BUILD_KEY)
+    cache.set_many({_cache_key(build, name): document for name, document in documents.items()}, None)
+    cache.set(CURRENT_BUILD_KEY, {'build': build, 'version': version}, None)
+
+    if previous:
+        old_index = cache.get(_cache_key(previous['build'], 'index'))
+        old_sections = old_index['sections'] if old_index else []
+        cache.delete_many([_cache_key(previous['build'], name) for name in ['index', *old_sections]])
+    return sections
+
+
+def get_sitemap(section='index'):
+    """
+    Documento de una sección ('index', 'static', 'products-N') de la última
+    generación completa, o None si la sección no existe o aún no se generó.
+    Nunca genera en el request: el sitemap lo publican update_products,
+    load_products_csv y el comando build_sitemaps (programado en el worker).
+    """
+    for _ in range(2):
+        current = current_build()
+        if current is None:
+            logger.warning('[SITEMAP] No hay sitemap generado; ejecutar build_sitemaps')
+            return None
+        document = _cache().get(_cache_key(current['build'], section))
+        if document is not None:
+            return document
+        # Una generación nueva pudo reemplazar a la leída entre las dos lecturas
+        if current_build() == current:
+            return None
+    return None
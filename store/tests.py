@@ -1,3 +1,323 @@
-from django.test import TestCase
+import base64
+import csv
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from store.jobs import EMAIL_JOB_MAX_ATTEMPTS, EMAIL_JOB_RETRY_MAX_SECONDS, HANDLERS, claim_jobs, retry_delay, run_job
+from store.listing import listing_queryset
+from store.models import Category, EmailJob, Product, Provider
+from store.pagination import MAX_OFFSET_PAGE, KeysetPaginator, decode_cursor, encode_cursor
+from store.search import BasicSearchBackend, PostgresSearchBackend, SqliteSearchBackend, sqlite_fts_available
+from store.utils import DEFAULT_PRODUCT_IMAGE
+
+
+def create_product(**kwargs):
+    defaults = {
+        'sku': 'TEST-1', 'part_number': 'TEST-1', 'name': 'Producto de prueba', 'price': 1000, 'stock': 5,
+        'category': Category.objects.get_or_create(name='ENGINE')[0],
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class KeysetPaginatorTests(TestCase):
+    per_page = 3
+
+    def setUp(self):
+        # Dos sin foto (van al final) y nombres repetidos para ejercitar el desempate por id
+        for i, name in enumerate(['Bujía', 'Filtro', 'Filtro', 'Amortiguador', 'Rótula', 'Correa', 'Disco', 'Pastilla']):
+            create_product(
+                sku=f'KS-{i}', part_number=f'KS-{i}', name=name,
+                image=DEFAULT_PRODUCT_IMAGE if i in (1, 5) else f'http://x/{i}.jpg',
+            )
+        self.expected = list(
+            listing_queryset(None).order_by('has_default_image', 'name', 'id').values_list('id', flat=True)
+        )
+
+    def paginator(self):
+        return KeysetPaginator(listing_queryset(None), self.per_page)
+
+    def ids(self, page):
+        return [product.id for product in page]
+
+    def test_next_cursor_walks_every_row_once(self):
+        page = self.paginator().page()
+        seen = self.ids(page)
+        while page.has_next():
+            page = self.paginator().page(cursor=page.next_cursor)
+            seen += self.ids(page)
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(page.number, 3)
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = self.paginator().page()
+        second = self.paginator().page(cursor=first.next_cursor)
+
+        back = self.paginator().page(cursor=second.previous_cursor)
+
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertEqual(back.number, 1)
+        self.assertFalse(back.has_previous())
+
+    def test_last_cursor_returns_last_rows(self):
+        page = self.paginator().page()
+
+        last = self.paginator().page(cursor=page.last_cursor)
+
+        self.assertEqual(self.ids(last), self.expected[-self.per_page:])
+        self.assertFalse(last.has_next())
+
+    def test_page_number_matches_offset(self):
+        page = self.paginator().page(page_number='2')
+
+        self.assertEqual(self.ids(page), self.expected[self.per_page:2 * self.per_page])
+
+    def test_deep_page_number_is_rejected(self):
+        with self.assertRaises(Http404):
+            self.paginator().page(page_number=MAX_OFFSET_PAGE + 1)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        def token(payload):
+            return base64.urlsafe_b64encode(payload.encode()).decode()
+
+        tampered = [
+            'no-es-un-cursor',
+            token('{"a": 1}'),
+            token('["n", [0, "Filtro"], 2]'),
+            token('["x", [0, "Filtro", 1], 2]'),
+            token('["n", [0, 1, 1], 2]'),
+            token('["n", [0, "Filtro", "1 OR 1=1"], 2]'),
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                self.assertEqual(self.ids(self.paginator().page(cursor=cursor)), self.expected[:self.per_page])
+
+    def test_cursor_roundtrip_clamps_page_number(self):
+        self.assertEqual(decode_cursor(encode_cursor('n', (0, 'Filtro', 7), -3)), ('n', (0, 'Filtro', 7), 1))
+
+
+class SearchBackendTests(TestCase):
+    def setUp(self):
+        self.filtro = create_product(sku='90915-YZZE1', part_number='90915-YZZE1', name='Filtro de aceite')
+        self.rotula = create_product(sku='43330-09510', part_number='43330-09510', name='Rótula de suspensión')
+        # Lo nombra en la descripción: debe quedar después del que coincide por número de parte
+        self.kit = create_product(
+            sku='KIT-1', part_number='KIT-1', name='Kit de mantención', description='Incluye 90915-YZZE1',
+        )
+
+    def names(self, backend, query):
+        return [product.name for product in backend.filter(Product.objects.all(), query).order_by('name')]
+
+    def sqlite_backend(self):
+        if connection.vendor != 'sqlite' or not sqlite_fts_available():
+            self.skipTest('Requiere FTS5 en SQLite')
+        return SqliteSearchBackend()
+
+    def assert_backend(self, backend):
+        self.assertEqual(self.names(backend, 'FILTRO'), ['Filtro de aceite'])
+        self.assertEqual(self.names(backend, 'rotula'), ['Rótula de suspensión'])
+        self.assertEqual(self.names(backend, '43330'), ['Rótula de suspensión'])
+        self.assertEqual(backend.search(Product.objects.all(), '90915-YZZE1')[0], self.filtro)
+
+    def test_basic_backend(self):
+        self.assert_backend(BasicSearchBackend())
+
+    def test_sqlite_fts_backend(self):
+        backend = self.sqlite_backend()
+        self.assert_backend(backend)
+
+        # Sin stemmer: el plural se recorta y cada término se busca como prefijo
+        self.assertEqual(self.names(backend, 'filtros'), ['Filtro de aceite'])
+        self.assertEqual(self.names(backend, 'suspens'), ['Rótula de suspensión'])
+
+    def test_sqlite_fts_index_follows_product_changes(self):
+        backend = self.sqlite_backend()
+        self.rotula.name = 'Terminal de dirección'
+        self.rotula.save()
+
+        self.assertEqual(self.names(backend, 'terminal'), ['Terminal de dirección'])
+        self.assertEqual(self.names(backend, 'rotula'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+    def test_postgres_backend(self):
+        backend = PostgresSearchBackend()
+        self.assert_backend(backend)
+
+        # Stemming en español y substring por trigram
+        self.assertEqual(self.names(backend, 'filtros'), ['Filtro de aceite'])
+        self.assertEqual(self.names(backend, 'uspensi'), ['Rótula de suspensión'])
+
+
+class UpdateProductsTests(TestCase):
+    columns = [
+        'Numero de parte ', 'Marca', 'Modelo', 'Serie', 'Descripcion', 'Subgrupo', 'Tarrif Code', 'Motor', 'Grupo',
+        'Cant', 'Foto', 'Minorista', ' BR SOH', 'MELSOH', 'Peso (kg)', 'Largo (cm)', 'Alto (cm)', 'Ancho (cm)',
+        'Volumen (m3)',
+    ]
+
+    def setUp(self):
+        self.rows = {
+            'A-1': [1000, 3, 0],
+            'B-2': [2000, 0, 4],
+            'C-3': [3000, 1, 1],
+        }
+
+    def run_update(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='latin-1', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            for part_number, (price, stock, international) in self.rows.items():
+                for brand in ('TOYOTA', 'NISSAN'):
+                    writer.writerow([
+                        part_number, brand, 'HILUX', '2015', f'Pieza {part_number}', 'FILTROS', '', '', 'ENGINE',
+                        '', '', price, stock, international, 1, 1, 1, 1, 0.1,
+                    ])
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('update_products', f.name, '--skip-image-check', stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_unchanged_rows_are_skipped(self):
+        self.run_update()
+        updated_at = dict(Product.objects.values_list('sku', 'updated_at'))
+
+        out = self.run_update()
+
+        self.assertIn('Productos actualizados: 0', out)
+        self.assertIn('Productos sin cambios: 3', out)
+        self.assertIn('Compatibilidades nuevas: 0', out)
+        self.assertEqual(dict(Product.objects.values_list('sku', 'updated_at')), updated_at)
+
+    def test_changed_rows_are_written(self):
+        self.run_update()
+        self.rows['B-2'] = [2500, 2, 4]
+
+        out = self.run_update()
+
+        self.assertIn('Productos actualizados: 1', out)
+        self.assertIn('precio: 1, stock: 1, imagen: 0', out)
+        product = Product.objects.get(sku='B-2')
+        self.assertEqual((product.stock, product.availability), (2, 'nacional'))
+
+    def test_missing_rows_are_retired(self):
+        self.run_update()
+        other = create_product(sku='OTRO-1', part_number='OTRO-1', provider=Provider.objects.create(id=2, name='Otro'))
+        del self.rows['C-3']
+
+        out = self.run_update()
+
+        self.assertIn('Productos retirados (stock 0): 1', out)
+        retired = Product.objects.get(sku='C-3')
+        self.assertEqual((retired.stock, retired.stock_international, retired.availability), (0, 0, 'sin_stock'))
+        self.assertEqual(retired.sync_hash, '')
+        other.refresh_from_db()
+        self.assertEqual(other.stock, 5)
+
+    def test_retired_product_comes_back(self):
+        self.run_update()
+        removed = self.rows.pop('C-3')
+        self.run_update()
+        self.rows['C-3'] = removed
+
+        out = self.run_update()
+
+        self.assertIn('Productos actualizados: 1', out)
+        self.assertEqual(Product.objects.get(sku='C-3').stock, 1)
+
+
+class EmailJobTests(TransactionTestCase):
+    """run_job cierra la conexión al terminar, por eso no puede correr dentro de la transacción de TestCase"""
+
+    def setUp(self):
+        self.sent = []
+        patcher = mock.patch.dict(HANDLERS, {'registration': self.sent.append})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_job(self, key='registro:1', **kwargs):
+        return EmailJob.objects.create(kind='registration', idempotency_key=key, payload={'email': 'a@b.cl'}, **kwargs)
+
+    def fail(self, payload):
+        raise RuntimeError('SMTP caído')
+
+    def test_claim_takes_each_due_job_once(self):
+        job = self.create_job()
+        self.create_job('registro:2', next_attempt_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual(claim_jobs(10), [job])
+        self.assertEqual(claim_jobs(10), [])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('running', 1))
+
+    def test_claim_retakes_abandoned_job(self):
+        job = self.create_job(status='running', attempts=1, locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(claim_jobs(10), [job])
+
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+
+    def test_abandoned_job_without_attempts_left_fails(self):
+        job = self.create_job(
+            status='running', attempts=EMAIL_JOB_MAX_ATTEMPTS, locked_at=timezone.now() - timedelta(hours=1),
+        )
+
+        self.assertEqual(claim_jobs(10), [])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_run_marks_job_sent(self):
+        self.create_job()
+
+        self.assertTrue(run_job(claim_jobs(1)[0]))
+
+        self.assertEqual(self.sent, [{'email': 'a@b.cl'}])
+        self.assertEqual(EmailJob.objects.get().status, 'sent')
+
+    def test_failure_is_retried_with_backoff(self):
+        self.create_job()
+        HANDLERS['registration'] = self.fail
+
+        before = timezone.now()
+        self.assertFalse(run_job(claim_jobs(1)[0]))
+
+        job = EmailJob.objects.get()
+        self.assertEqual(job.status, 'pending')
+        self.assertIn('SMTP caído', job.last_error)
+        self.assertGreaterEqual(job.next_attempt_at, before + retry_delay(1))
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_last_attempt_failure_is_final(self):
+        self.create_job(attempts=EMAIL_JOB_MAX_ATTEMPTS - 1)
+        HANDLERS['registration'] = self.fail
+
+        self.assertFalse(run_job(claim_jobs(1)[0]))
+
+        self.assertEqual(EmailJob.objects.get().status, 'failed')
+
+    def test_run_ignores_job_reclaimed_by_another_worker(self):
+        self.create_job()
+        job = claim_jobs(1)[0]
+        EmailJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() + timedelta(seconds=1))
+
+        run_job(job)
+
+        self.assertEqual(EmailJob.objects.get().status, 'running')
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+        self.assertEqual(retry_delay(3), 4 * retry_delay(1))
+        self.assertEqual(retry_delay(100), timedelta(seconds=EMAIL_JOB_RETRY_MAX_SECONDS))
@@ -0,0 +1,56 @@
+class TrackedFieldsMixin:
+    """
+    Guarda los valores con que se cargaron (o guardaron) los campos de
+    `tracked_fields` para detectar cambios en memoria al guardar, sin volver a
+    consultar la fila.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked()
+        return instance
+
+    def _snapshot_tracked(self, fields=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for name in fields if fields is not None else self.tracked_fields:
+            # Los campos diferidos (.only/.defer) no están en __dict__ y no se registran
+            if name in self.tracked_fields and name in self.__dict__:
+                loaded[name] = self.__dict__[name]
+
+    def loaded_value(self, field):
+        """Valor del campo en la BD; solo consulta si la instancia no lo tiene registrado"""
+        loaded = self.__dict__.get('_loaded_values', {})
+        if field in loaded:
+            return loaded[field]
+        if self.pk is None:
+            return None
+        return type(self)._default_manager.filter(pk=self.pk).values_list(field, flat=True).first()
+
+    def has_changed(self, field):
+        return self.pk is not None and self.loaded_value(field) != getattr(self, field)
+
+    def changed_fields(self, fields=None):
+        """
+        Campos registrados que cambiaron respecto de lo cargado, sin consultar la
+        BD (sirve en post_save, cuando la fila ya tiene el valor nuevo). Los que
+        no se alcanzaron a registrar cuentan como cambiados.
+        """
+        loaded = self.__dict__.get('_loaded_values', {})
+        return [
+            name for name in (self.tracked_fields if fields is None else fields)
+            if name not in loaded or loaded[name] != self.__dict__.get(name)
+        ]
+
+    def _attnames(self, fields):
+        # update_fields/fields usan nombres de campo ('category'); el registro usa attname ('category_id')
+        return None if fields is None else [self._meta.get_field(name).attname for name in fields]
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked(self._attnames(fields))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked(self._attnames(kwargs.get('update_fields')))
@@ -19,6 +19,7 @@ urlpatterns = [
     path('get-dynamic-filters/', views.get_dynamic_filters, name='get_dynamic_filters'),
     path('category_summary/', views.category_summary, name='category_summary'),
     path('search/', views.search, name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('robots.txt', views.robots_txt, name='robots_txt'),
     path('google1cb7d6c3308ad2c9.html', views.google_verification, name='google_verification'),
     path('return-policy/', views.return_policy, name='return_policy'),
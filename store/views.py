@@ -1,34 +1,43 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Product, Category, Profile, Compatibility
+from .models import Product, Category, Profile
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from django.core.paginator import Paginator
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from .forms import SignUpForm, UpdateUserForm, ChangePasswordForm, UserInfoForm
 from payment.forms import ShippingForm
 from payment.models import ShippingAddress
 from django.contrib.auth import get_user_model
 from django import forms 
-from django.db.models import Q, Count, Case, When, Value, IntegerField
-import json
 from cart.cart import Cart
+from cart.persistence import load_saved_cart
 from django.views.decorators.cache import never_cache
 from store.emails import send_registration_email_async
+from store.facets import get_facet_index, get_compat_tree, HIDDEN_CATEGORIES
+from store.search import get_search_backend
+from store.autocomplete import suggest
+from store.home import get_home_rails, get_home_categories, get_categories
+from store.listing import listing_page
+from store.sitemaps import get_sitemap
+from store.detail import get_product_detail
+from urllib.parse import urlencode
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 
 
 # Create your views here.
 def home(request):
-    # products = Product.objects.all()
-    batteries = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0), category__name__iexact='BATTERIES').order_by('?')[:4]
-    rear_axle = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0), category__name__iexact='REAR AXLE').order_by('?')[:4]
-    engine = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0), category__name__iexact='ENGINE').order_by('?')[:4]
+    # Rieles aleatorios desde los pools precalculados (una sola consulta id__in)
+    rails = get_home_rails()
+    batteries = rails['batteries']
+    rear_axle = rails['rear_axle']
+    engine = rails['engine']
 
-    # Obtener todas las categorías
-    categories = Category.objects.annotate(product_count=Count('product')).filter(product_count__gt=0).order_by('name')
+    # Obtener todas las categorías (en caché por versión del catálogo)
+    categories = get_home_categories()
 
     # Ruta relativa dentro de MEDIA
     header_image = 'media/marketing/IMG-home.png'  
@@ -74,21 +83,17 @@ def login_user(request):
                 saved_cart = profile.old_cart
                 
                 if saved_cart:
-                    # Intentar convertir el JSON
-                    try:
-                        converted_cart = json.loads(saved_cart)
-                    except (json.JSONDecodeError, ValueError, TypeError) as e:
-                        print(f"Error decodificando carrito: {e}")
+                    converted_cart = load_saved_cart(saved_cart)
+                    if converted_cart is None:
                         print(f"Carrito corrupto: {saved_cart}")
                         converted_cart = {}
                         # Limpiar el carrito corrupto
                         profile.old_cart = ''
                         profile.save()
                     
-                    # Restaurar carrito en sesión
-                    cart = Cart(request)
-                    for key, value in converted_cart.items():
-                        cart.db_add(product=key, quantity=value)
+                    # Restaurar carrito en sesión (una sola consulta de productos)
+                    if converted_cart:
+                        Cart(request).restore(converted_cart)
                 else:
                     converted_cart = {}
                     
@@ -436,15 +441,12 @@ def edit_shipping_address(request, address_id):
     
 
 def product(request, pk):
-    product = Product.objects.get(id=pk)
-
-    # Agrupar compatibilidades
-    compat_data = {}
-    for comp in product.compatibilities.all():
-        brand = comp.brand.strip()
-        model = comp.model.strip()
-        serie = comp.serie.strip()
-        compat_data.setdefault(brand, {}).setdefault(model, []).append(serie)
+    # Ficha y compatibilidades agrupadas desde el caché del proceso
+    detail = get_product_detail(pk)
+    if detail is None:
+        raise Http404
+    product = detail['product']
+    compat_data = detail['compat_data']
 
     # Capturar filtros seleccionados desde GET
     selected_brand = request.GET.get('brand', '')
@@ -474,15 +476,29 @@ def product(request, pk):
 def category(request, foo):
     foo = foo.replace('-', ' ')
 
-    try:
-        category = Category.objects.get(name=foo)
-        products = Product.objects.filter(category=category)
-        return render(request, 'category.html', {'products': products, 'category': category})
-
-    except:
+    # Categorías y conteos en caché por versión del catálogo
+    category = next((category for category in get_categories() if category.name == foo), None)
+    if category is None:
         messages.success(request, ("That  Category doesn't exist."))
         return redirect('home')
 
+    selected_stock_type = request.GET.get('stock_type')
+    page_obj = listing_page(
+        get_facet_index(),
+        cursor=request.GET.get('cursor'),
+        page_number=request.GET.get('page'),
+        category=category.name,
+        stock_type=selected_stock_type,
+    )
+    filter_query = urlencode([('stock_type', selected_stock_type)] if selected_stock_type else [])
+
+    return render(request, 'category.html', {
+        'page_obj': page_obj,
+        'category': category,
+        'selected_stock_type': selected_stock_type,
+        'filter_query': filter_query,
+    })
+
 @never_cache
 def all_products(request):
     # Filtros desde GET
@@ -494,138 +510,51 @@ def all_products(request):
     selected_stock_type = request.GET.get('stock_type')
     search_query = request.GET.get('search', '')
 
-    # Base de productos con stock
-    products = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0)).exclude(Q(name__isnull=True) | Q(name__exact=''))
-
-    # Aplicar búsqueda
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(sku__icontains=search_query)
-        )
-
-    # NUEVO: Filtro de tipo de stock
-    if selected_stock_type == 'nacional':
-        products = products.filter(stock__gt=0)
-    elif selected_stock_type == 'internacional':
-        products = products.filter(stock_international__gt=0, stock=0)
-
-    # Aplicar filtros
-    if selected_category:
-        products = products.filter(category__name=selected_category)
-
-    if selected_subcategory:
-        products = products.filter(subcategory=selected_subcategory)
-
-    if selected_brand:
-        products = products.filter(compatibilities__brand=selected_brand)
-
-    if selected_model:
-        products = products.filter(compatibilities__model=selected_model)
-
-    if selected_serie:
-        products = products.filter(compatibilities__serie=selected_serie)
-
-    products = products.distinct().annotate(
-    has_default_image=Case(
-        When(image='https://parts.terraintamer.com/images/DEFAULTPARTIMG.JPG', then=Value(1)),
-        When(image__isnull=True, then=Value(1)),
-        When(image='', then=Value(1)),
-        default=Value(0),
-        output_field=IntegerField(),
+    # Índice de facetas (se reconstruye solo cuando cambia el catálogo)
+    index = get_facet_index()
+
+    # Paginación por cursor (sin OFFSET ni COUNT completo); total exacto desde el índice
+    page_obj = listing_page(
+        index,
+        cursor=request.GET.get('cursor'),
+        page_number=request.GET.get('page'),
+        category=selected_category,
+        subcategory=selected_subcategory,
+        brand=selected_brand,
+        model=selected_model,
+        serie=selected_serie,
+        stock_type=selected_stock_type,
+        search=search_query,
     )
-).order_by('has_default_image', 'name')
 
-    # Paginación
-    paginator = Paginator(products, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Filtros activos para los links de paginación
+    filter_query = urlencode([(key, value) for key, value in (
+        ('category', selected_category),
+        ('subcategory', selected_subcategory),
+        ('brand', selected_brand),
+        ('model', selected_model),
+        ('serie', selected_serie),
+        ('stock_type', selected_stock_type),
+        ('search', search_query),
+    ) if value])
 
     # ===== FILTROS DINÁMICOS BIDIRECCIONALES =====
-    
+
     # 1. CATEGORÍAS DINÁMICAS (filtradas por compatibilidad)
     if selected_brand or selected_model or selected_serie:
-        # Obtener productos que coinciden con la compatibilidad seleccionada
-        filtered_products = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0))
-        
-        if selected_brand:
-            filtered_products = filtered_products.filter(compatibilities__brand=selected_brand)
-        if selected_model:
-            filtered_products = filtered_products.filter(compatibilities__model=selected_model)
-        if selected_serie:
-            filtered_products = filtered_products.filter(compatibilities__serie=selected_serie)
-        
-        # Obtener solo las categorías de esos productos
-        category_ids = filtered_products.values_list('category_id', flat=True).distinct()
-        categories = Category.objects.filter(id__in=category_ids).order_by('name')
+        categories = index.categories_for(
+            index.match(brand=selected_brand, model=selected_model, serie=selected_serie)
+        )
     else:
-        categories = Category.objects.exclude(name__in=['BRAKE GR SPORT & ROGUE', 'WHEEL']).order_by('name')
+        categories = index.all_categories(exclude=HIDDEN_CATEGORIES)
 
     # 2. SUBCATEGORÍAS DINÁMICAS
-    subcategories_query = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0))
-    
-    if selected_category:
-        subcategories_query = subcategories_query.filter(category__name=selected_category)
-    
-    if selected_brand:
-        subcategories_query = subcategories_query.filter(compatibilities__brand=selected_brand)
-    if selected_model:
-        subcategories_query = subcategories_query.filter(compatibilities__model=selected_model)
-    if selected_serie:
-        subcategories_query = subcategories_query.filter(compatibilities__serie=selected_serie)
-    
-    subcategories = (
-        subcategories_query
-        .exclude(subcategory__isnull=True)
-        .exclude(subcategory='')
-        .values_list('subcategory', flat=True)
-        .distinct()
-        .order_by('subcategory')
+    subcategories = index.subcategories_for(
+        index.match(category=selected_category, brand=selected_brand, model=selected_model, serie=selected_serie)
     )
 
     # 3. COMPATIBILIDADES DINÁMICAS (filtradas por categoría)
-    if selected_category or selected_subcategory:
-        # Obtener productos que coinciden con la categoría seleccionada
-        filtered_products = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0))
-        
-        if selected_category:
-            filtered_products = filtered_products.filter(category__name=selected_category)
-        if selected_subcategory:
-            filtered_products = filtered_products.filter(subcategory=selected_subcategory)
-        
-        # Obtener solo las compatibilidades de esos productos
-        compat_ids = filtered_products.values_list('compatibilities__id', flat=True).distinct()
-        unique_compatibilities = (
-            Compatibility.objects
-            .filter(id__in=compat_ids)
-            .values('brand', 'model', 'serie')
-            .distinct()
-            .order_by('brand', 'model', 'serie')
-        )
-    else:
-        unique_compatibilities = (
-            Compatibility.objects
-            .values('brand', 'model', 'serie')
-            .distinct()
-            .order_by('brand', 'model', 'serie')
-        )
-
-    # Construir compat_data
-    compat_data = {}
-    for comp in unique_compatibilities:
-        brand = comp['brand'].strip()
-        model = comp['model'].strip()
-        serie = comp['serie'].strip()
-        
-        if brand not in compat_data:
-            compat_data[brand] = {}
-        
-        if model not in compat_data[brand]:
-            compat_data[brand][model] = []
-        
-        if serie not in compat_data[brand][model]:
-            compat_data[brand][model].append(serie)
+    compat_data = get_compat_tree(category=selected_category, subcategory=selected_subcategory)
 
     return render(request, 'all_products.html', {
         'page_obj': page_obj,
@@ -639,6 +568,7 @@ def all_products(request):
         'selected_serie': selected_serie,
         'selected_stock_type': selected_stock_type,
         'search_query': search_query,
+        'filter_query': filter_query,
     })
 
 
@@ -652,98 +582,39 @@ def get_dynamic_filters(request):
     selected_serie = request.GET.get('serie')
     selected_stock_type = request.GET.get('stock_type')  # Ya lo tienes
 
-    # Base de productos con stock
-    base_products = Product.objects.filter(Q(stock__gt=0) | Q(stock_international__gt=0))
-
-    # APLICAR FILTRO DE STOCK PRIMERO
-    if selected_stock_type == 'nacional':
-        base_products = base_products.filter(stock__gt=0)
-    elif selected_stock_type == 'internacional':
-        base_products = base_products.filter(stock_international__gt=0, stock=0)
+    # Todas las facetas se resuelven en memoria, aplicando siempre el filtro de stock
+    index = get_facet_index()
 
     # 1. CATEGORÍAS DINÁMICAS (filtradas por compatibilidad Y stock)
     if selected_brand or selected_model or selected_serie:
-        filtered_products = base_products  # Usa base_products que ya tiene filtro de stock
-        
-        if selected_brand:
-            filtered_products = filtered_products.filter(compatibilities__brand=selected_brand)
-        if selected_model:
-            filtered_products = filtered_products.filter(compatibilities__model=selected_model)
-        if selected_serie:
-            filtered_products = filtered_products.filter(compatibilities__serie=selected_serie)
-        
-        category_ids = filtered_products.values_list('category_id', flat=True).distinct()
-        categories = list(Category.objects.filter(id__in=category_ids).values('id', 'name').order_by('name'))
+        categories = index.categories_for(index.match(
+            brand=selected_brand,
+            model=selected_model,
+            serie=selected_serie,
+            stock_type=selected_stock_type,
+        ))
     else:
         # Categorías basadas en stock
-        category_ids = base_products.values_list('category_id', flat=True).distinct()
-        categories = list(Category.objects.filter(id__in=category_ids).exclude(name__in=['BRAKE GR SPORT & ROGUE', 'WHEEL']).values('id', 'name').order_by('name'))
+        categories = index.categories_for(
+            index.match(stock_type=selected_stock_type),
+            exclude=HIDDEN_CATEGORIES,
+        )
 
     # 2. SUBCATEGORÍAS DINÁMICAS (con filtro de stock)
-    subcategories_query = base_products  # Usa base_products
-    
-    if selected_category:
-        subcategories_query = subcategories_query.filter(category__name=selected_category)
-    
-    if selected_brand:
-        subcategories_query = subcategories_query.filter(compatibilities__brand=selected_brand)
-    if selected_model:
-        subcategories_query = subcategories_query.filter(compatibilities__model=selected_model)
-    if selected_serie:
-        subcategories_query = subcategories_query.filter(compatibilities__serie=selected_serie)
-    
-    subcategories = list(
-        subcategories_query
-        .exclude(subcategory__isnull=True)
-        .exclude(subcategory='')
-        .values_list('subcategory', flat=True)
-        .distinct()
-        .order_by('subcategory')
-    )
+    subcategories = index.subcategories_for(index.match(
+        category=selected_category,
+        brand=selected_brand,
+        model=selected_model,
+        serie=selected_serie,
+        stock_type=selected_stock_type,
+    ))
 
     # 3. COMPATIBILIDADES DINÁMICAS (filtradas por categoría Y stock)
-    if selected_category or selected_subcategory:
-        filtered_products = base_products  # Usa base_products
-        
-        if selected_category:
-            filtered_products = filtered_products.filter(category__name=selected_category)
-        if selected_subcategory:
-            filtered_products = filtered_products.filter(subcategory=selected_subcategory)
-        
-        compat_ids = filtered_products.values_list('compatibilities__id', flat=True).distinct()
-        unique_compatibilities = (
-            Compatibility.objects
-            .filter(id__in=compat_ids)
-            .values('brand', 'model', 'serie')
-            .distinct()
-            .order_by('brand', 'model', 'serie')
-        )
-    else:
-        # Compatibilidades basadas en stock
-        compat_ids = base_products.values_list('compatibilities__id', flat=True).distinct()
-        unique_compatibilities = (
-            Compatibility.objects
-            .filter(id__in=compat_ids)
-            .values('brand', 'model', 'serie')
-            .distinct()
-            .order_by('brand', 'model', 'serie')
-        )
-
-    # Construir compat_data
-    compat_data = {}
-    for comp in unique_compatibilities:
-        brand = comp['brand'].strip()
-        model = comp['model'].strip()
-        serie = comp['serie'].strip()
-        
-        if brand not in compat_data:
-            compat_data[brand] = {}
-        
-        if model not in compat_data[brand]:
-            compat_data[brand][model] = []
-        
-        if serie not in compat_data[brand][model]:
-            compat_data[brand][model].append(serie)
+    compat_data = get_compat_tree(
+        category=selected_category,
+        subcategory=selected_subcategory,
+        stock_type=selected_stock_type,
+    )
 
     return JsonResponse({
         'categories': categories,
@@ -752,8 +623,19 @@ def get_dynamic_filters(request):
     })
 
 
+def autocomplete(request):
+    """Vista AJAX de sugerencias por número de parte, SKU o nombre (índice en memoria)"""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+
+    return JsonResponse({'results': suggest(query, limit)})
+
+
 def category_summary(request):
-    categories = Category.objects.all()
+    categories = get_categories()
     return render(request, 'category_summary.html', {"categories": categories})
 
 
@@ -762,8 +644,8 @@ def search(request):
     if request.method == 'POST':
         searched = request.POST['searched']
 
-        # Query DB
-        searched = Product.objects.filter(Q(name__icontains=searched) | Q(description__icontains=searched) | Q(category__name__icontains=searched))
+        # Búsqueda con ranking (número de parte primero, luego relevancia)
+        searched = get_search_backend().search(Product.objects.all(), searched)
 
         if not searched:
             messages.success(request, "No match found for search.")
@@ -788,6 +670,20 @@ def robots_txt(request):
     return HttpResponse("\n".join(lines), content_type='text/plain')
 
 
+def sitemap_xml(request, section='index'):
+    # Última generación publicada por los comandos; los crawlers nunca recorren la tabla
+    document = get_sitemap(section)
+    if document is None:
+        raise Http404
+
+    last_modified = int(document['last_modified'].timestamp()) if document['last_modified'] else None
+    response = HttpResponse(document['content'], content_type='application/xml')
+    response['ETag'] = f'"{document["etag"]}"'
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return get_conditional_response(request, etag=response['ETag'], last_modified=last_modified, response=response)
+
+
 def google_verification(request):
     return HttpResponse("google-site-verification: google1cb7d6c3308ad2c9.html", content_type='text/html')
 
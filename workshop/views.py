@@ -6,9 +6,10 @@ from workshop.models import Workshop
 def workshop(request):
      # Get the cart
     cart = Cart(request)
-    cart_products = cart.get_products()
-    quantities = cart.get_quants()
-    total = cart.cart_total()
+    snapshot = cart.snapshot()
+    cart_products = snapshot.products
+    quantities = snapshot.quantities
+    total = snapshot.total
 
     # Get all the Workshops availbale
     workshops = Workshop.objects.all()